@@ -6,4 +6,6 @@
 
 
 from src import run
-run()
\ No newline at end of file
+
+if __name__ == "__main__":
+    run()
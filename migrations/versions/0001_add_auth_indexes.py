@@ -0,0 +1,44 @@
+"""add indexes for foreign keys and audit log time queries
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_email_verifications_user_id', 'email_verifications', ['user_id']),
+    ('ix_password_reset_user_id', 'password_reset', ['user_id']),
+    ('ix_audit_logs_user_id_created_at', 'audit_logs', ['user_id', 'created_at']),
+    ('ix_audit_logs_created_at', 'audit_logs', ['created_at']),
+)
+
+
+def _existing_indexes(table: str) -> set:
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Databases bootstrapped with create_all() already have these
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
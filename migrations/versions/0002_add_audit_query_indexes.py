@@ -0,0 +1,43 @@
+"""add composite indexes for the audit log query API
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ('ix_audit_logs_action_created_at', 'audit_logs', ['action', 'created_at']),
+    ('ix_audit_logs_status_created_at', 'audit_logs', ['status', 'created_at']),
+    ('ix_audit_logs_ip_address_created_at', 'audit_logs', ['ip_address', 'created_at']),
+)
+
+
+def _existing_indexes(table: str) -> set:
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Databases bootstrapped with create_all() already have these
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
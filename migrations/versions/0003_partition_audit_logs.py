@@ -0,0 +1,100 @@
+"""partition audit_logs by month
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.partitions import (
+    add_months, insert_rows, month_of, partition_clause, partition_tables
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+COPY_BATCH = 10000
+
+
+def _audit_foreign_keys() -> list:
+    return [fk['name'] for fk in sa.inspect(op.get_bind()).get_foreign_keys('audit_logs') if fk['name']]
+
+
+def _is_partitioned(bind) -> bool:
+    return bool(bind.execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+        "AND TABLE_NAME = 'audit_logs' AND PARTITION_NAME IS NOT NULL"
+    )).scalar())
+
+
+def _copy(bind, source: sa.Table, target=None):
+    """Move rows from source in id batches, into month tables (target None) or into target"""
+    last_id = None
+    while True:
+        query = sa.select(source).order_by(source.c.id).limit(COPY_BATCH)
+        if last_id is not None:
+            query = query.where(source.c.id > last_id)
+        rows = [dict(row._mapping) for row in bind.execute(query)]
+        if not rows:
+            return
+        if target is None:
+            insert_rows(bind, rows)
+        else:
+            bind.execute(sa.insert(target), rows)
+        last_id = rows[-1]['id']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        if _is_partitioned(bind):
+            return
+        # Partitioned tables take no foreign keys, and the partition column must be in the primary key
+        for name in _audit_foreign_keys():
+            op.drop_constraint(name, 'audit_logs', type_='foreignkey')
+        op.execute("ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)")
+        oldest = bind.execute(sa.text("SELECT MIN(created_at) FROM audit_logs")).scalar()
+        month = month_of(oldest if oldest is not None else time.time())
+        last = add_months(month_of(time.time()), MONTHS_AHEAD)
+        clauses = []
+        while month <= last:
+            clauses.append(partition_clause(month))
+            month = add_months(month, 1)
+        op.execute(
+            f"ALTER TABLE audit_logs PARTITION BY RANGE (created_at) "
+            f"({', '.join(clauses)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        )
+    elif bind.dialect.name == 'sqlite':
+        # Rows move to audit_logs_YYYYMM tables; audit_logs stays behind as the empty template
+        audit_logs = sa.Table('audit_logs', sa.MetaData(), autoload_with=bind)
+        _copy(bind, audit_logs)
+        bind.execute(sa.delete(audit_logs))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        if not _is_partitioned(bind):
+            return
+        op.execute("ALTER TABLE audit_logs REMOVE PARTITIONING")
+        op.execute("ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id)")
+        # Rows of deleted users have no user to point at any more
+        op.execute("UPDATE audit_logs SET user_id = NULL WHERE user_id NOT IN (SELECT id FROM users)")
+        op.create_foreign_key(None, 'audit_logs', 'users', ['user_id'], ['id'])
+    elif bind.dialect.name == 'sqlite':
+        audit_logs = sa.Table('audit_logs', sa.MetaData(), autoload_with=bind)
+        for table in partition_tables(bind, newest_first=False):
+            _copy(bind, table, audit_logs)
+            op.drop_table(table.name)
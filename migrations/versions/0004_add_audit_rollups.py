@@ -0,0 +1,56 @@
+"""add hourly audit rollup tables
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_tables() -> set:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Databases bootstrapped with create_all() already have these.
+    # Existing history is backfilled with scripts/rebuild_audit_rollups.py
+    existing = _existing_tables()
+    if 'audit_rollups' not in existing:
+        op.create_table(
+            'audit_rollups',
+            sa.Column('bucket', sa.Integer(), nullable=False),
+            sa.Column('action', sa.String(length=100), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('events', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('bucket', 'action', 'status')
+        )
+    if 'audit_ip_rollups' not in existing:
+        op.create_table(
+            'audit_ip_rollups',
+            sa.Column('bucket', sa.Integer(), nullable=False),
+            sa.Column('action', sa.String(length=100), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('ip_address', sa.String(length=45), nullable=False),
+            sa.Column('events', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('bucket', 'action', 'status', 'ip_address')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = _existing_tables()
+    for table in ('audit_ip_rollups', 'audit_rollups'):
+        if table in existing:
+            op.drop_table(table)
@@ -0,0 +1,105 @@
+"""
+Benchmark: keyset vs OFFSET pagination of audit_logs
+
+Usage:
+    python -m scripts.bench_audit_pagination [rows] [db_path]
+
+Loads `rows` synthetic audit rows (default 10M) into a SQLite file (reused
+when it already holds that many), then times one 50-row page at increasing
+depths, unfiltered and filtered by action. Keyset pages use the cursor of
+the row before the page; OFFSET pages are the same rows fetched the old way.
+Rows go straight into the audit_logs table, i.e. one large partition.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from src.audit import audit_log_query, encode_cursor
+from src.models import AuditLog, Base
+
+PAGE = 50
+REPEAT = 5
+ACTIONS = ("login", "logout", "registration", "email_verification", "password_reset")
+DEPTHS = (0, 0.01, 0.5, 0.99)
+
+
+def load(engine, rows: int):
+    table = AuditLog.__table__
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        if session.scalar(select(func.count()).select_from(AuditLog)) == rows:
+            return
+    table.drop(engine)
+    table.create(engine)
+    # Indexes are cheaper to build once after the load
+    for index in table.indexes:
+        index.drop(engine)
+    rng = random.Random(42)
+    start_time = 1_600_000_000
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        chunk = []
+        for i in range(rows):
+            chunk.append({
+                "user_id": rng.randint(1, 100000),
+                "action": rng.choice(ACTIONS),
+                "ip_address": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+                "user_agent": "bench",
+                "status": "success" if rng.random() < 0.9 else "failed",
+                "details": None,
+                "created_at": start_time + i // 3,
+            })
+            if len(chunk) == 100000:
+                conn.execute(table.insert(), chunk)
+                chunk = []
+        if chunk:
+            conn.execute(table.insert(), chunk)
+    for index in table.indexes:
+        index.create(engine)
+    print(f"loaded {rows} rows in {time.perf_counter() - started:.0f} s")
+
+
+def timed(session: Session, query) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        session.execute(query).all()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench(session: Session, total: int, **filters):
+    label = ", ".join(f"{key}={value}" for key, value in filters.items()) or "no filter"
+    print(f"\n{label} ({total} matching rows)")
+    print(f"{'depth':>8} {'keyset ms':>10} {'offset ms':>10}")
+    for depth in DEPTHS:
+        offset = int((total - PAGE) * depth)
+        cursor = None
+        if offset:
+            # Cursor of the row just before the page (not timed)
+            before = session.execute(audit_log_query(limit=1, **filters).offset(offset - 1)).one()
+            cursor = encode_cursor(before.created_at, before.id)
+        keyset_ms = timed(session, audit_log_query(limit=PAGE, cursor=cursor, **filters))
+        offset_ms = timed(session, audit_log_query(limit=PAGE, **filters).offset(offset))
+        print(f"{depth:>8.0%} {keyset_ms:>10.2f} {offset_ms:>10.2f}")
+
+
+def main(argv: list):
+    rows = int(argv[1]) if len(argv) > 1 else 10_000_000
+    path = argv[2] if len(argv) > 2 else f"bench_audit_{rows}.db"
+    engine = create_engine(f"sqlite:///{os.path.abspath(path)}")
+    load(engine, rows)
+    with Session(engine) as session:
+        bench(session, rows)
+        matching = session.scalar(select(func.count()).select_from(AuditLog).where(AuditLog.action == "login"))
+        bench(session, matching, action="login")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,65 @@
+"""
+Benchmark: IP blocklist lookups against 100k ranges
+
+Usage:
+    python -m scripts.bench_ipfilter [ranges] [lookups]
+
+Builds an IPRangeSet from random IPv4/IPv6 CIDRs (about 10% IPv6) and times
+membership checks for random addresses. "parse+lookup" is what
+IPFilterMiddleware pays per request; "lookup" excludes the inet_pton parse.
+"""
+import ipaddress
+import random
+import sys
+import time
+
+from src.ipnet import IPRangeSet, pack_ip
+
+
+def random_networks(count: int, rng: random.Random) -> list:
+    networks = []
+    for _ in range(count):
+        if rng.random() < 0.9:
+            networks.append(ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(16, 32)), strict=False))
+        else:
+            networks.append(ipaddress.IPv6Network((rng.getrandbits(128), rng.randint(32, 64)), strict=False))
+    return networks
+
+
+def random_addresses(count: int, rng: random.Random) -> list:
+    return [
+        str(ipaddress.IPv4Address(rng.getrandbits(32))) if rng.random() < 0.9
+        else str(ipaddress.IPv6Address(rng.getrandbits(128)))
+        for _ in range(count)
+    ]
+
+
+def main(argv: list):
+    ranges = int(argv[1]) if len(argv) > 1 else 100000
+    lookups = int(argv[2]) if len(argv) > 2 else 200000
+    rng = random.Random(42)
+
+    networks = random_networks(ranges, rng)
+    start = time.perf_counter()
+    range_set = IPRangeSet(networks)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    addresses = random_addresses(lookups, rng)
+    packed = [pack_ip(address) for address in addresses]
+
+    start = time.perf_counter_ns()
+    hits = sum(1 for address in addresses if address in range_set)
+    parse_lookup_ns = (time.perf_counter_ns() - start) / lookups
+
+    contains_packed = range_set.contains_packed
+    start = time.perf_counter_ns()
+    for address in packed:
+        contains_packed(address)
+    lookup_ns = (time.perf_counter_ns() - start) / lookups
+
+    print(f"ranges: {ranges} ({len(range_set)} after merging), build: {build_ms:.0f} ms")
+    print(f"parse+lookup: {parse_lookup_ns:.0f} ns, lookup: {lookup_ns:.0f} ns, hit rate: {hits / lookups:.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
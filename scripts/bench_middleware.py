@@ -0,0 +1,110 @@
+"""
+Benchmark: BaseHTTPMiddleware stack vs. the pure ASGI middleware stack
+
+Usage:
+    python -m scripts.bench_middleware [requests]
+
+Both stacks wrap the same trivial endpoint in security headers + rate limiting
+and are driven in-process through httpx's ASGI transport, so the difference
+is middleware overhead only.
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from src.middleware import SecurityHeadersMiddleware, RateLimitMiddleware
+from src.ratelimit import RateLimiter
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The previous SecurityHeadersMiddleware, kept for comparison"""
+
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        csp = (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+            "img-src 'self' data: https:; "
+            "font-src 'self' https://cdn.jsdelivr.net; "
+            "connect-src 'self'; "
+            "frame-ancestors 'none';"
+        )
+        response.headers["Content-Security-Policy"] = csp
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """The previous RateLimitMiddleware dispatch, kept for comparison"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.limiter = RateLimiter(10 ** 9, 10 ** 9, sweep_interval=0)
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path.startswith("/static"):
+            return await call_next(request)
+        forwarded = request.headers.get("X-Forwarded-For")
+        ip = forwarded.split(",")[0].strip() if forwarded else request.client.host
+        is_limited, message = self.limiter.hit(ip)
+        if is_limited:
+            return JSONResponse(status_code=429, content={"detail": message})
+        return await call_next(request)
+
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if legacy:
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+        app.add_middleware(LegacyRateLimitMiddleware)
+    else:
+        app.add_middleware(SecurityHeadersMiddleware)
+        app.add_middleware(RateLimitMiddleware, requests_per_minute=10 ** 9,
+                           requests_per_hour=10 ** 9, sweep_interval=0)
+    return app
+
+
+async def measure(app: FastAPI, requests: int) -> list:
+    timings = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(200):
+            await client.get("/ping")
+        for _ in range(requests):
+            start = time.perf_counter_ns()
+            await client.get("/ping")
+            timings.append((time.perf_counter_ns() - start) / 1000)
+    return timings
+
+
+def main(argv: list):
+    requests = int(argv[1]) if len(argv) > 1 else 5000
+    results = {}
+    for name, legacy in (("BaseHTTPMiddleware", True), ("pure ASGI", False)):
+        timings = asyncio.run(measure(build_app(legacy), requests))
+        results[name] = statistics.mean(timings)
+        p99 = statistics.quantiles(timings, n=100)[98]
+        print(f"{name:>20}: mean {results[name]:8.1f} us   p99 {p99:8.1f} us")
+    saved = results["BaseHTTPMiddleware"] - results["pure ASGI"]
+    print(f"{'saved per request':>20}: {saved:8.1f} us")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
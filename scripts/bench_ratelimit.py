@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: per-request cost of the rate limiter vs. the old list-based one
+
+Usage:
+    python -m scripts.bench_ratelimit [iterations]
+
+The old implementation kept a list of datetimes per IP and rebuilt it on every
+request, so its cost grows with the number of requests the IP has made. The
+ring-buffer limiter should cost the same at every fill level.
+"""
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from src.ratelimit import RateLimiter
+
+
+class ListRateLimiter:
+    """The previous RateLimitMiddleware.is_rate_limited, kept for comparison"""
+
+    def __init__(self, requests_per_minute: int, requests_per_hour: int):
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_hour = requests_per_hour
+        self.minute_requests = defaultdict(list)
+        self.hour_requests = defaultdict(list)
+        self.blocked_ips = {}
+
+    def hit(self, ip: str):
+        now = datetime.now()
+        if ip in self.blocked_ips:
+            if now < self.blocked_ips[ip]:
+                return True, "blocked"
+            del self.blocked_ips[ip]
+        minute_ago = now - timedelta(minutes=1)
+        self.minute_requests[ip] = [t for t in self.minute_requests[ip] if t > minute_ago]
+        hour_ago = now - timedelta(hours=1)
+        self.hour_requests[ip] = [t for t in self.hour_requests[ip] if t > hour_ago]
+        if len(self.minute_requests[ip]) >= self.requests_per_minute:
+            self.blocked_ips[ip] = now + timedelta(minutes=5)
+            return True, "minute"
+        if len(self.hour_requests[ip]) >= self.requests_per_hour:
+            return True, "hour"
+        self.minute_requests[ip].append(now)
+        self.hour_requests[ip].append(now)
+        return False, ""
+
+
+def per_request_ns(limiter, fill: int, iterations: int) -> float:
+    """Fill one IP to `fill` requests, then time further requests at the hourly limit"""
+    for _ in range(fill):
+        limiter.hit("10.0.0.1")
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        limiter.hit("10.0.0.1")
+    return (time.perf_counter_ns() - start) / iterations
+
+
+def main(argv: list):
+    iterations = int(argv[1]) if len(argv) > 1 else 20000
+    print(f"{'requests/IP':>12} {'list (ns)':>12} {'ring (ns)':>12} {'speedup':>8}")
+    for fill in (10, 100, 300, 1000, 5000):
+        old = per_request_ns(ListRateLimiter(10 ** 9, fill), fill, iterations)
+        new = per_request_ns(RateLimiter(10 ** 9, fill), fill, iterations)
+        print(f"{fill:>12} {old:>12.0f} {new:>12.0f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,30 @@
+"""
+Calibrate Argon2 cost for this machine
+
+Usage:
+    python -m scripts.calibrate_argon2 [target_ms] [max_memory_kib]
+
+Prints the settings to pin in .env so startup can skip calibration.
+"""
+import sys
+
+from src.encryption import calibrate_argon2, measure_argon2
+from src.settings import ARGON2_TARGET_MS, ARGON2_MAX_MEMORY_COST, ARGON2_PARALLELISM
+
+
+def main(argv: list):
+    target_ms = int(argv[1]) if len(argv) > 1 else (ARGON2_TARGET_MS or 250)
+    max_memory_cost = int(argv[2]) if len(argv) > 2 else ARGON2_MAX_MEMORY_COST
+
+    print(f"⏱️ Calibrating Argon2 for a {target_ms}ms budget (memory ceiling {max_memory_cost} KiB)...")
+    params = calibrate_argon2(target_ms, max_memory_cost, ARGON2_PARALLELISM)
+    latency = measure_argon2(params["time_cost"], params["memory_cost"], params["parallelism"], samples=5)
+
+    print(f"✅ Median hash latency: {latency:.1f}ms")
+    print(f"ARGON2_TIME_COST={params['time_cost']}")
+    print(f"ARGON2_MEMORY_COST={params['memory_cost']}")
+    print(f"ARGON2_PARALLELISM={params['parallelism']}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
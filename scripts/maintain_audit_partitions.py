@@ -0,0 +1,29 @@
+"""
+Create upcoming audit_logs partitions and drop the ones past retention
+
+Usage:
+    python -m scripts.maintain_audit_partitions [retention_months] [months_ahead]
+
+Same job the app runs every AUDIT_PARTITION_MAINTENANCE_SECONDS; use it from
+cron when that is disabled. Retention drops whole months, never single rows.
+"""
+import sys
+
+from src.config import Database
+from src.partitions import maintain_partitions
+from src.settings import AUDIT_RETENTION_MONTHS, AUDIT_PARTITION_MONTHS_AHEAD
+
+
+def main(argv: list):
+    retention_months = int(argv[1]) if len(argv) > 1 else AUDIT_RETENTION_MONTHS
+    months_ahead = int(argv[2]) if len(argv) > 2 else AUDIT_PARTITION_MONTHS_AHEAD
+
+    with Database.get_engine().begin() as conn:
+        result = maintain_partitions(conn, retention_months, months_ahead)
+
+    print(f"✅ Created: {', '.join(result['created']) or 'none'}")
+    print(f"🗑️ Dropped: {', '.join(result['dropped']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,33 @@
+"""
+Recompute the hourly audit rollups from audit_logs
+
+Usage:
+    python -m scripts.rebuild_audit_rollups [since] [until] [top_ips]
+
+since/until are Unix times (default: the last 24 hours); both are widened to
+whole hours. Use it to backfill history after migration 0004, or to repair
+closed hours; the hour still being written is also counted live by the app,
+so rebuild it only while the app is stopped.
+"""
+import sys
+import time
+
+from src.config import Database
+from src.rollups import HOUR, rebuild_rollups
+from src.settings import AUDIT_ROLLUP_TOP_IPS
+
+
+def main(argv: list):
+    until = int(argv[2]) if len(argv) > 2 else int(time.time())
+    since = int(argv[1]) if len(argv) > 1 else until - 24 * HOUR
+    top_ips = int(argv[3]) if len(argv) > 3 else AUDIT_ROLLUP_TOP_IPS
+
+    started = time.perf_counter()
+    with Database.get_engine().begin() as conn:
+        events = rebuild_rollups(conn, since, until, top_ips)
+
+    print(f"✅ Rebuilt rollups - Events: {events}, Time: {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
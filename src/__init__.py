@@ -1,19 +1,66 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from src.api import APIV1, templates
-from src.middleware import SecurityHeadersMiddleware, RateLimitMiddleware, CSRFMiddleware
+from src.middleware import (
+    SecurityHeadersMiddleware, ClientIPMiddleware, IPFilterMiddleware, RateLimitMiddleware, CSRFMiddleware
+)
+from src.ipnet import parse_networks
 from src.exceptions import (
-    AuthenticationError, ValidationError, RateLimitError,
+    AuthenticationError, ValidationError, RateLimitError, ServiceUnavailableError,
     authentication_error_handler, validation_error_handler,
-    rate_limit_error_handler, general_exception_handler
+    rate_limit_error_handler, service_unavailable_error_handler, general_exception_handler
+)
+from src.audit import audit_sink
+from src.config import Database
+from src.encryption import hashing_executor, resolve_argon2_params
+from src.logger import setup_logging, stop_logging
+from src.partitions import maintenance_loop
+from src.settings import (
+    RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR, RATE_LIMIT_MAX_MEMORY_MB,
+    RATE_LIMIT_SWEEP_INTERVAL_SECONDS, RATE_LIMIT_BACKEND, RATE_LIMIT_SHM_PATH,
+    RATE_LIMIT_REDIS_URL, CSRF_ENABLED, CSRF_SECRET, CSRF_TOKEN_MAX_AGE_SECONDS,
+    COOKIE_SECURE, TRUSTED_PROXIES, IP_BLOCKLIST_PATH, IP_ALLOWLIST_PATH, IP_LIST_RELOAD_SECONDS,
+    DB_REPLICA_HEALTH_CHECK_SECONDS, AUDIT_RETENTION_MONTHS, AUDIT_PARTITION_MONTHS_AHEAD,
+    AUDIT_PARTITION_MAINTENANCE_SECONDS, DEBUG
 )
-from src.logger import setup_logging
-from src.settings import RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR, DEBUG
 import logging
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background resources"""
+    hashing_executor.configure(resolve_argon2_params())
+    hashing_executor.start()
+    await audit_sink.start()
+    replicas = Database.get_replicas()
+    replica_monitor = asyncio.create_task(replicas.monitor(DB_REPLICA_HEALTH_CHECK_SECONDS)) if len(replicas) else None
+    partition_maintenance = None
+    if AUDIT_PARTITION_MAINTENANCE_SECONDS:
+        partition_maintenance = asyncio.create_task(maintenance_loop(
+            Database.get_async_engine(), AUDIT_RETENTION_MONTHS, AUDIT_PARTITION_MONTHS_AHEAD,
+            AUDIT_PARTITION_MAINTENANCE_SECONDS
+        ))
+    yield
+    if replica_monitor:
+        replica_monitor.cancel()
+    if partition_maintenance:
+        partition_maintenance.cancel()
+    await audit_sink.stop()
+    hashing_executor.shutdown()
+    await Database.dispose_async_engine()
+    rate_limiter = getattr(app.state, "rate_limiter", None)
+    if rate_limiter is not None:
+        rate_limiter.close()
+    ip_filter = getattr(app.state, "ip_filter", None)
+    if ip_filter is not None:
+        ip_filter.close()
+    # Last: flush what the shutdown itself logged
+    stop_logging()
+
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
     
@@ -26,21 +73,40 @@ def create_app() -> FastAPI:
         title="User Authentication System",
         description="Secure authentication system with JWT, email verification, and password reset",
         version="1.0.0",
-        debug=DEBUG
+        debug=DEBUG,
+        lifespan=lifespan
     )
     
-    # Add security middleware (order matters!)
-    app.add_middleware(SecurityHeadersMiddleware)
+    # Add security middleware (order matters: each one added wraps the ones before it)
     app.add_middleware(RateLimitMiddleware, 
                       requests_per_minute=RATE_LIMIT_PER_MINUTE,
-                      requests_per_hour=RATE_LIMIT_PER_HOUR)
-    # Note: CSRF middleware temporarily disabled for initial setup
-    # app.add_middleware(CSRFMiddleware)
+                      requests_per_hour=RATE_LIMIT_PER_HOUR,
+                      max_memory_mb=RATE_LIMIT_MAX_MEMORY_MB,
+                      sweep_interval=RATE_LIMIT_SWEEP_INTERVAL_SECONDS,
+                      backend=RATE_LIMIT_BACKEND,
+                      shm_path=RATE_LIMIT_SHM_PATH,
+                      redis_url=RATE_LIMIT_REDIS_URL)
+    # CSRF is opt-in (CSRF_ENABLED); forms embed the token via csrf_token(request)
+    if CSRF_ENABLED:
+        app.add_middleware(CSRFMiddleware,
+                          secret=CSRF_SECRET,
+                          max_age=CSRF_TOKEN_MAX_AGE_SECONDS,
+                          secure=COOKIE_SECURE)
+    if IP_BLOCKLIST_PATH or IP_ALLOWLIST_PATH:
+        app.add_middleware(IPFilterMiddleware,
+                          blocklist_path=IP_BLOCKLIST_PATH or None,
+                          allowlist_path=IP_ALLOWLIST_PATH or None,
+                          reload_interval=IP_LIST_RELOAD_SECONDS)
+    # Added late so it runs early: everything below reads scope["client_ip"]
+    app.add_middleware(ClientIPMiddleware, trusted_proxies=parse_networks(TRUSTED_PROXIES))
+    # Outermost, so 429/403 responses from the middleware above get the headers too
+    app.add_middleware(SecurityHeadersMiddleware)
     
     # Register exception handlers
     app.add_exception_handler(AuthenticationError, authentication_error_handler)
     app.add_exception_handler(ValidationError, validation_error_handler)
     app.add_exception_handler(RateLimitError, rate_limit_error_handler)
+    app.add_exception_handler(ServiceUnavailableError, service_unavailable_error_handler)
     app.add_exception_handler(Exception, general_exception_handler)
     
     # index route
@@ -1,29 +1,45 @@
 # ################# IMPORT MODULES #################
-from fastapi import APIRouter, Depends, HTTPException, Form, Request, Cookie
+from fastapi import APIRouter, Depends, HTTPException, Form, Query, Request, Cookie
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from starlette.concurrency import run_in_threadpool
 import time
 import logging
 
 # ################# IMPORT CUSTOM MODULES #################
 import src.models as models
 import src.utils as utils
-from src.encryption import hash_password, verify_password
-from src.config import get_db
+from src import metrics
+from src.audit import audit_sink, query_audit_logs
+from src.audit_export import EXPORT_FORMATS, export_filename, stream_audit_export
+from src.rollups import rollup_dashboard
+from src.encryption import hash_password_async, verify_and_update_password_async
+from src.config import get_async_db
 from src.dependencies import (
-    get_current_user, get_client_ip, check_account_lockout,
+    get_current_user, require_admin, get_client_ip, check_account_lockout,
     record_failed_login, reset_failed_login_attempts
 )
 from src.auth import create_jwt_access_token, decode_token, JWTError
+from src.cache import Principal, invalidate_principal
+from src.replicas import pin_primary
 from src.validators import PasswordValidator, UsernameValidator, EmailValidator
-from src.exceptions import AccountLockedError, InvalidCredentialsError
+from src.exceptions import AccountLockedError, InvalidCredentialsError, ServiceUnavailableError
 from src.logger import SecurityAudit
+from src.middleware import get_csrf_token
 from src.settings import COOKIE_SECURE, COOKIE_SAMESITE, COOKIE_HTTPONLY
 
 logger = logging.getLogger(__name__)
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["csrf_token"] = get_csrf_token
+
+# Inserts tried before a registration gives up on transaction token collisions
+REGISTER_TOKEN_ATTEMPTS = 3
+# Largest page the audit log query returns
+AUDIT_PAGE_MAX = 500
 
 class APIV1:
     def __init__(self):
@@ -33,7 +49,7 @@ class APIV1:
         def login_html(request: Request): return templates.TemplateResponse("login.html", {"request": request})
             
         @self.router.post("/login")
-        def login(request: Request, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+        async def login(request: Request, username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_db)):
             client_ip = get_client_ip(request)
             logger.info(f"Login attempt - Username: {username}, IP: {client_ip}")
             
@@ -43,23 +59,31 @@ class APIV1:
                 try:
                     payload = decode_token(token)
                     transtoken = payload.get("transtoken")
-                    user = db.execute(
+                    user = (await db.execute(
                         select(models.User).where(models.User.transaction_token == transtoken)
-                    ).scalar_one_or_none()
+                    )).scalar_one_or_none()
                     if user:
                         logger.info(f"User already logged in - Username: {username}")
                         return RedirectResponse(url="/api/v1/profile", status_code=303)
                 except JWTError:
                     pass
             
-            # Find user
-            user = db.execute(
+            # Find user; read from the primary since lockout counters are updated below
+            pin_primary(db)
+            user = (await db.execute(
                 select(models.User).where(models.User.username == username)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
             
             if not user:
                 logger.warning(f"Login failed - User not found: {username}, IP: {client_ip}")
                 SecurityAudit.log_login_attempt(username, client_ip, False, "User not found")
+                await audit_sink.record(
+                    action="login",
+                    ip_address=client_ip,
+                    user_agent=request.headers.get("user-agent", "")[:255],
+                    status="failed",
+                    details=f"Unknown user {username} from {client_ip}"
+                )
                 return templates.TemplateResponse(
                     "login.html",
                     {"request": request, "error": "Invalid username or password"},
@@ -71,6 +95,14 @@ class APIV1:
                 remaining = user.locked_until - int(time.time())
                 logger.warning(f"Login blocked - Account locked: {username}, IP: {client_ip}")
                 SecurityAudit.log_login_attempt(username, client_ip, False, "Account locked")
+                await audit_sink.record(
+                    user_id=user.id,
+                    action="login",
+                    ip_address=client_ip,
+                    user_agent=request.headers.get("user-agent", "")[:255],
+                    status="locked",
+                    details=f"Login to locked account from {client_ip}"
+                )
                 return templates.TemplateResponse(
                     "login.html",
                     {
@@ -81,23 +113,38 @@ class APIV1:
                 )
             
             # Verify password
-            if not verify_password(password, user.password):
+            password_valid, new_hash = await verify_and_update_password_async(password, user.password)
+            if not password_valid:
                 logger.warning(f"Login failed - Invalid password: {username}, IP: {client_ip}")
                 SecurityAudit.log_login_attempt(username, client_ip, False, "Invalid password")
-                record_failed_login(user, db)
+                record_failed_login(user)
+                await db.commit()
+                invalidate_principal(user.transaction_token)
+                await audit_sink.record(
+                    user_id=user.id,
+                    action="login",
+                    ip_address=client_ip,
+                    user_agent=request.headers.get("user-agent", "")[:255],
+                    status="failed",
+                    details=f"Invalid password from {client_ip}"
+                )
                 return templates.TemplateResponse(
                     "login.html",
                     {"request": request, "error": "Invalid username or password"},
                     status_code=401
                 )
             
-            # Successful login
-            reset_failed_login_attempts(user, db)
+            # Successful login; upgrade legacy or under-cost hashes in place
+            if new_hash:
+                user.password = new_hash
+                logger.info(f"Password rehashed - Username: {username}")
+            reset_failed_login_attempts(user)
             logger.info(f"Login successful - Username: {username}, IP: {client_ip}")
             SecurityAudit.log_login_attempt(username, client_ip, True)
             
-            # Create audit log
-            audit_log = models.AuditLog(
+            await db.commit()
+            invalidate_principal(user.transaction_token)
+            await audit_sink.record(
                 user_id=user.id,
                 action="login",
                 ip_address=client_ip,
@@ -105,8 +152,6 @@ class APIV1:
                 status="success",
                 details=f"Successful login from {client_ip}"
             )
-            db.add(audit_log)
-            db.commit()
             
             # Create JWT token
             token = create_jwt_access_token({
@@ -129,7 +174,7 @@ class APIV1:
             return response
 
         @self.router.get("/logout")
-        def logout(request: Request, db: Session = Depends(get_db)):
+        async def logout(request: Request, db: AsyncSession = Depends(get_async_db)):
             client_ip = get_client_ip(request)
             
             # Try to get user info for logging
@@ -140,14 +185,13 @@ class APIV1:
                 try:
                     payload = decode_token(token)
                     transtoken = payload.get("transtoken")
-                    user = db.execute(
+                    user = (await db.execute(
                         select(models.User).where(models.User.transaction_token == transtoken)
-                    ).scalar_one_or_none()
+                    )).scalar_one_or_none()
                     
                     if user:
                         username = user.username
-                        # Create audit log
-                        audit_log = models.AuditLog(
+                        await audit_sink.record(
                             user_id=user.id,
                             action="logout",
                             ip_address=client_ip,
@@ -155,8 +199,6 @@ class APIV1:
                             status="success",
                             details=f"Logout from {client_ip}"
                         )
-                        db.add(audit_log)
-                        db.commit()
                 except Exception as e:
                     logger.error(f"Error during logout: {str(e)}")
             
@@ -171,14 +213,14 @@ class APIV1:
         def register_html(request: Request): return templates.TemplateResponse("register.html", {"request": request})
 
         @self.router.post("/register")
-        def register(
+        async def register(
             request: Request,
             fullname: str = Form(...),
             username: str = Form(...),
             email: str = Form(...),
             password: str = Form(...),
             confirm_password: str = Form(...),
-            db: Session = Depends(get_db)
+            db: AsyncSession = Depends(get_async_db)
         ):
             client_ip = get_client_ip(request)
             logger.info(f"Registration attempt - Username: {username}, Email: {email}, IP: {client_ip}")
@@ -241,28 +283,19 @@ class APIV1:
                         status_code=400
                     )
                 
-                # Check for existing user
-                existing_user = db.execute(
-                    select(models.User).where(models.User.username == username)
-                ).scalar_one_or_none()
-                existing_email = db.execute(
-                    select(models.User).where(models.User.email == email)
-                ).scalar_one_or_none()
-
-                if existing_user:
-                    logger.warning(f"Registration failed - Username exists: {username}, IP: {client_ip}")
-                    return templates.TemplateResponse(
-                        "register.html",
-                        {
-                            "request": request,
-                            "error": "Username already exists",
-                            "fullname": fullname,
-                            "email": email
-                        },
-                        status_code=400
-                    )
-                
-                if existing_email:
+                def duplicate_response(column: str):
+                    if column == "username":
+                        logger.warning(f"Registration failed - Username exists: {username}, IP: {client_ip}")
+                        return templates.TemplateResponse(
+                            "register.html",
+                            {
+                                "request": request,
+                                "error": "Username already exists",
+                                "fullname": fullname,
+                                "email": email
+                            },
+                            status_code=400
+                        )
                     logger.warning(f"Registration failed - Email exists: {email}, IP: {client_ip}")
                     return templates.TemplateResponse(
                         "register.html",
@@ -274,33 +307,54 @@ class APIV1:
                         },
                         status_code=400
                     )
-                
-                # Generate unique transaction token
-                while True:
-                    trans_token = utils.generate_secure_token()
-                    existing_token = db.execute(
-                        select(models.User).where(models.User.transaction_token == trans_token)
-                    ).scalar_one_or_none()
-                    if not existing_token:
+
+                # Check username and email in one query (username wins if both are taken)
+                taken = (await db.execute(
+                    select(models.User.username, models.User.email).where(
+                        or_(models.User.username == username, models.User.email == email)
+                    )
+                )).all()
+                if any(row.username == username for row in taken):
+                    return duplicate_response("username")
+                if taken:
+                    return duplicate_response("email")
+
+                password_hash = await hash_password_async(password)
+
+                # Insert the user; the unique constraints settle races with concurrent
+                # registrations, and a transaction token collision just retries with a new one
+                for attempt in range(REGISTER_TOKEN_ATTEMPTS):
+                    new_user = models.User(
+                        fullname=fullname,
+                        username=username,
+                        password=password_hash,
+                        email=email,
+                        transaction_token=utils.generate_secure_token()
+                    )
+                    db.add(new_user)
+                    try:
+                        await db.flush()
                         break
+                    except IntegrityError as e:
+                        await db.rollback()
+                        column = utils.duplicate_key_column(e, ("transaction_token", "username", "email"))
+                        if column in ("username", "email"):
+                            return duplicate_response(column)
+                        if column is None or attempt == REGISTER_TOKEN_ATTEMPTS - 1:
+                            raise
+                        logger.warning("Transaction token collision during registration - retrying")
 
-                # Create new user
-                new_user = models.User(
-                    fullname=fullname,
-                    username=username,
-                    password=hash_password(password),
-                    email=email,
-                    transaction_token=trans_token
+                # Email verification goes in the same transaction as the user
+                verify_token = utils.generate_secure_token()
+                verification = models.EmailVerifications(
+                    user_id=new_user.id,
+                    token=verify_token,
+                    token_exp=int(time.time()) + (24 * 3600),
+                    is_used=False
                 )
-                db.add(new_user)
-                db.commit()
-                db.refresh(new_user)
-                
-                logger.info(f"User registered successfully - Username: {username}, Email: {email}")
-                SecurityAudit.log_registration(username, email, client_ip, True)
-                
-                # Create audit log
-                audit_log = models.AuditLog(
+                db.add(verification)
+                await db.commit()
+                await audit_sink.record(
                     user_id=new_user.id,
                     action="registration",
                     ip_address=client_ip,
@@ -308,8 +362,9 @@ class APIV1:
                     status="success",
                     details=f"New user registration from {client_ip}"
                 )
-                db.add(audit_log)
-                db.commit()
+                
+                logger.info(f"User registered successfully - Username: {username}, Email: {email}")
+                SecurityAudit.log_registration(username, email, client_ip, True)
 
                 # Create JWT token
                 token = create_jwt_access_token({
@@ -328,31 +383,22 @@ class APIV1:
                     max_age=2592000  # 30 days
                 )
 
-                # Generate email verification token
-                verify_token = utils.generate_secure_token()
-                token_exp = int(time.time()) + (24 * 3600)
-
-                verification = models.EmailVerifications(
-                    user_id=new_user.id,
-                    token=verify_token,
-                    token_exp=token_exp,
-                    is_used=False
-                )
-                db.add(verification)
-                db.commit()
-                
                 verify_link = f"{request.base_url}api/v1/verify-email/{verify_token}"
                 subject, body = utils.EmailTemplate.verify_email_template(
                     fullname=new_user.fullname,
                     verify_link=verify_link
                 )
-                utils.send_email(new_user.email, subject, body)
+                await run_in_threadpool(utils.send_email, new_user.email, subject, body)
                 logger.info(f"Verification email sent to {new_user.email}")
 
                 return response
             
+            except ServiceUnavailableError:
+                # Hashing pool saturated: the app-level handler answers 503 with Retry-After
+                await db.rollback()
+                raise
             except Exception as e:
-                db.rollback()
+                await db.rollback()
                 logger.error(f"Registration error: {str(e)}", exc_info=True)
                 SecurityAudit.log_registration(username, email, client_ip, False)
                 return templates.TemplateResponse(
@@ -374,13 +420,16 @@ class APIV1:
             return templates.TemplateResponse("password_reset_request.html", {"request": request})
 
         @self.router.get("/verify-email/{token}", response_class=HTMLResponse)
-        def verify_email(request: Request, token: str, db: Session = Depends(get_db)):
+        async def verify_email(request: Request, token: str, db: AsyncSession = Depends(get_async_db)):
             client_ip = get_client_ip(request)
             logger.info(f"Email verification attempt - Token: {token[:10]}..., IP: {client_ip}")
 
-            email_verification = db.execute(
+            # The link arrives right after registration and the token is consumed here:
+            # a lagging replica would 404 it or miss is_used
+            pin_primary(db)
+            email_verification = (await db.execute(
                 select(models.EmailVerifications).where(models.EmailVerifications.token == token)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
             
             if not email_verification:
                 logger.warning(f"Email verification failed - Invalid token, IP: {client_ip}")
@@ -394,15 +443,16 @@ class APIV1:
                 logger.warning(f"Email verification failed - Token expired, IP: {client_ip}")
                 raise HTTPException(status_code=400, detail="Token has expired")
             
-            user = db.execute(
+            user = (await db.execute(
                 select(models.User).where(models.User.id == email_verification.user_id)
-            ).scalar_one()
+            )).scalar_one()
             
             user.verified = True
             email_verification.is_used = True
             
-            # Create audit log
-            audit_log = models.AuditLog(
+            await db.commit()
+            invalidate_principal(user.transaction_token)
+            await audit_sink.record(
                 user_id=user.id,
                 action="email_verification",
                 ip_address=client_ip,
@@ -410,8 +460,6 @@ class APIV1:
                 status="success",
                 details=f"Email verified from {client_ip}"
             )
-            db.add(audit_log)
-            db.commit()
             
             logger.info(f"Email verified successfully - User: {user.username}, Email: {user.email}")
             SecurityAudit.log_email_verification(user.email, True)
@@ -422,13 +470,13 @@ class APIV1:
             )
         
         @self.router.post("/password-reset", response_class=HTMLResponse)
-        def reset_password_send(request: Request, email: str = Form(...), db: Session = Depends(get_db)):
+        async def reset_password_send(request: Request, email: str = Form(...), db: AsyncSession = Depends(get_async_db)):
             client_ip = get_client_ip(request)
             logger.info(f"Password reset request - Email: {email}, IP: {client_ip}")
             
-            user = db.execute(
+            user = (await db.execute(
                 select(models.User).where(models.User.email == email)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
 
             if not user:
                 logger.warning(f"Password reset failed - Email not found: {email}, IP: {client_ip}")
@@ -452,11 +500,11 @@ class APIV1:
                 is_used=False
             )
             db.add(reset_entry)
-            db.commit()
+            await db.commit()
             
             reset_link = f"{request.base_url}api/v1/password-reset/{token}"
             subject, body = utils.EmailTemplate.reset_password_template(reset_link)
-            utils.send_email(user.email, subject, body)
+            await run_in_threadpool(utils.send_email, user.email, subject, body)
             
             logger.info(f"Password reset email sent to {email}")
 
@@ -469,8 +517,10 @@ class APIV1:
             )
 
         @self.router.get("/password-reset/{token}", response_class=HTMLResponse)
-        def reset_password_form(token: str, db: Session = Depends(get_db)):
-            record = db.execute(select(models.PasswordReset).where(models.PasswordReset.token == token)).scalar_one_or_none()
+        async def reset_password_form(request: Request, token: str, db: AsyncSession = Depends(get_async_db)):
+            # Freshly emailed token: a lagging replica may not have it yet
+            pin_primary(db)
+            record = (await db.execute(select(models.PasswordReset).where(models.PasswordReset.token == token))).scalar_one_or_none()
 
             if not record:raise HTTPException(status_code=404, detail="Invalid token")
             if record.is_used:raise HTTPException(status_code=400, detail="Token already used")
@@ -480,6 +530,7 @@ class APIV1:
                 <body>
                     <h2>Reset Password</h2>
                     <form action="/api/v1/password-reset/{token}" method="post">
+                        <input type="hidden" name="csrf_token" value="{get_csrf_token(request)}">
                         <label>New Password:</label><br>
                         <input type="password" name="password" required><br><br>
 
@@ -494,12 +545,12 @@ class APIV1:
             return HTMLResponse(html)
 
         @self.router.post("/password-reset/{token}", response_class=HTMLResponse)
-        def reset_password_apply(
+        async def reset_password_apply(
             request: Request,
             token: str,
             password: str = Form(...),
             confirm_password: str = Form(...),
-            db: Session = Depends(get_db)
+            db: AsyncSession = Depends(get_async_db)
         ):
             client_ip = get_client_ip(request)
             logger.info(f"Password reset apply - Token: {token[:10]}..., IP: {client_ip}")
@@ -519,9 +570,11 @@ class APIV1:
                 error_msg += "</ul>"
                 return HTMLResponse(error_msg, status_code=400)
             
-            record = db.execute(
+            # The token is consumed here, so check is_used on the primary
+            pin_primary(db)
+            record = (await db.execute(
                 select(models.PasswordReset).where(models.PasswordReset.token == token)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
             
             if not record:
                 raise HTTPException(status_code=404, detail="Invalid token")
@@ -530,15 +583,16 @@ class APIV1:
             if utils.is_token_expired(record.token_exp):
                 raise HTTPException(status_code=400, detail="Token expired")
             
-            user = db.execute(
+            user = (await db.execute(
                 select(models.User).where(models.User.id == record.user_id)
-            ).scalar_one()
+            )).scalar_one()
             
-            user.password = hash_password(password)
+            user.password = await hash_password_async(password)
             record.is_used = True
             
-            # Create audit log
-            audit_log = models.AuditLog(
+            await db.commit()
+            invalidate_principal(user.transaction_token)
+            await audit_sink.record(
                 user_id=user.id,
                 action="password_reset",
                 ip_address=client_ip,
@@ -546,8 +600,6 @@ class APIV1:
                 status="success",
                 details=f"Password reset from {client_ip}"
             )
-            db.add(audit_log)
-            db.commit()
             
             logger.info(f"Password reset successful - User: {user.username}, IP: {client_ip}")
             SecurityAudit.log_password_change(user.username, client_ip, "reset")
@@ -555,7 +607,7 @@ class APIV1:
             return HTMLResponse("<h1>Password changed successfully!</h1>")
         
         @self.router.get("/profile", response_class=HTMLResponse)
-        def profile(request: Request, current_user: models.User = Depends(get_current_user)):
+        async def profile(request: Request, current_user: Principal = Depends(get_current_user)):
             logger.info(f"Profile accessed - User: {current_user.username}")
             
             return templates.TemplateResponse(
@@ -573,10 +625,10 @@ class APIV1:
             )
         
         @self.router.post("/delete-account")
-        def delete_account(
+        async def delete_account(
             request: Request,
-            current_user: models.User = Depends(get_current_user),
-            db: Session = Depends(get_db)
+            current_user: Principal = Depends(get_current_user),
+            db: AsyncSession = Depends(get_async_db)
         ):
             """Delete user account"""
             client_ip = get_client_ip(request)
@@ -586,21 +638,29 @@ class APIV1:
             logger.warning(f"Account deletion request - User: {username}, IP: {client_ip}")
             
             try:
-                # Create final audit log before deletion
-                audit_log = models.AuditLog(
+                pin_primary(db)
+                # Delete user (cascade will delete related records)
+                user = await db.get(models.User, current_user.id)
+                if user is None:
+                    # A cached principal can outlive its row, e.g. after a concurrent deletion
+                    invalidate_principal(current_user.transaction_token)
+                    logger.warning(f"Account deletion for missing user - User: {username}, IP: {client_ip}")
+                    response = JSONResponse({"detail": "Account not found"}, status_code=404)
+                    response.delete_cookie("access_token")
+                    return response
+                await db.delete(user)
+                await db.commit()
+                invalidate_principal(current_user.transaction_token)
+
+                # Audit history is kept after the account is gone
+                await audit_sink.record(
                     user_id=current_user.id,
                     action="account_deletion",
                     ip_address=client_ip,
                     user_agent=request.headers.get("user-agent", "")[:255],
                     status="success",
-                    details=f"Account deleted by user from {client_ip}"
+                    details=f"Account {username} deleted by user from {client_ip}"
                 )
-                db.add(audit_log)
-                db.commit()
-                
-                # Delete user (cascade will delete related records)
-                db.delete(current_user)
-                db.commit()
                 
                 logger.info(f"Account deleted successfully - Username: {username}, Email: {email}")
                 SecurityAudit.log_suspicious_activity(
@@ -615,9 +675,93 @@ class APIV1:
                 return response
                 
             except Exception as e:
-                db.rollback()
+                await db.rollback()
                 logger.error(f"Account deletion failed - User: {username}, Error: {str(e)}", exc_info=True)
                 raise HTTPException(
                     status_code=500,
                     detail="Failed to delete account. Please try again later."
-                )
\ No newline at end of file
+                )
+
+        @self.router.get("/metrics")
+        async def metrics_snapshot(current_user: Principal = Depends(require_admin)):
+            """In-process cache and rate limiter counters (admin only)"""
+            return JSONResponse(metrics.collect())
+
+        @self.router.get("/admin/audit-logs")
+        async def audit_logs(
+            user_id: int = Query(None),
+            action: str = Query(None),
+            status: str = Query(None),
+            ip: str = Query(None),
+            since: int = Query(None, description="Unix time, inclusive"),
+            until: int = Query(None, description="Unix time, exclusive"),
+            limit: int = Query(50, ge=1, le=AUDIT_PAGE_MAX),
+            cursor: str = Query(None, description="next_cursor from the previous page"),
+            current_user: Principal = Depends(require_admin),
+            db: AsyncSession = Depends(get_async_db)
+        ):
+            """Audit log rows newest first, keyset paginated (admin only)"""
+            try:
+                rows, next_cursor = await query_audit_logs(
+                    db, limit=limit, user_id=user_id, action=action, status=status,
+                    ip_address=ip, since=since, until=until, cursor=cursor
+                )
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            return JSONResponse({
+                "items": [
+                    {
+                        "id": row.id,
+                        "user_id": row.user_id,
+                        "action": row.action,
+                        "status": row.status,
+                        "ip_address": row.ip_address,
+                        "user_agent": row.user_agent,
+                        "details": row.details,
+                        "created_at": row.created_at
+                    }
+                    for row in rows
+                ],
+                "next_cursor": next_cursor
+            })
+
+        @self.router.get("/admin/audit-logs/export")
+        async def audit_logs_export(
+            request: Request,
+            fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+            gzip: bool = Query(False),
+            user_id: int = Query(None),
+            action: str = Query(None),
+            status: str = Query(None),
+            ip: str = Query(None),
+            since: int = Query(None, description="Unix time, inclusive"),
+            until: int = Query(None, description="Unix time, exclusive"),
+            current_user: Principal = Depends(require_admin),
+            db: AsyncSession = Depends(get_async_db)
+        ):
+            """Stream the matching audit rows oldest first as NDJSON or CSV (admin only)"""
+            logger.info(f"Audit export - User: {current_user.username}, Format: {fmt}, IP: {get_client_ip(request)}")
+            media_type = "application/gzip" if gzip else EXPORT_FORMATS[fmt][0]
+            return StreamingResponse(
+                stream_audit_export(
+                    db, fmt, gzip, user_id=user_id, action=action, status=status,
+                    ip_address=ip, since=since, until=until
+                ),
+                media_type=media_type,
+                headers={"Content-Disposition": f'attachment; filename="{export_filename(fmt, gzip)}"'}
+            )
+
+        @self.router.get("/admin/audit-dashboard")
+        async def audit_dashboard(
+            action: str = Query(None),
+            status: str = Query(None),
+            since: int = Query(None, description="Unix time, rounded down to the hour; default 24h before until"),
+            until: int = Query(None, description="Unix time, exclusive; default now"),
+            top: int = Query(10, ge=1, le=100),
+            current_user: Principal = Depends(require_admin),
+            db: AsyncSession = Depends(get_async_db)
+        ):
+            """Hourly audit event counts and top client IPs from the rollup tables (admin only)"""
+            return JSONResponse(await rollup_dashboard(
+                db, since=since, until=until, action=action, status=status, top=top
+            ))
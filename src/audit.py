@@ -0,0 +1,434 @@
+"""
+Batched AuditLog writer
+
+Handlers call `await audit_sink.record(...)`, which only enqueues the row. A
+background task drains the queue and writes rows with one bulk INSERT per
+batch, every `batch_size` rows or `flush_interval_ms` after the first queued
+row, whichever comes first. The queue is bounded: when the writer falls
+behind, record() waits for room instead of growing memory without limit.
+
+When an insert fails or takes longer than `db_timeout_ms`, the sink switches
+to degraded mode and appends batches to a local segment spool (src/spool.py)
+instead of waiting on the database. A replay task bulk-loads the spooled
+segments once the database accepts writes again, then leaves degraded mode.
+A batch the database refuses for any other reason (a constraint, bad data)
+is retried one row at a time. A row that fails on a constraint is retried
+once without its user link (its user may have been deleted before the
+audit_logs foreign key was dropped). Rows that still fail are moved to a
+`.bad` quarantine file next to the spool, in the same JSON-lines format, so
+a poison row neither loses its batch nor keeps the sink degraded.
+
+Every row that reaches the database is also counted into hourly rollups
+(src/rollups.py), flushed every `rollup_interval` seconds, so dashboards
+never scan audit_logs.
+
+stop() drains and flushes everything still queued. In synchronous mode (or
+before start()), record() writes the row immediately, which is what tests use.
+
+query_audit_logs() reads rows back newest first with keyset pagination on
+(created_at, id), so a page deep in the table costs the same as the first.
+Rows are stored in monthly partitions (src/partitions.py); a page walks the
+partitions overlapping the time range, newest first.
+"""
+import asyncio
+import base64
+import logging
+import time
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import Table, and_, or_, select
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from src import metrics
+from src.models import AuditLog
+from src.partitions import insert_rows, partition_tables_async
+from src.rollups import RollupAccumulator, write_rollups
+from src.settings import (
+    AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS, AUDIT_QUEUE_SIZE, AUDIT_SYNCHRONOUS, AUDIT_DB_TIMEOUT_MS,
+    AUDIT_SPOOL_DIR, AUDIT_SPOOL_SEGMENT_BYTES, AUDIT_SPOOL_REPLAY_SECONDS, AUDIT_ROLLUP_FLUSH_SECONDS,
+    AUDIT_ROLLUP_TOP_IPS, AUDIT_ROLLUP_SKETCH_SIZE
+)
+from src.spool import SegmentSpool
+
+logger = logging.getLogger(__name__)
+
+
+def _transient(error: Exception) -> bool:
+    """Errors that say the database is unreachable or slow, not that the rows are bad"""
+    if isinstance(error, (asyncio.TimeoutError, OSError, OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def _describe(error: Exception) -> str:
+    return str(getattr(error, "orig", None) or error) or type(error).__name__
+
+
+class AuditSink:
+    """Bounded queue + background bulk writer for audit_logs rows"""
+
+    def __init__(self, batch_size: int = 100, flush_interval_ms: int = 200, max_queue: int = 10000,
+                 synchronous: bool = False, session_factory: Optional[Callable] = None,
+                 db_timeout_ms: int = 1000, spool_dir: str = "", spool_segment_bytes: int = 16 * 1024 * 1024,
+                 replay_interval: float = 5, rollup_interval: float = 10, rollup_top_ips: int = 20,
+                 rollup_sketch_size: int = 200):
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max(max_queue, 1)
+        self.synchronous = synchronous
+        self.session_factory = session_factory
+        self.db_timeout = db_timeout_ms / 1000
+        self.spool_dir = spool_dir
+        self.spool_segment_bytes = spool_segment_bytes
+        self.replay_interval = replay_interval
+        self.rollup_interval = rollup_interval
+        self.rollups = RollupAccumulator(rollup_top_ips, rollup_sketch_size)
+        self.degraded = False
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.unlinked = 0
+        self._spool = None
+        self._queue = None
+        self._worker = None
+        self._replayer = None
+        self._rollup_task = None
+
+    def configure(self, session_factory: Optional[Callable] = None, synchronous: bool = False):
+        """Point the sink at another session factory (None = the app database)"""
+        self.session_factory = session_factory
+        self.synchronous = synchronous
+
+    @property
+    def spool(self) -> Optional[SegmentSpool]:
+        """Local spool, created on first use (None when spooling is disabled)"""
+        if self._spool is None and self.spool_dir:
+            self._spool = SegmentSpool(self.spool_dir, self.spool_segment_bytes)
+        return self._spool
+
+    def _session(self):
+        if self.session_factory is None:
+            from src.config import Database
+            return Database.get_async_session_factory()()
+        return self.session_factory()
+
+    async def start(self):
+        """Start the background writer (no-op in synchronous mode)"""
+        if self.synchronous or self._worker is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run(), name="audit-writer")
+        if self.spool is not None:
+            self._replayer = asyncio.create_task(self._replay_loop(), name="audit-replayer")
+        self._rollup_task = asyncio.create_task(self._rollup_loop(), name="audit-rollups")
+        logger.info(f"Audit writer started - Batch: {self.batch_size}, Interval: {self.flush_interval * 1000:.0f}ms")
+
+    async def stop(self):
+        """Flush everything queued and stop the writer"""
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+        await self._queue.put(None)
+        await worker
+        self._queue = None
+        if self._replayer is not None:
+            self._replayer.cancel()
+            self._replayer = None
+        self._rollup_task.cancel()
+        self._rollup_task = None
+        await self.flush_rollups()
+        if self._spool is not None:
+            # Segments left here are replayed on the next start
+            self._spool.close()
+        logger.info("Audit writer stopped")
+
+    async def record(self, action: str, status: str, user_id: Optional[int] = None,
+                     ip_address: Optional[str] = None, user_agent: Optional[str] = None,
+                     details: Optional[str] = None):
+        """Queue one audit row; waits for room when the queue is full"""
+        row = {
+            "user_id": user_id,
+            "action": action,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "status": status,
+            "details": details,
+            "created_at": int(time.time()),
+        }
+        if self._worker is None:
+            await self._write([row])
+        else:
+            await self._queue.put(row)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    # Drain what is already queued without waiting
+                    row = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+
+    async def _write(self, rows: list):
+        if not self.degraded:
+            try:
+                stored, rejected = await self._store(rows, self.db_timeout)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if self.spool is None:
+                    self.failed += len(rows)
+                    logger.error(f"Audit write failed - Rows: {len(rows)}, Error: {error}")
+                    return
+                self.degraded = True
+                logger.warning(f"Audit database unavailable, spooling locally - Error: {error}")
+            else:
+                self.written += len(stored)
+                self.batches += 1
+                self.rollups.add(stored)
+                if rejected and not await self._reject(rejected, "rejected"):
+                    self.failed += len(rejected)
+                if self._worker is None:
+                    await self.flush_rollups()
+                return
+        try:
+            await asyncio.to_thread(self.spool.append, rows)
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Audit spool write failed - Rows: {len(rows)}, Error: {str(e)}")
+
+    async def _store(self, rows: list, timeout: Optional[float] = None) -> Tuple[list, list]:
+        """
+        Insert rows; returns (stored, rejected)
+        A batch the database refuses is retried one row at a time; only
+        transient errors (connection lost, timeout) propagate, so the caller
+        can spool or keep the batch
+        """
+        try:
+            await asyncio.wait_for(self._insert(rows), timeout)
+            return rows, []
+        except Exception as e:
+            if _transient(e):
+                raise
+        stored, rejected, error = [], [], None
+        for row in rows:
+            try:
+                await asyncio.wait_for(self._insert([row]), timeout)
+                stored.append(row)
+                continue
+            except Exception as e:
+                if _transient(e):
+                    raise
+                error = error or _describe(e)
+                unlink = isinstance(e, IntegrityError) and row.get("user_id") is not None
+            if unlink:
+                user_id, row["user_id"] = row["user_id"], None
+                try:
+                    await asyncio.wait_for(self._insert([row]), timeout)
+                    stored.append(row)
+                    self.unlinked += 1
+                    logger.warning(f"Audit row stored without user link - User: {user_id}, Action: {row.get('action')}")
+                    continue
+                except Exception as e:
+                    if _transient(e):
+                        raise
+                    row["user_id"] = user_id
+            rejected.append(row)
+        if rejected:
+            logger.error(f"Audit rows rejected - Rows: {len(rejected)}, Error: {error}")
+        return stored, rejected
+
+    async def _reject(self, rows: list, name: str) -> bool:
+        """Quarantine rows the database refused (counted as failed without a spool); False when that failed"""
+        if self.spool is None:
+            self.failed += len(rows)
+            return True
+        try:
+            await asyncio.to_thread(self.spool.quarantine, name, rows)
+        except Exception as e:
+            logger.error(f"Audit quarantine write failed - Rows: {len(rows)}, Error: {str(e)}")
+            return False
+        return True
+
+    async def _insert(self, rows: list):
+        async with self._session() as session:
+            await session.run_sync(lambda sync_session: insert_rows(sync_session.connection(), rows))
+            await session.commit()
+
+    async def replay(self) -> int:
+        """Bulk-load spooled segments, oldest first; leaves degraded mode once the spool is empty"""
+        spool = self.spool
+        if spool is None:
+            return 0
+        replayed = 0
+        for path in await asyncio.to_thread(spool.sealed):
+            rows = await asyncio.to_thread(spool.read, path)
+            try:
+                stored, rejected = await self._store(rows) if rows else ([], [])
+            except Exception as e:
+                # Only a database that is down or slow keeps the segment for the next attempt
+                logger.warning(f"Audit replay deferred - Segment: {path.name}, Error: {_describe(e)}")
+                return replayed
+            if rejected:
+                if not await self._reject(rejected, path.stem):
+                    return replayed
+                logger.error(f"Audit rows quarantined - Segment: {path.name}, Rows: {len(rejected)}")
+            spool.remove(path, len(stored))
+            self.written += len(stored)
+            self.rollups.add(stored)
+            replayed += len(stored)
+        if replayed:
+            logger.info(f"Audit spool replayed - Rows: {replayed}")
+        self.degraded = False
+        return replayed
+
+    async def _replay_loop(self):
+        while True:
+            await self.replay()
+            await asyncio.sleep(self.replay_interval)
+
+    async def flush_rollups(self):
+        """Upsert the rollup counts gathered since the last flush"""
+        if not self.rollups:
+            return
+        pending = self.rollups
+        self.rollups = RollupAccumulator(pending.top_ips, pending.sketch_size)
+        try:
+            async with self._session() as session:
+                await session.run_sync(lambda sync_session: write_rollups(sync_session.connection(), pending))
+                await session.commit()
+        except Exception as e:
+            # Keep the counts for the next flush
+            pending.merge(self.rollups)
+            self.rollups = pending
+            logger.warning(f"Audit rollup flush deferred - Error: {str(e)}")
+
+    async def _rollup_loop(self):
+        while True:
+            await asyncio.sleep(self.rollup_interval)
+            await self.flush_rollups()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "unlinked": self.unlinked,
+            "synchronous": self.synchronous,
+            "degraded": self.degraded,
+            "rollup_keys_pending": len(self.rollups.events),
+            "spool": self._spool.stats() if self._spool is not None else None,
+        }
+
+
+audit_sink = AuditSink(
+    AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL_MS, AUDIT_QUEUE_SIZE, AUDIT_SYNCHRONOUS,
+    db_timeout_ms=AUDIT_DB_TIMEOUT_MS,
+    spool_dir=AUDIT_SPOOL_DIR,
+    spool_segment_bytes=AUDIT_SPOOL_SEGMENT_BYTES,
+    replay_interval=AUDIT_SPOOL_REPLAY_SECONDS,
+    rollup_interval=AUDIT_ROLLUP_FLUSH_SECONDS,
+    rollup_top_ips=AUDIT_ROLLUP_TOP_IPS,
+    rollup_sketch_size=AUDIT_ROLLUP_SKETCH_SIZE
+)
+metrics.register("audit_sink", audit_sink.stats)
+
+
+def encode_cursor(created_at: int, row_id: int) -> str:
+    """Opaque page cursor for the row a page ended on"""
+    return base64.urlsafe_b64encode(f"{created_at}:{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """(created_at, id) from a cursor; raises ValueError when malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split(":")
+        return int(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def audit_log_filters(table: Table = None, user_id: Optional[int] = None, action: Optional[str] = None,
+                      status: Optional[str] = None, ip_address: Optional[str] = None, since: Optional[int] = None,
+                      until: Optional[int] = None) -> list:
+    """WHERE conditions shared by the query API and the export, for audit_logs or one of its month tables"""
+    columns = (table if table is not None else AuditLog.__table__).c
+    conditions = []
+    if user_id is not None:
+        conditions.append(columns.user_id == user_id)
+    if action is not None:
+        conditions.append(columns.action == action)
+    if status is not None:
+        conditions.append(columns.status == status)
+    if ip_address is not None:
+        conditions.append(columns.ip_address == ip_address)
+    if since is not None:
+        conditions.append(columns.created_at >= since)
+    if until is not None:
+        conditions.append(columns.created_at < until)
+    return conditions
+
+
+def audit_log_query(table: Table = None, cursor: Optional[str] = None, limit: int = 50, **filters) -> Select:
+    """
+    Newest-first page of audit rows matching the filters
+    Equality filters plus the created_at order are served by the
+    (<column>, created_at) indexes; the cursor adds a created_at range on
+    them, with id breaking ties within the cursor's second
+    """
+    table = table if table is not None else AuditLog.__table__
+    query = select(table).where(*audit_log_filters(table, **filters))
+    if cursor is not None:
+        created_at, row_id = decode_cursor(cursor)
+        # Spelled out: MySQL does not plan a row-value comparison as an index range. The plain
+        # created_at bound gives the range (and partition pruning) on its own
+        query = query.where(
+            table.c.created_at <= created_at,
+            or_(table.c.created_at < created_at, and_(table.c.created_at == created_at, table.c.id < row_id))
+        )
+    return query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit)
+
+
+async def query_audit_logs(db: AsyncSession, limit: int = 50, cursor: Optional[str] = None,
+                           **filters) -> Tuple[List[Row], Optional[str]]:
+    """One page of audit rows and the cursor for the next page (None on the last page)"""
+    until = filters.get("until")
+    if cursor is not None:
+        # Partitions newer than the cursor row cannot hold the page
+        cursor_until = decode_cursor(cursor)[0] + 1
+        until = cursor_until if until is None else min(until, cursor_until)
+    # The bound also goes into the SQL, so each statement prunes MySQL partitions itself
+    filters["until"] = until
+    rows = []
+    for table in await partition_tables_async(db, filters.get("since"), until):
+        query = audit_log_query(table, cursor=cursor, limit=limit + 1 - len(rows), **filters)
+        rows.extend((await db.execute(query)).all())
+        if len(rows) > limit:
+            break
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
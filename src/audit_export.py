@@ -0,0 +1,115 @@
+"""
+Streaming audit log export (NDJSON or CSV, optionally gzipped)
+
+Rows are read oldest first, one monthly audit partition after another,
+through a server-side cursor in `yield_per` sized batches as plain Core
+rows (no ORM identity map), encoded and compressed one batch at a time.
+Memory stays at one batch no matter how many rows the export holds. The
+same encoder serves the admin endpoint (async session) and
+scripts/export_audit_logs.py (sync connection).
+"""
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, Iterable, Iterator
+
+from sqlalchemy import Table, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from src.audit import audit_log_filters
+from src.models import AuditLog
+from src.partitions import partition_tables, partition_tables_async
+
+EXPORT_COLUMNS = ("id", "user_id", "action", "status", "ip_address", "user_agent", "details", "created_at")
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def export_query(table: Table = None, **filters) -> Select:
+    """Oldest-first Core select of the exported columns from audit_logs or one month table"""
+    table = table if table is not None else AuditLog.__table__
+    return (
+        select(*(table.c[name] for name in EXPORT_COLUMNS))
+        .where(*audit_log_filters(table, **filters))
+        .order_by(table.c.created_at, table.c.id)
+    )
+
+
+class ExportEncoder:
+    """Encodes row partitions to bytes, gzip-compressing on the fly when asked"""
+
+    def __init__(self, fmt: str = "ndjson", compress: bool = False):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.fmt = fmt
+        # wbits 16+ writes a gzip header and trailer
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    def _emit(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def header(self) -> bytes:
+        if self.fmt != "csv":
+            return b""
+        self._writer.writerow(EXPORT_COLUMNS)
+        return self._emit(self._drain())
+
+    def encode(self, rows: Iterable) -> bytes:
+        if self.fmt == "csv":
+            self._writer.writerows(rows)
+            data = self._drain()
+        else:
+            data = "".join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(",", ":")) + "\n" for row in rows
+            ).encode()
+        return self._emit(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b""
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+async def stream_audit_export(db: AsyncSession, fmt: str = "ndjson", compress: bool = False,
+                              yield_per: int = 1000, **filters) -> AsyncIterator[bytes]:
+    """Export chunks for a StreamingResponse, one per fetched batch"""
+    encoder = ExportEncoder(fmt, compress)
+    chunk = encoder.header()
+    if chunk:
+        yield chunk
+    tables = await partition_tables_async(db, filters.get("since"), filters.get("until"), newest_first=False)
+    for table in tables:
+        result = await db.stream(export_query(table, **filters).execution_options(yield_per=yield_per))
+        async for partition in result.partitions():
+            chunk = encoder.encode(partition)
+            if chunk:
+                yield chunk
+    yield encoder.finish()
+
+
+def iter_audit_export(connection: Connection, fmt: str = "ndjson", compress: bool = False,
+                      yield_per: int = 1000, **filters) -> Iterator[bytes]:
+    """Sync counterpart of stream_audit_export for the CLI"""
+    encoder = ExportEncoder(fmt, compress)
+    yield encoder.header()
+    for table in partition_tables(connection, filters.get("since"), filters.get("until"), newest_first=False):
+        result = connection.execution_options(yield_per=yield_per).execute(export_query(table, **filters))
+        for partition in result.partitions():
+            yield encoder.encode(partition)
+    yield encoder.finish()
+
+
+def export_filename(fmt: str, compress: bool = False) -> str:
+    name = f"audit_logs.{EXPORT_FORMATS[fmt][1]}"
+    return f"{name}.gz" if compress else name
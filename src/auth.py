@@ -1,6 +1,13 @@
+import hashlib
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from src.settings import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY_JWT
+from src import metrics
+from src.cache import TTLCache
+from src.settings import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY_JWT, JWT_CACHE_SIZE
+
+# Verified payloads keyed by token digest; entries expire at the token's own exp
+token_cache = TTLCache(max_size=JWT_CACHE_SIZE)
+metrics.register("jwt_cache", token_cache.stats)
 
 def create_jwt_access_token(data: dict):
     """Create JWT Token"""
@@ -12,4 +19,15 @@ def create_jwt_access_token(data: dict):
 
 
 def decode_token(token: str):
-    return jwt.decode(token, SECRET_KEY_JWT, algorithms=[ALGORITHM])
\ No newline at end of file
+    return jwt.decode(token, SECRET_KEY_JWT, algorithms=[ALGORITHM])
+
+
+def decode_token_cached(token: str) -> dict:
+    """Decode a token, skipping signature verification for recently verified tokens"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = decode_token(token)
+        if "exp" in payload:
+            token_cache.set(key, payload, expires_at=float(payload["exp"]))
+    return dict(payload)
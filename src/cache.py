@@ -0,0 +1,113 @@
+"""
+In-process caches for hot authentication lookups
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from src import metrics
+from src.settings import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire at an absolute unix time
+    Expired entries are dropped on access; the least recently used entry
+    is evicted once max_size is reached
+    """
+
+    def __init__(self, max_size: int, default_ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry, or default on a miss"""
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """Store an entry until expires_at (or now + default_ttl)"""
+        if expires_at is None:
+            if self.default_ttl is None:
+                raise ValueError("expires_at is required when the cache has no default_ttl")
+            expires_at = time.time() + self.default_ttl
+        if self.max_size <= 0 or expires_at <= time.time():
+            return
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry"""
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """Size and hit/miss counters"""
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class Principal:
+    """Compact, detached snapshot of an authenticated user"""
+
+    __slots__ = (
+        "id", "username", "email", "fullname", "role", "verified",
+        "locked_until", "last_login", "created_at", "transaction_token"
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(**{name: getattr(user, name) for name in cls.__slots__})
+
+
+# Principals keyed by transaction_token; invalidated whenever the user row changes
+principal_cache = TTLCache(max_size=PRINCIPAL_CACHE_SIZE, default_ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+metrics.register("principal_cache", principal_cache.stats)
+
+
+def invalidate_principal(transaction_token: str):
+    """Drop a cached principal after its user row changed"""
+    principal_cache.pop(transaction_token)
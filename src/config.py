@@ -1,40 +1,157 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session, scoped_session
-from typing import Generator
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Generator
+import time
+
+from src import metrics
+from src.replicas import ReplicaSet, RoutingSession
+from src.settings import (
+    DB_URL, ASYNC_DB_URL, ASYNC_DB_REPLICA_URLS, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_ECHO
+)
+
+# Connection wait buckets in milliseconds
+POOL_WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class PoolTelemetry:
+    """Checkout wait histogram, timeouts and live pool gauges for one engine"""
+
+    def __init__(self):
+        self.wait_ms = metrics.Histogram(POOL_WAIT_BUCKETS_MS)
+        self.timeouts = 0
+        self.pool = None
+
+    def stats(self) -> dict:
+        pool = self.pool
+        gauges = {}
+        if pool is not None:
+            gauges = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            }
+        return {**gauges, "timeouts": self.timeouts, "wait_ms": self.wait_ms.snapshot()}
+
+
+def instrumented_pool(pool_class, telemetry: PoolTelemetry):
+    """
+    Pool subclass that times every checkout (queue wait plus any new connect)
+    The telemetry lives on the class so pools rebuilt by recreate() keep it
+    """
+
+    def _do_get(self):
+        telemetry.pool = self
+        start = time.perf_counter()
+        try:
+            return pool_class._do_get(self)
+        except PoolTimeoutError:
+            telemetry.timeouts += 1
+            raise
+        finally:
+            telemetry.wait_ms.observe((time.perf_counter() - start) * 1000)
+
+    return type(f"Instrumented{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+
+
+def pool_options(pool_class, telemetry: PoolTelemetry) -> dict:
+    """Engine keyword arguments for the configured pool profile"""
+    return {
+        "poolclass": instrumented_pool(pool_class, telemetry),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "echo": DB_ECHO,
+    }
 
-from src.settings import DB_URL
 
 class Database:
     _engine = None
     _session_factory = None
+    _async_engine = None
+    _async_session_factory = None
+    _replicas = None
+    pool_telemetry = PoolTelemetry()
+    async_pool_telemetry = PoolTelemetry()
 
     @classmethod
     def get_engine(cls):
         if cls._engine is None:
-            cls._engine = create_engine(
-                DB_URL,
-                pool_pre_ping=True,
-                pool_recycle=280,
-                echo=True
-            )
+            cls._engine = create_engine(DB_URL, **pool_options(QueuePool, cls.pool_telemetry))
         return cls._engine
     @classmethod
     def get_session_factory(cls):
         if cls._session_factory is None:
             engine = cls.get_engine()
-            cls._session_factory = scoped_session(
-                sessionmaker(
-                    bind=engine,
-                    autoflush=False,
-                    autocommit=False,
-                    expire_on_commit=False
-                )
+            cls._session_factory = sessionmaker(
+                bind=engine,
+                autoflush=False,
+                autocommit=False,
+                expire_on_commit=False
             )
         return cls._session_factory
 
+    @classmethod
+    def get_async_engine(cls):
+        """Async engine (aiomysql, or aiosqlite for local runs) used by the request handlers"""
+        if cls._async_engine is None:
+            cls._async_engine = create_async_engine(
+                ASYNC_DB_URL, **pool_options(AsyncAdaptedQueuePool, cls.async_pool_telemetry)
+            )
+        return cls._async_engine
+
+    @classmethod
+    def get_replicas(cls) -> ReplicaSet:
+        """Async read replicas from ASYNC_DB_REPLICA_URLS (may be empty)"""
+        if cls._replicas is None:
+            engines = []
+            for index, url in enumerate(ASYNC_DB_REPLICA_URLS):
+                telemetry = PoolTelemetry()
+                metrics.register(f"db_replica_{index}_pool", telemetry.stats)
+                engines.append(create_async_engine(url, **pool_options(AsyncAdaptedQueuePool, telemetry)))
+            cls._replicas = ReplicaSet(engines)
+            metrics.register("db_replicas", cls._replicas.stats)
+        return cls._replicas
+
+    @classmethod
+    def get_async_session_factory(cls):
+        if cls._async_session_factory is None:
+            cls._async_session_factory = async_sessionmaker(
+                bind=cls.get_async_engine(),
+                sync_session_class=RoutingSession,
+                replicas=cls.get_replicas(),
+                autoflush=False,
+                expire_on_commit=False
+            )
+        return cls._async_session_factory
+
+    @classmethod
+    async def dispose_async_engine(cls):
+        """Close pooled async connections; they are bound to the event loop that opened them"""
+        if cls._async_engine is not None:
+            await cls._async_engine.dispose()
+            cls._async_engine = None
+            cls._async_session_factory = None
+        if cls._replicas is not None:
+            await cls._replicas.dispose()
+            cls._replicas = None
+
+metrics.register("db_pool", Database.pool_telemetry.stats)
+metrics.register("db_async_pool", Database.async_pool_telemetry.stats)
+
 def get_db() -> Generator[Session, None, None]:
     session = Database.get_session_factory()()
     try:
         yield session
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with Database.get_async_session_factory()() as session:
+        yield session
@@ -1,22 +1,22 @@
 from fastapi import Request, Depends, HTTPException
 from src.models import User
-from src.config import get_db
-from sqlalchemy.orm import Session
-from src.auth import decode_token
+from src.config import get_async_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.auth import decode_token_cached
+from src.cache import Principal, principal_cache
 from src.exceptions import AuthenticationError, InvalidCredentialsError
+from src.middleware import client_ip_from_scope
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 def get_client_ip(request: Request) -> str:
-    """Extract client IP from request"""
-    forwarded = request.headers.get("X-Forwarded-For")
-    if forwarded:
-        return forwarded.split(",")[0].strip()
-    return request.client.host if request.client else "unknown"
+    """Extract client IP from request (resolved once by ClientIPMiddleware)"""
+    return client_ip_from_scope(request.scope)
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)) -> Principal:
     """Get current authenticated user from JWT token"""
     token = request.cookies.get("access_token")
     if not token:
@@ -24,18 +24,33 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> User:
         raise AuthenticationError("Not authenticated")
     
     try:
-        payload = decode_token(token)
+        payload = decode_token_cached(token)
         transtoken = payload.get("transtoken")
     except Exception as e:
         logger.warning(f"Invalid token - IP: {get_client_ip(request)}, Error: {str(e)}")
         raise AuthenticationError("Invalid token")
     
-    user = db.query(User).filter(User.transaction_token == transtoken).first()
+    principal = principal_cache.get(transtoken)
+    if principal is not None:
+        return principal
+    
+    user = (await db.execute(
+        select(User).where(User.transaction_token == transtoken)
+    )).scalars().first()
     if not user:
         logger.warning(f"User not found for token - IP: {get_client_ip(request)}")
         raise AuthenticationError("User not found")
     
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.set(transtoken, principal)
+    return principal
+
+async def require_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """Allow only users with the admin role"""
+    if current_user.role != "admin":
+        logger.warning(f"Admin access denied - User: {current_user.username}")
+        raise AuthenticationError("Admin access required", status_code=403)
+    return current_user
 
 def check_account_lockout(user: User) -> bool:
     """Check if user account is locked"""
@@ -47,8 +62,8 @@ def check_account_lockout(user: User) -> bool:
         user.failed_login_attempts = 0
     return False
 
-def record_failed_login(user: User, db: Session, max_attempts: int = 5):
-    """Record failed login attempt and lock account if necessary"""
+def record_failed_login(user: User, max_attempts: int = 5):
+    """Record failed login attempt and lock account if necessary (committed by the caller)"""
     user.failed_login_attempts += 1
     
     if user.failed_login_attempts >= max_attempts:
@@ -56,12 +71,9 @@ def record_failed_login(user: User, db: Session, max_attempts: int = 5):
         lockout_duration = 15 * 60
         user.locked_until = int(time.time()) + lockout_duration
         logger.warning(f"Account locked - Username: {user.username}, Attempts: {user.failed_login_attempts}")
-    
-    db.commit()
 
-def reset_failed_login_attempts(user: User, db: Session):
-    """Reset failed login attempts after successful login"""
+def reset_failed_login_attempts(user: User):
+    """Reset failed login attempts after successful login (committed by the caller)"""
     user.failed_login_attempts = 0
     user.locked_until = None
-    user.last_login = int(time.time())
-    db.commit()
\ No newline at end of file
+    user.last_login = int(time.time())
\ No newline at end of file
@@ -1,12 +1,268 @@
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+from src.exceptions import ServiceUnavailableError
+from src.settings import (
+    HASH_WORKERS, HASH_MAX_PENDING, ARGON2_TIME_COST, ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM, ARGON2_TARGET_MS, ARGON2_MAX_MEMORY_COST
+)
+
+logger = logging.getLogger(__name__)
+
+ARGON2_MIN_MEMORY_COST = 8 * 1024  # KiB
+ARGON2_MAX_TIME_COST = 10
+
+
+def build_password_context(argon2_params: Optional[dict] = None) -> CryptContext:
+    """Build the password CryptContext, optionally pinning Argon2 cost parameters"""
+    kwargs = {f"argon2__{key}": value for key, value in (argon2_params or {}).items()}
+    return CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto", **kwargs)
+
+
+pwd_context = build_password_context()
+
+
+def _init_worker(argon2_params: Optional[dict]):
+    """Configure the password context inside a pool worker"""
+    global pwd_context
+    pwd_context = build_password_context(argon2_params)
+
+
+def _hash(password: str) -> str:
+    """Hash a password (runs inside a pool worker)"""
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password (runs inside a pool worker)"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    True when a stored hash is weaker than the current target: a deprecated scheme,
+    an older Argon2 variant/version, or less memory x time work. Stronger or equal
+    hashes are kept, so calibration drift between restarts never churns or downgrades them
+    """
+    if pwd_context.identify(hashed_password) != "argon2":
+        return True
+    target = pwd_context.handler("argon2")
+    stored = target.from_string(hashed_password)
+    if stored.type != target.type or stored.version < target.version:
+        return True
+    return stored.memory_cost * stored.rounds < target.memory_cost * target.default_rounds
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and rehash it if it is weaker than the target (runs inside a pool worker)"""
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+
+def measure_argon2(time_cost: int, memory_cost: int, parallelism: int, samples: int = 3) -> float:
+    """Median latency in milliseconds of one Argon2 hash with the given cost"""
+    handler = build_password_context({
+        "time_cost": time_cost,
+        "memory_cost": memory_cost,
+        "parallelism": parallelism
+    }).handler("argon2")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_argon2(
+    target_ms: int,
+    max_memory_cost: int = ARGON2_MAX_MEMORY_COST,
+    parallelism: int = ARGON2_PARALLELISM
+) -> dict:
+    """
+    Pick the strongest Argon2 cost that hashes within target_ms on this machine
+    Memory is maximised first (halving until time_cost=1 fits), then time_cost is raised
+    """
+    memory_cost = max_memory_cost
+    while memory_cost > ARGON2_MIN_MEMORY_COST and \
+            measure_argon2(1, memory_cost, parallelism) > target_ms:
+        memory_cost //= 2
+    memory_cost = max(memory_cost, ARGON2_MIN_MEMORY_COST)
+
+    time_cost = 1
+    while time_cost < ARGON2_MAX_TIME_COST and \
+            measure_argon2(time_cost + 1, memory_cost, parallelism) <= target_ms:
+        time_cost += 1
+
+    params = {"time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism}
+    logger.info(f"Argon2 calibrated for {target_ms}ms - {params}")
+    return params
+
+
+def resolve_argon2_params() -> Optional[dict]:
+    """Argon2 cost from settings, calibration, or None for passlib defaults"""
+    if ARGON2_TIME_COST and ARGON2_MEMORY_COST:
+        return {
+            "time_cost": ARGON2_TIME_COST,
+            "memory_cost": ARGON2_MEMORY_COST,
+            "parallelism": ARGON2_PARALLELISM
+        }
+    if ARGON2_TARGET_MS > 0:
+        return calibrate_argon2(ARGON2_TARGET_MS)
+    return None
+
+
+class HashingExecutor:
+    """
+    Bounded process pool for password hashing
+    Keeps Argon2 work off the request threads and rejects new work
+    with ServiceUnavailableError once max_pending jobs are queued or running
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, 1)
+        self.argon2_params = None
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def configure(self, argon2_params: Optional[dict]):
+        """Apply Argon2 cost parameters here and in the workers"""
+        self.argon2_params = argon2_params
+        _init_worker(argon2_params)
+        with self._lock:
+            running = self._pool is not None
+        if running:
+            self.shutdown()
+            self.start()
+
+    def start(self):
+        """Start the worker processes (no-op when running inline)"""
+        if self.max_workers <= 0:
+            return
+        with self._lock:
+            self._running_pool()
+
+    def _running_pool(self) -> ProcessPoolExecutor:
+        """The current pool, started if needed; caller holds _lock"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.argon2_params,)
+            )
+            logger.info(f"Hashing pool started with {self.max_workers} workers")
+        return self._pool
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+            logger.info("Hashing pool stopped")
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"Hashing pool saturated - Pending: {self._pending}")
+                raise ServiceUnavailableError("Server is busy. Please try again shortly.")
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args) -> Future:
+        """Queue a hashing job, raising ServiceUnavailableError when saturated"""
+        self._acquire()
+        try:
+            if self.max_workers <= 0:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                # Under the lock a concurrent shutdown() or restart cannot swap the pool mid-submit
+                broken = None
+                try:
+                    with self._lock:
+                        pool = self._running_pool()
+                        try:
+                            future = pool.submit(fn, *args)
+                        except BrokenProcessPool:
+                            logger.error("Hashing pool broken - restarting")
+                            broken, self._pool = pool, None
+                            future = self._running_pool().submit(fn, *args)
+                finally:
+                    # Outside the lock: cancelling its futures runs _release
+                    if broken is not None:
+                        broken.shutdown(wait=False, cancel_futures=True)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        """Run a hashing job and block until it completes"""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        """Run a hashing job without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+hashing_executor = HashingExecutor(HASH_WORKERS, HASH_MAX_PENDING)
+
 
 def hash_password(password: str) -> str:
     """Hash a plaintext password using a secure hashing algorithm."""
-    return pwd_context.hash(password)
+    return hashing_executor.run(_hash, password)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plaintext password against a hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing_executor.run(_verify, plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a plaintext password and return a replacement hash when the stored one
+    uses a deprecated scheme (bcrypt) or weaker Argon2 cost; otherwise (valid, None)
+    """
+    return hashing_executor.run(_verify_and_update, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a plaintext password on the hashing pool."""
+    return await hashing_executor.run_async(_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a plaintext password on the hashing pool."""
+    return await hashing_executor.run_async(_verify, plain_password, hashed_password)
+
 
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a plaintext password on the hashing pool, returning a rehash if needed."""
+    return await hashing_executor.run_async(_verify_and_update, plain_password, hashed_password)
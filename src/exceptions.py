@@ -65,6 +65,14 @@ class RateLimitError(Exception):
         super().__init__(self.message)
 
 
+class ServiceUnavailableError(Exception):
+    """Server is temporarily overloaded"""
+    def __init__(self, message: str = "Service temporarily unavailable", retry_after: int = 1):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+
 async def authentication_error_handler(request: Request, exc: AuthenticationError):
     """Handle authentication errors"""
     logger.warning(f"Authentication error: {exc.message} - Path: {request.url.path}")
@@ -149,6 +157,17 @@ async def rate_limit_error_handler(request: Request, exc: RateLimitError):
     )
 
 
+async def service_unavailable_error_handler(request: Request, exc: ServiceUnavailableError):
+    """Handle overload errors"""
+    logger.warning(f"Service unavailable: {exc.message} - Path: {request.url.path}")
+    
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": exc.message},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 async def general_exception_handler(request: Request, exc: Exception):
     """Handle unexpected errors"""
     logger.error(f"Unexpected error: {str(exc)} - Path: {request.url.path}", exc_info=True)
@@ -0,0 +1,366 @@
+"""
+IP address helpers: a compiled CIDR prefix trie, trusted-proxy client IP
+resolution and file-backed IP range sets for allow/blocklists
+
+The trie uses 8-bit strides with prefix expansion, so a lookup is one dict
+lookup per address byte (4 for IPv4, 16 for IPv6) regardless of how many
+ranges are loaded. Nodes are dicts holding only the byte values in use, so a
+long IPv6 prefix costs a few hundred bytes per level rather than a full
+256-way table. It suits small sets such as trusted proxies; large lists use
+IPRangeSet, a pair of sorted interval arrays searched with bisect.
+
+With 100k ranges an IPRangeSet lookup measures about 0.5 us on the build
+container, about 0.9 us with the inet_pton parse as IPFilterMiddleware pays it
+(scripts/bench_ipfilter.py; single core, runs under load measured up to 1.2 us).
+Interpreter call overhead dominates, not the search itself
+"""
+import bisect
+import ipaddress
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+def parse_ip(value: str) -> Optional[IPAddress]:
+    """Parse an address, unwrapping IPv4-mapped IPv6; None if it is not an IP"""
+    try:
+        address = ipaddress.ip_address(value.strip())
+    except (AttributeError, ValueError):
+        return None
+    if address.version == 6 and address.ipv4_mapped is not None:
+        return address.ipv4_mapped
+    return address
+
+
+class CIDRTrie:
+    """
+    Set of IPv4/IPv6 networks with longest-prefix style membership lookups
+    A network whose prefix does not end on a byte boundary is expanded into
+    the byte values it covers at its last level
+
+    Each node maps a byte value to its child node, or to True when every
+    address through that byte matches (a match needs no subtree below it)
+    """
+
+    def __init__(self, networks: Iterable[Union[str, IPNetwork]] = ()):
+        self._roots = {4: {}, 6: {}}
+        self._match_all = {4: False, 6: False}
+        self._count = 0
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: Union[str, IPNetwork]):
+        """Add a network (a bare address is a /32 or /128)"""
+        if isinstance(network, str):
+            network = ipaddress.ip_network(network.strip(), strict=False)
+        self._count += 1
+        prefix_len = network.prefixlen
+        if prefix_len == 0:
+            self._match_all[network.version] = True
+            return
+
+        packed = network.network_address.packed
+        full_bytes, remainder = divmod(prefix_len, 8)
+        node = self._roots[network.version]
+        if remainder == 0:
+            # Ends on a byte boundary: flag the last byte on its parent level
+            full_bytes -= 1
+        for byte in packed[:full_bytes]:
+            child = node.get(byte)
+            if child is True:
+                # Already covered by a shorter prefix
+                return
+            if child is None:
+                child = node[byte] = {}
+            node = child
+
+        first = packed[full_bytes]
+        span = 1 << (8 - remainder) if remainder else 1
+        for byte in range(first, first + span):
+            node[byte] = True
+
+    def contains(self, address: Optional[IPAddress]) -> bool:
+        """Check an already parsed address"""
+        if address is None:
+            return False
+        if self._match_all[address.version]:
+            return True
+        node = self._roots[address.version]
+        for byte in address.packed:
+            node = node.get(byte)
+            if node is None:
+                return False
+            if node is True:
+                return True
+        return False
+
+    def __contains__(self, value: str) -> bool:
+        return self.contains(parse_ip(value))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def parse_networks(value: str) -> list[str]:
+    """Split a comma separated CIDR list from settings"""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def resolve_client_ip(peer: Optional[str], forwarded_for: Optional[str], trusted: CIDRTrie) -> str:
+    """
+    Resolve the originating client IP
+    X-Forwarded-For is only honoured when the peer is a trusted proxy; the chain
+    is then walked right to left and the first hop that is not a trusted proxy
+    is the client. If every hop is trusted, the leftmost one is used
+    """
+    if not peer:
+        return "unknown"
+    if not forwarded_for or not trusted.contains(parse_ip(peer)):
+        return peer
+
+    client = peer
+    for hop in reversed(forwarded_for.split(",")):
+        address = parse_ip(hop)
+        if address is None:
+            # Garbage in the chain: stop at the last hop we could verify
+            break
+        client = str(address)
+        if not trusted.contains(address):
+            break
+    return client
+
+
+IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def pack_ip(value: str) -> Optional[bytes]:
+    """Packed address via inet_pton (4 or 16 bytes, IPv4-mapped unwrapped); None if it is not an IP"""
+    try:
+        return socket.inet_pton(socket.AF_INET, value)
+    except (OSError, TypeError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, value)
+    except (OSError, TypeError):
+        return None
+    return packed[12:] if packed[:12] == IPV4_MAPPED_PREFIX else packed
+
+
+def _merge(intervals: list) -> Tuple[list, list]:
+    """Sort and coalesce overlapping or adjacent [start, end] intervals"""
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            if end > ends[-1]:
+                ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class IPRangeSet:
+    """
+    Immutable set of IPv4/IPv6 networks stored as merged, sorted intervals
+
+    IPv4 bounds live in unsigned 32-bit arrays (8 bytes per range) plus a
+    65537-entry index of where each /16 starts in them, so a lookup bisects
+    only the handful of ranges sharing the address's first two bytes. IPv6
+    bounds are Python ints searched with a plain bisect
+    """
+
+    def __init__(self, networks: Iterable[Union[str, IPNetwork]] = ()):
+        intervals = {4: [], 6: []}
+        entries = 0
+        for network in networks:
+            if isinstance(network, str):
+                network = ipaddress.ip_network(network.strip(), strict=False)
+            intervals[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+            entries += 1
+        self._build(intervals[4], intervals[6], entries)
+
+    @classmethod
+    def from_intervals(cls, v4: list, v6: list, entries: int) -> "IPRangeSet":
+        """Build from (first, last) integer address pairs, as read_intervals returns them"""
+        range_set = cls.__new__(cls)
+        range_set._build(v4, v6, entries)
+        return range_set
+
+    def _build(self, v4: list, v6: list, entries: int):
+        self.entries = entries
+        v4_starts, v4_ends = _merge(v4)
+        self._v4_starts = array("I", v4_starts)
+        self._v4_ends = array("I", v4_ends)
+        self._v4_index = array("I", (bisect.bisect_left(v4_starts, prefix << 16) for prefix in range(65537)))
+        self._v6_starts, self._v6_ends = _merge(v6)
+
+    def contains_packed(self, packed: bytes) -> bool:
+        """Check an address already converted by pack_ip"""
+        value = int.from_bytes(packed, "big")
+        if len(packed) == 4:
+            prefix = packed[0] << 8 | packed[1]
+            index = bisect.bisect_right(
+                self._v4_starts, value, self._v4_index[prefix], self._v4_index[prefix + 1]
+            ) - 1
+            return index >= 0 and value <= self._v4_ends[index]
+        index = bisect.bisect_right(self._v6_starts, value) - 1
+        return index >= 0 and value <= self._v6_ends[index]
+
+    def __contains__(self, value: str) -> bool:
+        packed = pack_ip(value)
+        return packed is not None and self.contains_packed(packed)
+
+    def __len__(self) -> int:
+        """Number of merged ranges"""
+        return len(self._v4_starts) + len(self._v6_starts)
+
+
+def read_intervals(path: str) -> Tuple[list, list, int]:
+    """
+    Read one IP or CIDR per line into (first, last) integer pairs per family
+    Blank lines and # comments are ignored; parsed with inet_pton, not ipaddress objects
+    """
+    v4, v6, entries = [], [], 0
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            entry = line.split("#", 1)[0].strip()
+            if not entry:
+                continue
+            address, _, prefix = entry.partition("/")
+            try:
+                if ":" in address:
+                    family, bits, target = socket.AF_INET6, 128, v6
+                else:
+                    family, bits, target = socket.AF_INET, 32, v4
+                value = int.from_bytes(socket.inet_pton(family, address), "big")
+                prefix_len = int(prefix) if prefix else bits
+                if not 0 <= prefix_len <= bits:
+                    raise ValueError(prefix)
+            except (OSError, ValueError):
+                logger.warning(f"Skipping invalid IP list entry - File: {path}, Line: {line_number}")
+                continue
+            host_mask = (1 << (bits - prefix_len)) - 1
+            first = value & ~host_mask
+            target.append((first, first | host_mask))
+            entries += 1
+    return v4, v6, entries
+
+
+def load_range_set(path: str) -> IPRangeSet:
+    """Parse an IP list file into an IPRangeSet"""
+    return IPRangeSet.from_intervals(*read_intervals(path))
+
+
+class IPListFile:
+    """
+    IPRangeSet loaded from a file and hot-reloaded when the file changes
+    A background thread polls the file's mtime and size every reload_interval
+    seconds and swaps in a set built in a child process, so neither lookups
+    nor other threads wait on a reload: parsing and indexing a large list
+    takes seconds of CPU that would otherwise hold the GIL, and only
+    unpickling the finished set (a few ms) happens here. The child is one
+    spawned worker kept for the life of the file, started on the first
+    reload. If a reload fails the previous set stays in place. close() stops
+    the watcher and the worker; the app lifespan calls it on shutdown
+    """
+
+    def __init__(self, path: str, reload_interval: float = 5):
+        self.path = path
+        self.ranges = IPRangeSet()
+        self.reloads = 0
+        self.errors = 0
+        self.loaded_at = None
+        self._signature = None
+        self._stop = threading.Event()
+        self._watcher = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # The first load happens at start-up, before any request is served
+        self.reload(isolated=False)
+        if reload_interval > 0:
+            self._watcher = threading.Thread(
+                target=self._watch_loop, args=(reload_interval,),
+                name="iplist-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def __contains__(self, value: str) -> bool:
+        return value in self.ranges
+
+    def contains_packed(self, packed: bytes) -> bool:
+        return self.ranges.contains_packed(packed)
+
+    def _watch_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.reload()
+
+    def reload(self, isolated: bool = True) -> bool:
+        """Rebuild the set if the file changed (in a child process when isolated); returns whether it was swapped"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return False
+            ranges = self._load_isolated() if isolated else load_range_set(self.path)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to load IP list - File: {self.path}, Error: {str(e)}")
+            return False
+
+        self.ranges = ranges
+        self._signature = signature
+        self.reloads += 1
+        self.loaded_at = time.time()
+        logger.info(f"IP list loaded - File: {self.path}, Entries: {ranges.entries}, Ranges: {len(ranges)}")
+        return True
+
+    def _load_isolated(self) -> IPRangeSet:
+        with self._pool_lock:
+            if self._stop.is_set():
+                raise RuntimeError("IP list closed")
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        try:
+            return pool.submit(load_range_set, self.path).result()
+        except BrokenProcessPool:
+            # The worker died (e.g. OOM-killed); the next reload starts a new one
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise
+
+    def close(self):
+        """Stop the background watcher and the loader process and wait for both to exit"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "entries": self.ranges.entries,
+            "ranges": len(self.ranges),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "loaded_at": self.loaded_at,
+        }
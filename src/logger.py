@@ -3,13 +3,47 @@ Structured logging configuration for authentication system
 """
 import logging
 import logging.handlers
+import queue
 import sys
+import atexit
 from pathlib import Path
 from datetime import datetime
 
+from src import metrics
+from src.settings import LOG_QUEUE_SIZE, LOG_QUEUE_FULL_POLICY
+
+# (logger, handlers, queue-full policy) routes, built once by setup_logging()
+_routes = []
+# (logger, queue handler, listener) while the listener threads run
+_listeners = []
+_dropped = 0
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler over a bounded queue that drops or blocks when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue, block: bool = False):
+        super().__init__(log_queue)
+        self.block = block
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 def setup_logging():
-    """Configure application logging"""
+    """Configure application logging; handlers run on listener threads (see start_logging)"""
+    root_logger = logging.getLogger()
+    if _routes:
+        # Already configured (another app instance): only restart the listeners
+        start_logging()
+        return root_logger
     
     # Create logs directory if it doesn't exist
     log_dir = Path("logs")
@@ -62,25 +96,75 @@ def setup_logging():
     security_handler.setFormatter(detailed_formatter)
     
     # Configure root logger
-    root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(error_handler)
+    _routes.append((root_logger, [console_handler, file_handler, error_handler], LOG_QUEUE_FULL_POLICY))
     
     # Configure security logger
     security_logger = logging.getLogger('security')
     security_logger.setLevel(logging.INFO)
-    security_logger.addHandler(security_handler)
     security_logger.propagate = False
+    # Security events are never dropped: a full queue makes the caller wait instead
+    _routes.append((security_logger, [security_handler], "block"))
+    
+    for logger, handlers, _ in _routes:
+        for handler in handlers:
+            logger.addHandler(handler)
     
     # Suppress noisy loggers
     logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
     logging.getLogger('uvicorn.access').setLevel(logging.WARNING)
     
+    start_logging()
     return root_logger
 
 
+def start_logging():
+    """Move the handlers behind bounded queues drained by listener threads"""
+    if _listeners or not LOG_QUEUE_SIZE:
+        return
+    for logger, handlers, policy in _routes:
+        queue_handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE), block=policy == "block")
+        listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        listener.start()
+        logger.addHandler(queue_handler)
+        for handler in handlers:
+            logger.removeHandler(handler)
+        _listeners.append((logger, queue_handler, listener))
+
+
+def stop_logging():
+    """Flush queued records and stop the listeners; later records are written synchronously"""
+    global _dropped
+    dropped = 0
+    while _listeners:
+        logger, queue_handler, listener = _listeners.pop()
+        # Swap the handlers back first so nothing is enqueued behind the stop sentinel
+        for handler in listener.handlers:
+            logger.addHandler(handler)
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.flush()
+        dropped += queue_handler.dropped
+    _dropped += dropped
+    if dropped:
+        logging.getLogger(__name__).warning(f"Log records dropped, queue full - Count: {dropped}")
+
+
+def logging_stats() -> dict:
+    return {
+        "running": bool(_listeners),
+        "queued": sum(queue_handler.queue.qsize() for _, queue_handler, _ in _listeners),
+        "max_queue": LOG_QUEUE_SIZE,
+        "policy": LOG_QUEUE_FULL_POLICY,
+        "dropped": _dropped + sum(queue_handler.dropped for _, queue_handler, _ in _listeners),
+    }
+
+
+atexit.register(stop_logging)
+metrics.register("logging", logging_stats)
+
+
 def get_security_logger():
     """Get security audit logger"""
     return logging.getLogger('security')
@@ -0,0 +1,50 @@
+"""
+In-process metrics registry
+Components register a callable returning a dict of counters/gauges;
+collect() snapshots all of them for the metrics endpoint
+"""
+import bisect
+import threading
+from typing import Callable, Dict
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, collector: Callable[[], dict]):
+    """Register (or replace) a named metrics source"""
+    _collectors[name] = collector
+
+
+def collect() -> dict:
+    """Snapshot every registered metrics source"""
+    return {name: collector() for name, collector in list(_collectors.items())}
+
+
+class Histogram:
+    """Fixed-bucket histogram (upper bounds in the unit observed) with count and sum"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        # Cumulative, like Prometheus "le" buckets
+        buckets, running = {}, 0
+        for bound, n in zip(self.bounds, counts):
+            running += n
+            buckets[f"le_{bound:g}"] = running
+        buckets["le_inf"] = count
+        return {"count": count, "sum": round(total, 3), "buckets": buckets}
@@ -1,197 +1,373 @@
 """
 Security middleware for authentication system
-Includes CSRF protection, rate limiting, and security headers
+Includes client IP resolution, IP allow/blocklists, CSRF protection, rate limiting,
+and security headers
+
+All of them are plain ASGI callables rather than BaseHTTPMiddleware subclasses,
+so they add no per-request task or stream wrapping
 """
-from fastapi import Request, HTTPException
+from fastapi import Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.middleware.trustedhost import TrustedHostMiddleware
-from starlette.middleware.cors import CORSMiddleware
-from starlette.datastructures import Headers
-import time
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from urllib.parse import unquote_plus
+import base64
+import hashlib
+import hmac
+import re
 import secrets
-from collections import defaultdict
-from datetime import datetime, timedelta
+import time
 import logging
+from src import metrics
+from src.ipnet import CIDRTrie, IPListFile, pack_ip, resolve_client_ip
+from src.ratelimit import create_rate_limiter
 
 logger = logging.getLogger(__name__)
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+# Content Security Policy
+CONTENT_SECURITY_POLICY = (
+    "default-src 'self'; "
+    "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+    "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
+    "img-src 'self' data: https:; "
+    "font-src 'self' https://cdn.jsdelivr.net; "
+    "connect-src 'self'; "
+    "frame-ancestors 'none';"
+)
+
+# Encoded once at import; appended to every http.response.start
+SECURITY_HEADERS = [
+    (name.lower().encode("latin-1"), value.encode("latin-1"))
+    for name, value in (
+        ("X-Content-Type-Options", "nosniff"),
+        ("X-Frame-Options", "DENY"),
+        ("X-XSS-Protection", "1; mode=block"),
+        ("Strict-Transport-Security", "max-age=31536000; includeSubDomains"),
+        ("Referrer-Policy", "strict-origin-when-cross-origin"),
+        ("Permissions-Policy", "geolocation=(), microphone=(), camera=()"),
+        ("Content-Security-Policy", CONTENT_SECURITY_POLICY),
+    )
+]
+SECURITY_HEADER_NAMES = frozenset(name for name, _ in SECURITY_HEADERS)
+
+
+class SecurityHeadersMiddleware:
     """Add security headers to all responses"""
-    
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Security Headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-        
-        # Content Security Policy
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' https://cdn.jsdelivr.net; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
-        )
-        response.headers["Content-Security-Policy"] = csp
-        
-        return response
 
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = [
+                    header for header in message.get("headers", ())
+                    if header[0].lower() not in SECURITY_HEADER_NAMES
+                ]
+                headers.extend(SECURITY_HEADERS)
+                message["headers"] = headers
+            await send(message)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+        await self.app(scope, receive, send_with_headers)
+
+
+def client_ip_from_scope(scope) -> str:
+    """Client IP resolved by ClientIPMiddleware, or the socket peer without it"""
+    client_ip = scope.get("client_ip")
+    if client_ip is None:
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+    return client_ip
+
+
+class ClientIPMiddleware:
+    """
+    Resolve the client IP once per request and store it in scope["client_ip"]
+    X-Forwarded-For is only trusted when the peer is in the trusted proxy set
+    """
+
+    def __init__(self, app, trusted_proxies=()):
+        self.app = app
+        self.trusted = trusted_proxies if isinstance(trusted_proxies, CIDRTrie) else CIDRTrie(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            client = scope.get("client")
+            peer = client[0] if client else None
+            forwarded_for = None
+            if len(self.trusted):
+                for name, value in scope.get("headers", ()):
+                    if name == b"x-forwarded-for":
+                        # Repeated headers form one chain, in order
+                        chunk = value.decode("latin-1")
+                        forwarded_for = chunk if forwarded_for is None else f"{forwarded_for},{chunk}"
+            scope["client_ip"] = resolve_client_ip(peer, forwarded_for, self.trusted)
+        await self.app(scope, receive, send)
+
+
+class IPFilterMiddleware:
+    """
+    Reject blocklisted IPs before any rate limiting or DB work
+    Allowlisted IPs bypass the blocklist and are marked in scope["ip_allowlisted"]
+    so RateLimitMiddleware skips them. Both lists are hot-reloaded from their files
+    until close()
+    """
+
+    def __init__(self, app, blocklist_path: str = None, allowlist_path: str = None,
+                 reload_interval: float = 5):
+        self.app = app
+        self.blocklist = IPListFile(blocklist_path, reload_interval) if blocklist_path else None
+        self.allowlist = IPListFile(allowlist_path, reload_interval) if allowlist_path else None
+        self.blocked = 0
+        metrics.register("ip_filter", self.stats)
+
+    def stats(self) -> dict:
+        return {
+            "blocked": self.blocked,
+            "blocklist": self.blocklist.stats() if self.blocklist else None,
+            "allowlist": self.allowlist.stats() if self.allowlist else None,
+        }
+
+    def close(self):
+        """Stop the reload watchers and loader processes of both lists"""
+        for ip_list in (self.blocklist, self.allowlist):
+            if ip_list is not None:
+                ip_list.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            if scope["type"] == "lifespan" and "app" in scope:
+                # Lets the app lifespan close the lists on shutdown
+                scope["app"].state.ip_filter = self
+            return await self.app(scope, receive, send)
+
+        ip = client_ip_from_scope(scope)
+        packed = pack_ip(ip)
+        if packed is not None:
+            # Read the current sets directly: one call per list on the per-request path
+            if self.allowlist and self.allowlist.ranges.contains_packed(packed):
+                scope["ip_allowlisted"] = True
+            elif self.blocklist and self.blocklist.ranges.contains_packed(packed):
+                self.blocked += 1
+                logger.warning(f"Blocked IP rejected - IP: {ip}, Path: {scope['path']}")
+                if scope["type"] == "websocket":
+                    return await send({"type": "websocket.close", "code": 1008})
+                response = JSONResponse(
+                    status_code=403,
+                    content={"detail": "Access denied"}
+                )
+                return await response(scope, receive, send)
+
+        await self.app(scope, receive, send)
+
+
+class RateLimitMiddleware:
     """
     Rate limiting middleware to prevent brute force attacks
     Limits requests per IP address
     """
-    
-    def __init__(self, app, requests_per_minute: int = 60, requests_per_hour: int = 300):
-        super().__init__(app)
+
+    def __init__(self, app, requests_per_minute: int = 60, requests_per_hour: int = 300,
+                 max_memory_mb: int = 64, sweep_interval: float = 60,
+                 backend: str = "memory", shm_path: str = None, redis_url: str = None):
+        self.app = app
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
-        self.minute_requests = defaultdict(list)
-        self.hour_requests = defaultdict(list)
-        self.blocked_ips = {}
-    
-    def get_client_ip(self, request: Request) -> str:
-        """Extract client IP from request"""
-        forwarded = request.headers.get("X-Forwarded-For")
-        if forwarded:
-            return forwarded.split(",")[0].strip()
-        return request.client.host if request.client else "unknown"
-    
+        self.limiter = create_rate_limiter(
+            backend,
+            requests_per_minute,
+            requests_per_hour,
+            max_memory_mb=max_memory_mb,
+            sweep_interval=sweep_interval,
+            shm_path=shm_path,
+            redis_url=redis_url
+        )
+        metrics.register("rate_limit", self.limiter.stats)
+
+    def get_client_ip(self, scope) -> str:
+        """Extract client IP from the ASGI scope"""
+        return client_ip_from_scope(scope)
+
     def is_rate_limited(self, ip: str) -> tuple[bool, str]:
         """Check if IP is rate limited"""
-        now = datetime.now()
-        
-        # Check if IP is blocked
-        if ip in self.blocked_ips:
-            if now < self.blocked_ips[ip]:
-                remaining = (self.blocked_ips[ip] - now).seconds
-                return True, f"IP blocked. Try again in {remaining} seconds"
-            else:
-                del self.blocked_ips[ip]
-        
-        # Clean old requests (minute)
-        minute_ago = now - timedelta(minutes=1)
-        self.minute_requests[ip] = [
-            req_time for req_time in self.minute_requests[ip] 
-            if req_time > minute_ago
-        ]
-        
-        # Clean old requests (hour)
-        hour_ago = now - timedelta(hours=1)
-        self.hour_requests[ip] = [
-            req_time for req_time in self.hour_requests[ip] 
-            if req_time > hour_ago
-        ]
-        
-        # Check minute limit
-        if len(self.minute_requests[ip]) >= self.requests_per_minute:
-            # Block for 5 minutes
-            self.blocked_ips[ip] = now + timedelta(minutes=5)
-            logger.warning(f"Rate limit exceeded for IP {ip} - blocked for 5 minutes")
-            return True, "Too many requests. Try again in 5 minutes"
-        
-        # Check hour limit
-        if len(self.hour_requests[ip]) >= self.requests_per_hour:
-            return True, "Hourly rate limit exceeded. Try again later"
-        
-        # Add current request
-        self.minute_requests[ip].append(now)
-        self.hour_requests[ip].append(now)
-        
-        return False, ""
-    
-    async def dispatch(self, request: Request, call_next):
-        # Skip rate limiting for static files
-        if request.url.path.startswith("/static"):
-            return await call_next(request)
-        
-        ip = self.get_client_ip(request)
-        is_limited, message = self.is_rate_limited(ip)
-        
+        return self.limiter.hit(ip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" and "app" in scope:
+            # Lets the app lifespan close the limiter (sweeper thread, mmap, Redis client) on shutdown
+            scope["app"].state.rate_limiter = self.limiter
+        # Skip rate limiting for static files and allowlisted IPs
+        if scope["type"] != "http" or scope["path"].startswith("/static") or scope.get("ip_allowlisted"):
+            return await self.app(scope, receive, send)
+
+        ip = self.get_client_ip(scope)
+        if self.limiter.blocking:
+            is_limited, message = await run_in_threadpool(self.is_rate_limited, ip)
+        else:
+            is_limited, message = self.is_rate_limited(ip)
+
         if is_limited:
             logger.warning(f"Rate limit hit for {ip}: {message}")
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=429,
                 content={"detail": message}
             )
-        
-        response = await call_next(request)
-        return response
+            return await response(scope, receive, send)
+
+        await self.app(scope, receive, send)
+
+
+def _csrf_session(cookies: dict) -> str:
+    """Identify the session a CSRF token is bound to (anonymous before login)"""
+    access_token = cookies.get("access_token")
+    return hashlib.sha256(access_token.encode()).hexdigest() if access_token else ""
+
+
+def _csrf_signature(secret: bytes, session: str, nonce: str, timestamp: str) -> str:
+    digest = hmac.new(secret, f"{session}|{nonce}|{timestamp}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
 
+def make_csrf_token(secret: bytes, session: str, now: float = None) -> str:
+    """Issue a token of the form nonce.timestamp.HMAC(session|nonce|timestamp)"""
+    nonce = secrets.token_urlsafe(16)
+    timestamp = str(int(time.time() if now is None else now))
+    return f"{nonce}.{timestamp}.{_csrf_signature(secret, session, nonce, timestamp)}"
+
+
+def verify_csrf_token(secret: bytes, session: str, token: str, max_age: int, now: float = None) -> bool:
+    """Check a token's signature, session binding and age without any server state"""
+    try:
+        nonce, timestamp, signature = token.split(".")
+        issued = int(timestamp)
+    except (AttributeError, ValueError):
+        return False
+    age = (time.time() if now is None else now) - issued
+    if age < 0 or age > max_age:
+        return False
+    return hmac.compare_digest(signature, _csrf_signature(secret, session, nonce, timestamp))
+
+
+class CSRFMiddleware:
+    """
+    CSRF protection middleware (signed double-submit tokens)
+
+    Tokens are HMAC-signed over the session and issue time, so they are validated
+    without server-side state and cannot be planted by another origin. Unsafe
+    requests must echo the cookie token in the X-CSRF-Token header or a
+    csrf_token form field. The form field is found by scanning the urlencoded
+    body as it streams in; the chunks read so far are replayed to the endpoint
+    and the rest passes through untouched, so the form is only parsed once
+    """
 
-class CSRFMiddleware(BaseHTTPMiddleware):
-    """CSRF protection middleware"""
-    
     SAFE_METHODS = {"GET", "HEAD", "OPTIONS", "TRACE"}
     CSRF_COOKIE_NAME = "csrf_token"
     CSRF_HEADER_NAME = "X-CSRF-Token"
-    
-    async def dispatch(self, request: Request, call_next):
+    CSRF_FIELD = re.compile(rb"(?:^|&)csrf_token=([^&]*)&")
+    CSRF_FIELD_AT_END = re.compile(rb"(?:^|&)csrf_token=([^&]*)$")
+    MAX_SCAN_BYTES = 64 * 1024
+
+    def __init__(self, app, secret: str, max_age: int = 3600, secure: bool = True):
+        self.app = app
+        self.secret = secret.encode()
+        self.max_age = max_age
+        self.secure = secure
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = Headers(scope=scope)
+        cookies = cookie_parser(headers.get("cookie", ""))
+        session = _csrf_session(cookies)
+        cookie_token = cookies.get(self.CSRF_COOKIE_NAME)
+
         # Skip CSRF for safe methods
-        if request.method in self.SAFE_METHODS:
-            response = await call_next(request)
-            
-            # Set CSRF token cookie if not present
-            if self.CSRF_COOKIE_NAME not in request.cookies:
-                csrf_token = secrets.token_urlsafe(32)
-                response.set_cookie(
-                    key=self.CSRF_COOKIE_NAME,
-                    value=csrf_token,
-                    httponly=True,
-                    secure=True,
-                    samesite="strict",
-                    max_age=3600
-                )
-            
-            return response
-        
-        # For unsafe methods, verify CSRF token
-        cookie_token = request.cookies.get(self.CSRF_COOKIE_NAME)
-        
-        # Check form data first
-        if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
-            form = await request.form()
-            form_token = form.get("csrf_token")
-        else:
-            form_token = None
-        
-        # Check header
-        header_token = request.headers.get(self.CSRF_HEADER_NAME)
-        
-        # Get token from either form or header
-        request_token = form_token or header_token
-        
+        if scope["method"] in self.SAFE_METHODS:
+            if cookie_token and verify_csrf_token(self.secret, session, cookie_token, self.max_age // 2):
+                scope["csrf_token"] = cookie_token
+                return await self.app(scope, receive, send)
+
+            # Issue a token for this session (missing, expiring, or bound to the pre-login session)
+            csrf_token = scope["csrf_token"] = make_csrf_token(self.secret, session)
+
+            async def send_with_cookie(message):
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("set-cookie", self._cookie(csrf_token))
+                await send(message)
+
+            return await self.app(scope, receive, send_with_cookie)
+
+        # For unsafe methods, verify CSRF token; the header is checked first since it is free
+        request_token = headers.get(self.CSRF_HEADER_NAME)
+        if not request_token and headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            request_token, receive = await self._scan_form_token(receive)
+
         if not cookie_token or not request_token:
-            logger.warning(f"CSRF token missing for {request.url.path}")
-            return JSONResponse(
+            logger.warning(f"CSRF token missing for {scope['path']}")
+            response = JSONResponse(
                 status_code=403,
                 content={"detail": "CSRF token missing"}
             )
-        
-        if not secrets.compare_digest(cookie_token, request_token):
-            logger.warning(f"CSRF token mismatch for {request.url.path}")
-            return JSONResponse(
+            return await response(scope, receive, send)
+
+        if not secrets.compare_digest(cookie_token, request_token) or \
+                not verify_csrf_token(self.secret, session, request_token, self.max_age):
+            logger.warning(f"CSRF token mismatch for {scope['path']}")
+            response = JSONResponse(
                 status_code=403,
                 content={"detail": "CSRF token invalid"}
             )
-        
-        response = await call_next(request)
-        return response
+            return await response(scope, receive, send)
+
+        scope["csrf_token"] = cookie_token
+        await self.app(scope, receive, send)
+
+    def _cookie(self, token: str) -> str:
+        cookie = f"{self.CSRF_COOKIE_NAME}={token}; HttpOnly; Max-Age={self.max_age}; Path=/; SameSite=strict"
+        return cookie + "; Secure" if self.secure else cookie
+
+    async def _scan_form_token(self, receive):
+        """
+        Read the body only until the csrf_token field is complete
+        Returns the token (or None) and a receive that replays what was read
+        """
+        buffered = bytearray()
+        more_body = True
+        token = None
+        while more_body and len(buffered) <= self.MAX_SCAN_BYTES:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            buffered += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            match = self.CSRF_FIELD.search(buffered) or \
+                (not more_body and self.CSRF_FIELD_AT_END.search(buffered))
+            if match:
+                token = unquote_plus(match.group(1).decode("latin-1"))
+                break
+
+        replayed = False
+        body = bytes(buffered)
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": more_body}
+            return await receive()
+
+        return token, replay
 
 
 def get_csrf_token(request: Request) -> str:
-    """Get CSRF token from request cookies"""
-    token = request.cookies.get(CSRFMiddleware.CSRF_COOKIE_NAME)
+    """CSRF token to embed in forms rendered for this request"""
+    token = request.scope.get("csrf_token") or request.cookies.get(CSRFMiddleware.CSRF_COOKIE_NAME)
     if not token:
         token = secrets.token_urlsafe(32)
     return token
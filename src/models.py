@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship, declarative_base
 import time
 
@@ -32,18 +32,13 @@ class User(Base):
         back_populates="user",
         cascade="all, delete-orphan"
     )
-    audit_logs = relationship(
-        "AuditLog",
-        back_populates="user",
-        cascade="all, delete-orphan"
-    )
 
 
 class EmailVerifications(Base):
     __tablename__ = 'email_verifications'
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     token = Column(String(255), nullable=False, unique=True)
     token_exp = Column(Integer, nullable=False)
     is_used = Column(Boolean, default=False, nullable=False)
@@ -56,7 +51,7 @@ class PasswordReset(Base):
     __tablename__ = 'password_reset'
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     token = Column(String(255), nullable=False, unique=True)
     token_exp = Column(Integer, nullable=False)
     is_used = Column(Boolean, default=False, nullable=False)
@@ -67,14 +62,43 @@ class PasswordReset(Base):
 
 class AuditLog(Base):
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        # user_id first: per-user history by time
+        Index('ix_audit_logs_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_audit_logs_created_at', 'created_at'),
+        # Filter column + created_at for the keyset-paginated audit query
+        Index('ix_audit_logs_action_created_at', 'action', 'created_at'),
+        Index('ix_audit_logs_status_created_at', 'status', 'created_at'),
+        Index('ix_audit_logs_ip_address_created_at', 'ip_address', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    # No foreign key: partitioned tables cannot carry one, and audit history outlives the user
+    user_id = Column(Integer, nullable=True)
     action = Column(String(100), nullable=False)  # login, logout, password_change, etc.
     ip_address = Column(String(45), nullable=True)  # IPv4 or IPv6
     user_agent = Column(String(255), nullable=True)
     status = Column(String(20), nullable=False)  # success, failed
     details = Column(Text, nullable=True)
     created_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+
+
+class AuditRollup(Base):
+    """Audit event counts per hour x action x status, kept up to date by the audit writer"""
+    __tablename__ = 'audit_rollups'
+    
+    bucket = Column(Integer, primary_key=True)  # Unix timestamp of the hour
+    action = Column(String(100), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    events = Column(Integer, nullable=False, default=0)
+
+
+class AuditIPRollup(Base):
+    """Heaviest client IPs per hour x action x status (counts are lower bounds)"""
+    __tablename__ = 'audit_ip_rollups'
     
-    user = relationship("User", back_populates="audit_logs")
+    bucket = Column(Integer, primary_key=True)  # Unix timestamp of the hour
+    action = Column(String(100), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    ip_address = Column(String(45), primary_key=True)
+    events = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,214 @@
+"""
+Monthly partitions for audit_logs
+
+MySQL: audit_logs is RANGE-partitioned on created_at (migration 0003), one
+partition per UTC month named pYYYYMM plus a pmax catch-all. The server
+prunes partitions for created_at ranges on its own; maintenance splits the
+coming months off pmax ahead of time.
+
+SQLite: every month is its own table, audit_logs_YYYYMM, created on first
+write with the audit_logs columns and indexes. Reads list the month tables
+that overlap the requested time range and query only those. The audit_logs
+table itself is only the template there.
+
+Retention drops whole partitions (or month tables) instead of deleting rows.
+"""
+import asyncio
+import calendar
+import logging
+import re
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Index, MetaData, Table, insert, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from src.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+Month = Tuple[int, int]
+
+TABLE_PREFIX = "audit_logs_"
+# SQLite month tables number their ids from YYYYMM * ID_STRIDE so ids stay unique across months
+ID_STRIDE = 10 ** 9
+
+_MONTH_TABLE = re.compile(r"^audit_logs_(\d{4})(\d{2})$")
+_metadata = MetaData()
+
+
+def month_of(timestamp: float) -> Month:
+    moment = time.gmtime(timestamp)
+    return moment.tm_year, moment.tm_mon
+
+
+def add_months(month: Month, count: int) -> Month:
+    index = month[0] * 12 + month[1] - 1 + count
+    return index // 12, index % 12 + 1
+
+
+def month_start(month: Month) -> int:
+    return calendar.timegm((month[0], month[1], 1, 0, 0, 0))
+
+
+def month_key(month: Month) -> str:
+    return f"{month[0]:04d}{month[1]:02d}"
+
+
+def _native(conn: Connection) -> bool:
+    return conn.dialect.name == "mysql"
+
+
+def _per_month_tables(conn: Connection) -> bool:
+    return conn.dialect.name == "sqlite"
+
+
+def month_table(month: Month) -> Table:
+    """audit_logs_YYYYMM with the audit_logs columns and indexes (SQLite)"""
+    name = TABLE_PREFIX + month_key(month)
+    if name in _metadata.tables:
+        return _metadata.tables[name]
+    template = AuditLog.__table__
+    table = Table(name, _metadata, *(column._copy() for column in template.columns), sqlite_autoincrement=True)
+    for index in template.indexes:
+        Index(index.name.replace("ix_audit_logs_", f"ix_{name}_"), *(table.c[column.name] for column in index.columns))
+    return table
+
+
+def sqlite_months(conn: Connection) -> List[Month]:
+    names = conn.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'audit_logs_%'")
+    ).scalars()
+    return sorted((int(match[1]), int(match[2])) for match in map(_MONTH_TABLE.match, names) if match)
+
+
+def _create_month_table(conn: Connection, month: Month):
+    table = month_table(month)
+    conn.execute(CreateTable(table, if_not_exists=True))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    conn.execute(
+        text("INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+             "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+        {"name": table.name, "seq": int(month_key(month)) * ID_STRIDE}
+    )
+
+
+def mysql_partitions(conn: Connection) -> List[Tuple[str, Optional[int]]]:
+    """(name, exclusive upper bound) of every audit_logs partition; bound None is MAXVALUE"""
+    rows = conn.execute(text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'audit_logs' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    ))
+    return [(name, None if bound == "MAXVALUE" else int(bound)) for name, bound in rows]
+
+
+def partition_clause(month: Month) -> str:
+    return f"PARTITION p{month_key(month)} VALUES LESS THAN ({month_start(add_months(month, 1))})"
+
+
+def insert_rows(conn: Connection, rows: list):
+    """Insert audit rows, routing each to its month table on SQLite"""
+    if not _per_month_tables(conn):
+        conn.execute(insert(AuditLog.__table__), rows)
+        return
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(month_of(row["created_at"]), []).append(row)
+    existing = set(sqlite_months(conn))
+    for month, group in sorted(by_month.items()):
+        if month not in existing:
+            _create_month_table(conn, month)
+        conn.execute(insert(month_table(month)), group)
+
+
+def partition_tables(conn: Connection, since: Optional[int] = None, until: Optional[int] = None,
+                     newest_first: bool = True) -> List[Table]:
+    """Tables to read for created_at in [since, until); MySQL prunes its own partitions"""
+    if not _per_month_tables(conn):
+        return [AuditLog.__table__]
+    tables = [
+        month_table(month) for month in sqlite_months(conn)
+        if (since is None or month_start(add_months(month, 1)) > since)
+        and (until is None or month_start(month) < until)
+    ]
+    return tables[::-1] if newest_first else tables
+
+
+async def partition_tables_async(db: AsyncSession, since: Optional[int] = None, until: Optional[int] = None,
+                                 newest_first: bool = True) -> List[Table]:
+    """partition_tables() for an async session; only SQLite needs the catalog lookup"""
+    if db.get_bind().dialect.name != "sqlite":
+        return [AuditLog.__table__]
+    return await db.run_sync(
+        lambda session: partition_tables(session.connection(), since, until, newest_first)
+    )
+
+
+def ensure_partitions(conn: Connection, months_ahead: int, now: Optional[float] = None) -> List[str]:
+    """Create partitions for the current month and `months_ahead` more; returns the new ones"""
+    current = month_of(now if now is not None else time.time())
+    wanted = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    if _native(conn):
+        partitions = mysql_partitions(conn)
+        if not partitions:
+            logger.warning("audit_logs is not partitioned - run migration 0003")
+            return []
+        highest = max((bound for _, bound in partitions if bound is not None), default=0)
+        # Only months past the last bounded partition can be split off pmax
+        missing = [month for month in wanted if month_start(add_months(month, 1)) > highest]
+        if missing:
+            clauses = ", ".join(partition_clause(month) for month in missing)
+            conn.execute(text(
+                f"ALTER TABLE audit_logs REORGANIZE PARTITION pmax INTO "
+                f"({clauses}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            ))
+    elif _per_month_tables(conn):
+        existing = set(sqlite_months(conn))
+        missing = [month for month in wanted if month not in existing]
+        for month in missing:
+            _create_month_table(conn, month)
+    else:
+        return []
+    return [month_key(month) for month in missing]
+
+
+def drop_partitions_before(conn: Connection, cutoff: Month) -> List[str]:
+    """Drop every partition that ends on or before the start of `cutoff`; returns their names"""
+    if _native(conn):
+        boundary = month_start(cutoff)
+        old = [name for name, bound in mysql_partitions(conn) if bound is not None and bound <= boundary]
+        if old:
+            conn.execute(text(f"ALTER TABLE audit_logs DROP PARTITION {', '.join(old)}"))
+        return old
+    if not _per_month_tables(conn):
+        return []
+    old = [month_table(month).name for month in sqlite_months(conn) if month < cutoff]
+    for name in old:
+        conn.execute(text(f'DROP TABLE "{name}"'))
+    return old
+
+
+def maintain_partitions(conn: Connection, retention_months: int, months_ahead: int,
+                        now: Optional[float] = None) -> dict:
+    """Create upcoming partitions and drop the ones past retention (0 keeps everything)"""
+    current = month_of(now if now is not None else time.time())
+    created = ensure_partitions(conn, months_ahead, now)
+    dropped = drop_partitions_before(conn, add_months(current, -retention_months)) if retention_months else []
+    if created or dropped:
+        logger.info(f"Audit partitions maintained - Created: {created}, Dropped: {dropped}")
+    return {"created": created, "dropped": dropped}
+
+
+async def maintenance_loop(engine: AsyncEngine, retention_months: int, months_ahead: int, interval: float):
+    """Partition maintenance, run as a task for the app's lifetime"""
+    while True:
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(maintain_partitions, retention_months, months_ahead)
+        except Exception as e:
+            logger.error(f"Audit partition maintenance failed - Error: {str(e)}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,154 @@
+"""
+Read-replica routing for SQLAlchemy sessions
+
+RoutingSession sends plain SELECTs to a healthy replica (round-robin) and
+everything else - flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE - to the
+primary. Once the session has flushed a write, or a handler called
+pin_primary(), every later read in that session goes to the primary too, so a
+request always sees its own writes.
+
+Replicas that fail a connection are taken out of rotation until a health
+check (SELECT 1) succeeds again.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from typing import Iterable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+USE_PRIMARY = "use_primary"
+
+
+class ReplicaSet:
+    """Round-robin over healthy replica engines (sync or async)"""
+
+    def __init__(self, engines: Iterable = ()):
+        self.engines = list(engines)
+        self._sync_engines = [
+            engine.sync_engine if isinstance(engine, AsyncEngine) else engine for engine in self.engines
+        ]
+        self._healthy = set(range(len(self.engines)))
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        for index, engine in enumerate(self._sync_engines):
+            event.listen(engine, "handle_error", self._on_error(index))
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def _on_error(self, index: int):
+        def handle_error(context):
+            # Connect failures (no connection yet) and dropped connections take the replica out
+            if context.connection is None or context.is_disconnect:
+                self.mark_down(index, context.original_exception)
+        return handle_error
+
+    def mark_down(self, index: int, error=None):
+        with self._lock:
+            if index not in self._healthy:
+                return
+            self._healthy.discard(index)
+        logger.warning(f"Replica {index} marked down - Error: {str(error)}")
+
+    def mark_up(self, index: int):
+        with self._lock:
+            if index in self._healthy:
+                return
+            self._healthy.add(index)
+        logger.info(f"Replica {index} back in rotation")
+
+    def choose(self) -> Optional[Engine]:
+        """Next healthy replica, or None when all are down"""
+        if not self.engines:
+            return None
+        with self._lock:
+            healthy = sorted(self._healthy)
+            if not healthy:
+                self.fallbacks += 1
+                return None
+            self.routed += 1
+            return self._sync_engines[healthy[next(self._counter) % len(healthy)]]
+
+    def check(self):
+        """Probe every sync replica and update its health"""
+        for index, engine in enumerate(self._sync_engines):
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+            except Exception as e:
+                self.mark_down(index, e)
+            else:
+                self.mark_up(index)
+
+    async def check_async(self):
+        """Probe every async replica and update its health"""
+        for index, engine in enumerate(self.engines):
+            try:
+                async with engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except Exception as e:
+                self.mark_down(index, e)
+            else:
+                self.mark_up(index)
+
+    async def monitor(self, interval: float):
+        """Health-check loop, run as a task for the app's lifetime"""
+        while True:
+            await self.check_async()
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for engine in self.engines:
+            if isinstance(engine, AsyncEngine):
+                await engine.dispose()
+            else:
+                engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.engines),
+            "healthy": len(self._healthy),
+            "routed_reads": self.routed,
+            "primary_fallbacks": self.fallbacks,
+        }
+
+
+def _is_plain_read(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session that routes plain reads to replicas and pins to the primary after a write"""
+
+    def __init__(self, replicas: ReplicaSet = None, **kw):
+        super().__init__(**kw)
+        self.replicas = replicas
+        if replicas:
+            event.listen(self, "after_flush", _pin_after_flush)
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (self.replicas and not self._flushing and not self.info.get(USE_PRIMARY)
+                and _is_plain_read(clause)):
+            replica = self.replicas.choose()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def _pin_after_flush(session, flush_context):
+    session.info[USE_PRIMARY] = True
+
+
+def pin_primary(session):
+    """Send every further query of this session (sync or async) to the primary"""
+    session.info[USE_PRIMARY] = True
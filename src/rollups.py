@@ -0,0 +1,224 @@
+"""
+Pre-aggregated audit rollups
+
+The audit writer feeds every row that reached the database into a
+RollupAccumulator: an exact event count per hour x action x status, plus a
+Space-Saving sketch of client IPs per key. write_rollups() adds both onto
+audit_rollups / audit_ip_rollups with upserts, so a dashboard reads a few
+hundred rollup rows instead of scanning audit_logs.
+
+The sketch keeps at most `sketch_size` IPs per key. Any IP with more than
+n / sketch_size of a key's n events in a flush window is guaranteed to be
+kept, and its count overestimates by at most the count of the IP it
+evicted. Only the `top_ips` heaviest per key are written per flush, so the
+stored counts are lower bounds of the true totals.
+
+rebuild_rollups() recomputes whole hours exactly from the audit partitions
+(backfill or repair of closed hours).
+"""
+import heapq
+import time
+from collections import Counter
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, desc, func, insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import AuditIPRollup, AuditRollup
+from src.partitions import partition_tables
+
+HOUR = 3600
+
+Key = Tuple[int, str, str]
+
+
+def hour_of(timestamp: float) -> int:
+    return int(timestamp) - int(timestamp) % HOUR
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters sketch over at most `capacity` items"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self.counts: Dict[str, int] = {}
+        # One (count, item) entry per tracked item; counts only grow, so stale entries are fixed when they surface
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, count: int = 1):
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            heapq.heappush(self._heap, (count, item))
+        else:
+            heap = self._heap
+            while counts[heap[0][1]] != heap[0][0]:
+                victim = heap[0][1]
+                heapq.heapreplace(heap, (counts[victim], victim))
+            # The newcomer inherits the smallest count: an upper bound of what it may have had
+            floor = counts.pop(heap[0][1])
+            counts[item] = floor + count
+            heapq.heapreplace(heap, (floor + count, item))
+
+    def merge(self, other: "SpaceSaving"):
+        for item, count in other.counts.items():
+            self.add(item, count)
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=itemgetter(1))
+
+
+class RollupAccumulator:
+    """Rollup deltas collected since the last flush"""
+
+    def __init__(self, top_ips: int = 20, sketch_size: int = 200):
+        self.top_ips = top_ips
+        self.sketch_size = sketch_size
+        self.events: Counter = Counter()
+        self.ips: Dict[Key, SpaceSaving] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.events)
+
+    def add(self, rows: list):
+        for row in rows:
+            key = (hour_of(row["created_at"]), row["action"], row["status"])
+            self.events[key] += 1
+            if row.get("ip_address"):
+                sketch = self.ips.get(key)
+                if sketch is None:
+                    sketch = self.ips[key] = SpaceSaving(self.sketch_size)
+                sketch.add(row["ip_address"])
+
+    def merge(self, other: "RollupAccumulator"):
+        self.events.update(other.events)
+        for key, sketch in other.ips.items():
+            self.ips.setdefault(key, SpaceSaving(self.sketch_size)).merge(sketch)
+
+    def event_rows(self) -> List[dict]:
+        return [
+            {"bucket": bucket, "action": action, "status": status, "events": events}
+            for (bucket, action, status), events in self.events.items()
+        ]
+
+    def ip_rows(self) -> List[dict]:
+        return [
+            {"bucket": bucket, "action": action, "status": status, "ip_address": ip, "events": events}
+            for (bucket, action, status), sketch in self.ips.items()
+            for ip, events in sketch.top(self.top_ips)
+        ]
+
+
+def _upsert_add(conn: Connection, table, rows: List[dict]):
+    """Insert rows, adding `events` onto rows that already exist"""
+    if not rows:
+        return
+    if conn.dialect.name == "mysql":
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update(events=table.c.events + statement.inserted.events)
+    else:
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key.columns],
+            set_={"events": table.c.events + statement.excluded.events}
+        )
+    conn.execute(statement, rows)
+
+
+def write_rollups(conn: Connection, accumulator: RollupAccumulator):
+    """Add an accumulator's deltas onto the rollup tables"""
+    _upsert_add(conn, AuditRollup.__table__, accumulator.event_rows())
+    _upsert_add(conn, AuditIPRollup.__table__, accumulator.ip_rows())
+
+
+def rebuild_rollups(conn: Connection, since: int, until: int, top_ips: int = 20) -> int:
+    """Recompute the rollups of every hour in [since, until) from audit_logs; returns the events counted"""
+    start = hour_of(since)
+    end = hour_of(until - 1) + HOUR
+    for table in (AuditRollup.__table__, AuditIPRollup.__table__):
+        conn.execute(delete(table).where(table.c.bucket >= start, table.c.bucket < end))
+
+    events: Counter = Counter()
+    heaviest: Dict[Key, list] = {}
+    for table in partition_tables(conn, start, end, newest_first=False):
+        bucket = (table.c.created_at - table.c.created_at % HOUR).label("bucket")
+        query = (
+            select(bucket, table.c.action, table.c.status, table.c.ip_address, func.count().label("events"))
+            .where(table.c.created_at >= start, table.c.created_at < end)
+            .group_by(bucket, table.c.action, table.c.status, table.c.ip_address)
+        )
+        for row in conn.execute(query):
+            key = (row.bucket, row.action, row.status)
+            events[key] += row.events
+            if row.ip_address:
+                # Bounded min-heap of the heaviest IPs per key
+                heap = heaviest.setdefault(key, [])
+                entry = (row.events, row.ip_address)
+                if len(heap) < top_ips:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+    if events:
+        conn.execute(insert(AuditRollup.__table__), [
+            {"bucket": key[0], "action": key[1], "status": key[2], "events": count}
+            for key, count in events.items()
+        ])
+    ip_rows = [
+        {"bucket": key[0], "action": key[1], "status": key[2], "ip_address": ip, "events": count}
+        for key, heap in heaviest.items() for count, ip in heap
+    ]
+    if ip_rows:
+        conn.execute(insert(AuditIPRollup.__table__), ip_rows)
+    return sum(events.values())
+
+
+async def rollup_dashboard(db: AsyncSession, since: Optional[int] = None, until: Optional[int] = None,
+                           action: Optional[str] = None, status: Optional[str] = None, top: int = 10) -> dict:
+    """Hourly series, totals and top IPs for a time range, read from the rollup tables only"""
+    until = until if until is not None else int(time.time()) + 1
+    start = hour_of(since if since is not None else until - 24 * HOUR)
+
+    def conditions(model):
+        clauses = [model.bucket >= start, model.bucket < until]
+        if action is not None:
+            clauses.append(model.action == action)
+        if status is not None:
+            clauses.append(model.status == status)
+        return and_(*clauses)
+
+    series = (await db.execute(
+        select(AuditRollup.bucket, AuditRollup.action, AuditRollup.status, AuditRollup.events)
+        .where(conditions(AuditRollup))
+        .order_by(AuditRollup.bucket, AuditRollup.action, AuditRollup.status)
+    )).all()
+    events = func.sum(AuditIPRollup.events).label("events")
+    top_ips = (await db.execute(
+        select(AuditIPRollup.ip_address, events)
+        .where(conditions(AuditIPRollup))
+        .group_by(AuditIPRollup.ip_address)
+        .order_by(desc(events), AuditIPRollup.ip_address)
+        .limit(top)
+    )).all()
+
+    totals: Counter = Counter()
+    for row in series:
+        totals[(row.action, row.status)] += row.events
+    return {
+        "since": start,
+        "until": until,
+        "series": [
+            {"hour": row.bucket, "action": row.action, "status": row.status, "events": row.events}
+            for row in series
+        ],
+        "totals": [
+            {"action": key[0], "status": key[1], "events": count} for key, count in sorted(totals.items())
+        ],
+        "top_ips": [{"ip_address": row.ip_address, "events": int(row.events)} for row in top_ips],
+    }
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +14,14 @@ DB_URL = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_POR
 
 # DB_URL = 'sqlite:///db_user_auth.db'
 
+# Async driver for the request handlers (aiomysql); use sqlite+aiosqlite for local runs
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL", DB_URL.replace("mysql+pymysql://", "mysql+aiomysql://", 1))
+# ASYNC_DB_URL = 'sqlite+aiosqlite:///db_user_auth.db'
+
+# Read replicas (comma separated URLs, async drivers); empty = all queries go to the primary
+ASYNC_DB_REPLICA_URLS = [url.strip() for url in os.getenv("ASYNC_DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_HEALTH_CHECK_SECONDS = int(os.getenv("DB_REPLICA_HEALTH_CHECK_SECONDS", 10))
+
 
 # --- Send email config ---
 SENDER_EMAIL = os.getenv("SENDER_EMAIL")
@@ -25,6 +34,9 @@ SMTP_PORT = 587
 SECRET_KEY_JWT = os.getenv("SECRET_KEY_JWT", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 2  # 2 hours
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", 10000))  # verified tokens kept in memory, 0 disables
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))  # 0 disables
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30))
 
 
 # --- Security config ---
@@ -36,17 +48,100 @@ PASSWORD_REQUIRE_LOWERCASE = True
 PASSWORD_REQUIRE_DIGITS = True
 PASSWORD_REQUIRE_SPECIAL = True
 
+# --- Password hashing config ---
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))  # 0 = hash inline
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", max(HASH_WORKERS, 1) * 8))
+# Explicit Argon2 cost wins; otherwise calibrate against ARGON2_TARGET_MS (0 = passlib defaults).
+# Start-up calibration varies with load: pin the output of scripts/calibrate_argon2.py in production
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 0))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 0))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+ARGON2_TARGET_MS = int(os.getenv("ARGON2_TARGET_MS", 0))
+ARGON2_MAX_MEMORY_COST = int(os.getenv("ARGON2_MAX_MEMORY_COST", 64 * 1024))  # KiB, calibration ceiling
+
 # --- Rate limiting config ---
 RATE_LIMIT_PER_MINUTE = 60
 RATE_LIMIT_PER_HOUR = 300
+RATE_LIMIT_MAX_MEMORY_MB = int(os.getenv("RATE_LIMIT_MAX_MEMORY_MB", 64))  # ceiling for the per-IP table
+RATE_LIMIT_SWEEP_INTERVAL_SECONDS = int(os.getenv("RATE_LIMIT_SWEEP_INTERVAL_SECONDS", 60))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory, shared (all workers on this host), redis (cluster)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_SHM_PATH = os.getenv(
+    "RATE_LIMIT_SHM_PATH",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "user_auth_ratelimit")
+)
+
+# --- Proxy config ---
+# Comma separated CIDRs of reverse proxies whose X-Forwarded-For is trusted; empty = use the socket peer
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1/32,::1/128")
+
+# --- IP filter config ---
+# One IP or CIDR per line; files are re-read when they change. Allowlisted IPs skip the blocklist and rate limits
+IP_BLOCKLIST_PATH = os.getenv("IP_BLOCKLIST_PATH", "")
+IP_ALLOWLIST_PATH = os.getenv("IP_ALLOWLIST_PATH", "")
+IP_LIST_RELOAD_SECONDS = int(os.getenv("IP_LIST_RELOAD_SECONDS", 5))
 
 # --- Cookie config ---
 COOKIE_SECURE = os.getenv("COOKIE_SECURE", "False").lower() == "true"
 COOKIE_SAMESITE = "lax"  # 'strict', 'lax', or 'none'
 COOKIE_HTTPONLY = True
 
+# --- CSRF config ---
+CSRF_ENABLED = os.getenv("CSRF_ENABLED", "False").lower() == "true"
+CSRF_SECRET = os.getenv("CSRF_SECRET", SECRET_KEY_JWT)
+CSRF_TOKEN_MAX_AGE_SECONDS = int(os.getenv("CSRF_TOKEN_MAX_AGE_SECONDS", 3600))
+
 # --- Application config ---
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")  # production, development
 DEBUG = ENVIRONMENT == "development"
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS").split(",")
 
+# --- Logging config ---
+# Records go through a queue of LOG_QUEUE_SIZE records to a listener thread that does the file/console writes.
+# When it is full, LOG_QUEUE_FULL_POLICY "drop" discards the record (counted in /metrics), "block" waits for room.
+# The policy applies to the application handlers only; the security log always blocks.
+# LOG_QUEUE_SIZE=0 writes synchronously from the logging thread
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_QUEUE_FULL_POLICY = os.getenv("LOG_QUEUE_FULL_POLICY", "drop").lower()  # drop, block
+
+# --- Database pool config ---
+# Defaults per environment; every value can be overridden from the environment.
+# Keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above the concurrent requests one worker serves
+DB_POOL_PROFILES = {
+    "development": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 10},
+    "production": {"pool_size": 20, "max_overflow": 10, "pool_timeout": 5},
+}
+_pool_profile = DB_POOL_PROFILES.get(ENVIRONMENT, DB_POOL_PROFILES["production"])
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", _pool_profile["pool_size"]))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", _pool_profile["max_overflow"]))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", _pool_profile["pool_timeout"]))  # seconds waiting for a connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 280))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+DB_ECHO = os.getenv("DB_ECHO", str(DEBUG)).lower() == "true"  # SQL logging, development only by default
+
+# --- Audit log config ---
+# Audit rows are queued and bulk-inserted every AUDIT_BATCH_SIZE rows or AUDIT_FLUSH_INTERVAL_MS, whichever comes first.
+# A full queue makes handlers wait; AUDIT_SYNCHRONOUS writes each row inline (tests)
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 100))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", 200))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_SYNCHRONOUS = os.getenv("AUDIT_SYNCHRONOUS", "False").lower() == "true"
+# Inserts slower than AUDIT_DB_TIMEOUT_MS (or failing) are spooled to local segment files under AUDIT_SPOOL_DIR
+# and replayed every AUDIT_SPOOL_REPLAY_SECONDS once the database is back; empty dir disables spooling.
+# Workers and hosts may share the directory: each process writes to its own <hostname>-<pid> subdirectory,
+# and dead workers' segments are adopted
+AUDIT_DB_TIMEOUT_MS = int(os.getenv("AUDIT_DB_TIMEOUT_MS", 1000))
+AUDIT_SPOOL_DIR = os.getenv("AUDIT_SPOOL_DIR", "spool/audit")
+AUDIT_SPOOL_SEGMENT_BYTES = int(os.getenv("AUDIT_SPOOL_SEGMENT_BYTES", 16 * 1024 * 1024))
+AUDIT_SPOOL_REPLAY_SECONDS = float(os.getenv("AUDIT_SPOOL_REPLAY_SECONDS", 5))
+# Monthly audit_logs partitions: retention drops whole months older than AUDIT_RETENTION_MONTHS (0 keeps everything).
+# Maintenance also creates AUDIT_PARTITION_MONTHS_AHEAD future months; it runs every
+# AUDIT_PARTITION_MAINTENANCE_SECONDS (0 disables; off in development, use scripts/maintain_audit_partitions.py)
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", 12))
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", 3))
+AUDIT_PARTITION_MAINTENANCE_SECONDS = int(os.getenv("AUDIT_PARTITION_MAINTENANCE_SECONDS", 0 if DEBUG else 3600))
+# Hourly audit rollups (dashboards): counts are added up in memory and upserted every AUDIT_ROLLUP_FLUSH_SECONDS.
+# Per hour x action x status, the heaviest AUDIT_ROLLUP_TOP_IPS of up to AUDIT_ROLLUP_SKETCH_SIZE tracked IPs are kept
+AUDIT_ROLLUP_FLUSH_SECONDS = float(os.getenv("AUDIT_ROLLUP_FLUSH_SECONDS", 10))
+AUDIT_ROLLUP_TOP_IPS = int(os.getenv("AUDIT_ROLLUP_TOP_IPS", 20))
+AUDIT_ROLLUP_SKETCH_SIZE = int(os.getenv("AUDIT_ROLLUP_SKETCH_SIZE", 200))
@@ -0,0 +1,209 @@
+"""
+Append-only local spool for audit rows
+
+Rows are appended as JSON lines to numbered segment files and fsync'd once
+per append call (one batch), not once per row. A segment is sealed when it
+reaches the size limit or when the replayer takes it; sealed segments are
+read back oldest first and removed only after their rows reached the
+database, so delivery is at-least-once. A torn last line from a crash is
+skipped on read.
+
+Workers share AUDIT_SPOOL_DIR, so each process writes to its own
+subdirectory (named <hostname>-<pid>) and holds an flock on its `.lock`
+file for as long as it lives. Hosts or containers sharing the directory can
+still reuse a name; when its lock is held elsewhere the process takes a
+fresh, randomly suffixed directory instead of waiting. A replayer only reads and removes segments in its
+own subdirectory. Segments left by a dead worker (whose lock is free) are
+adopted first: renamed into the replayer's subdirectory under the lock, so
+no two processes ever replay the same segment. Without fcntl (Windows) no
+segments are adopted.
+
+Rows the database refuses are quarantined to `<name>.bad` files in the same
+format; renaming one to a free `<number>.seg` replays it again.
+"""
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".seg"
+QUARANTINE_SUFFIX = ".bad"
+LOCK_NAME = ".lock"
+
+# Owner locks held by this process, by directory; flock would also exclude a second spool of the same process
+_owned: Dict[Path, Optional[int]] = {}
+# Directory claimed per (spool root, owner name), so later spools of this process reuse it
+_claims: Dict[Tuple[Path, str], Path] = {}
+_owned_lock = threading.Lock()
+
+
+def _lock(directory: Path) -> Optional[int]:
+    """fd holding an exclusive flock on directory/.lock, or None when it is held elsewhere or was retired"""
+    path = directory / LOCK_NAME
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # An adopter retires the lock file when it is done; a lock on the unlinked file guards nothing
+        if os.fstat(fd).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+    return fd
+
+
+def _claim(root: Path, owner: str) -> Path:
+    """Create and lock this process's spool directory; the lock is held until the process exits"""
+    with _owned_lock:
+        claimed = _claims.get((root, owner))
+        if claimed is not None:
+            return claimed
+        directory = root / owner
+        while True:
+            directory.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                fd = None
+                break
+            fd = _lock(directory)
+            if fd is not None:
+                break
+            # A live process elsewhere has the same name (or an adopter is emptying it)
+            directory = root / f"{owner}-{secrets.token_hex(4)}"
+        _owned[directory] = fd
+        _claims[(root, owner)] = directory
+        return directory
+
+
+class SegmentSpool:
+    """Numbered JSON-lines segment files in this process's subdirectory of a shared spool directory"""
+
+    def __init__(self, directory: str, segment_bytes: int = 16 * 1024 * 1024, owner: Optional[str] = None):
+        self.root = Path(directory)
+        self.directory = _claim(self.root, owner or f"{socket.gethostname()}-{os.getpid()}")
+        self.segment_bytes = segment_bytes
+        self.spooled = 0
+        self.replayed = 0
+        self.quarantined = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._path: Optional[Path] = None
+        existing = self._numbers()
+        self._next = (existing[-1] + 1) if existing else 1
+
+    def _numbers(self, directory: Optional[Path] = None) -> List[int]:
+        directory = directory or self.directory
+        return sorted(int(path.stem) for path in directory.glob(f"*{SEGMENT_SUFFIX}") if path.stem.isdigit())
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"{number:08d}{SEGMENT_SUFFIX}"
+
+    def append(self, rows: list):
+        """Append rows to the open segment and fsync once"""
+        data = b"".join(json.dumps(row, separators=(",", ":")).encode() + b"\n" for row in rows)
+        with self._lock:
+            if self._file is None:
+                self._path = self._segment_path(self._next)
+                self._next += 1
+                self._file = open(self._path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.spooled += len(rows)
+            if self._file.tell() >= self.segment_bytes:
+                self._seal()
+
+    def _seal(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._path = None
+
+    def _adopt(self):
+        """Move the segments of workers that are gone into this process's directory"""
+        if fcntl is None:
+            return
+        for directory in self.root.iterdir():
+            if not directory.is_dir() or directory in _owned:
+                continue
+            fd = _lock(directory)
+            if fd is None:
+                continue
+            try:
+                numbers = self._numbers(directory)
+                for number in numbers:
+                    os.replace(directory / f"{number:08d}{SEGMENT_SUFFIX}", self._segment_path(self._next))
+                    self._next += 1
+                for path in directory.glob(f"*{QUARANTINE_SUFFIX}"):
+                    os.replace(path, self.directory / f"{directory.name}-{path.name}")
+                (directory / LOCK_NAME).unlink(missing_ok=True)
+                try:
+                    directory.rmdir()
+                except OSError:
+                    pass
+            finally:
+                os.close(fd)
+            if numbers:
+                logger.info(f"Adopted spool segments - From: {directory.name}, Segments: {len(numbers)}")
+
+    def sealed(self) -> List[Path]:
+        """Seal the open segment, adopt orphaned segments and return this process's segments, oldest first"""
+        with self._lock:
+            self._seal()
+            self._adopt()
+            return [self._segment_path(number) for number in self._numbers()]
+
+    def read(self, path: Path) -> list:
+        rows = []
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Skipping torn spool record - Segment: {path.name}")
+        return rows
+
+    def quarantine(self, name: str, rows: list):
+        """Append rows the database refused to <name>.bad and fsync"""
+        data = b"".join(json.dumps(row, separators=(",", ":")).encode() + b"\n" for row in rows)
+        with self._lock, open(self.directory / f"{name}{QUARANTINE_SUFFIX}", "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self.quarantined += len(rows)
+
+    def remove(self, path: Path, replayed: int = 0):
+        path.unlink(missing_ok=True)
+        self.replayed += replayed
+
+    def pending(self) -> bool:
+        with self._lock:
+            return self._file is not None or bool(self._numbers())
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+    def stats(self) -> dict:
+        numbers = self._numbers()
+        return {
+            "segments": len(numbers),
+            "bytes": sum(self._segment_path(number).stat().st_size for number in numbers
+                         if self._segment_path(number).exists()),
+            "spooled_rows": self.spooled,
+            "replayed_rows": self.replayed,
+            "quarantined_rows": self.quarantined,
+        }
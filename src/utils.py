@@ -1,3 +1,4 @@
+import re
 import secrets
 import string
 import smtplib
@@ -5,7 +6,7 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from configparser import ConfigParser
 import ssl
-from typing import Optional
+from typing import Iterable, Optional
 
 from src.settings import SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD
 
@@ -65,6 +66,30 @@ def generate_secure_token(length: int = 32) -> str:
     secure_token = f"{prefix}{token_suffix}"
     return secure_token
 
+# The key name ends a MySQL message; SQLite lists the constraint's columns. Values the user sent come earlier.
+_DUPLICATE_KEY = re.compile(r"for key '([^']+)'\s*$|^UNIQUE constraint failed: (.+)$")
+
+def duplicate_key_column(error: Exception, columns: Iterable[str]) -> Optional[str]:
+    """
+    Name the unique column an IntegrityError was raised for, or None
+
+    Only the key or constraint name is read from the driver message: MySQL
+    reports "Duplicate entry '<value>' for key 'users.username'", SQLite
+    "UNIQUE constraint failed: users.username". The name, with any table
+    prefix removed, must equal one of the columns.
+    """
+    orig = getattr(error, "orig", None) or error
+    # Drivers put (code, message) in args; str() of the exception would be the tuple
+    messages = [arg for arg in getattr(orig, "args", ()) if isinstance(arg, str)]
+    match = _DUPLICATE_KEY.search(messages[-1] if messages else str(orig))
+    if match is None:
+        return None
+    names = {name.strip().rsplit(".", 1)[-1] for name in (match.group(1) or match.group(2)).split(",")}
+    for column in columns:
+        if column in names:
+            return column
+    return None
+
 def send_email(to_email: str, subject: str, body: str):
     """
     Send an email via SMTP
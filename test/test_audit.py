@@ -0,0 +1,388 @@
+"""
+Unit tests for the batched audit writer
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src.audit import AuditSink, decode_cursor, encode_cursor, query_audit_logs
+from src.audit_export import EXPORT_COLUMNS, iter_audit_export, stream_audit_export
+from src.models import Base
+from src.partitions import insert_rows, partition_tables
+from src.spool import SegmentSpool
+
+DAY = 86400
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "audit.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    yield sync_engine, f"sqlite+aiosqlite:///{path}"
+    sync_engine.dispose()
+
+
+def count_rows(sync_engine) -> int:
+    with sync_engine.connect() as conn:
+        return sum(conn.execute(select(func.count()).select_from(table)).scalar_one()
+                   for table in partition_tables(conn))
+
+
+def run(database, scenario, **options):
+    """Run scenario(sink) on a fresh event loop with a sink bound to the test database"""
+    _, url = database
+
+    async def main():
+        engine = create_async_engine(url)
+        sink = AuditSink(session_factory=async_sessionmaker(bind=engine), **options)
+        try:
+            return await scenario(sink)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+class TestAuditSink:
+    """Test batching, flush triggers, backpressure and shutdown"""
+
+    def test_synchronous_mode_writes_inline(self, database):
+        """Test that synchronous mode writes each row before record() returns"""
+        sync_engine, _ = database
+
+        async def scenario(sink):
+            await sink.start()
+            await sink.record(action="login", status="success", ip_address="10.0.0.1")
+            return count_rows(sync_engine)
+
+        assert run(database, scenario, synchronous=True) == 1
+
+    def test_batches_by_size_and_flushes_on_stop(self, database):
+        """Test that rows are written in batch_size chunks and stop() flushes the remainder"""
+        sync_engine, _ = database
+
+        async def scenario(sink):
+            await sink.start()
+            for i in range(7):
+                await sink.record(action="login", status="success", details=str(i))
+            await sink.stop()
+            return sink.batches, sink.written
+
+        assert run(database, scenario, batch_size=3, flush_interval_ms=60000) == (3, 7)
+        assert count_rows(sync_engine) == 7
+
+    def test_flushes_after_interval(self, database):
+        """Test that a partial batch is written once the flush interval passes"""
+        sync_engine, _ = database
+
+        async def scenario(sink):
+            await sink.start()
+            await sink.record(action="logout", status="success")
+            await asyncio.sleep(0.5)
+            written = count_rows(sync_engine)
+            await sink.stop()
+            return written
+
+        assert run(database, scenario, batch_size=100, flush_interval_ms=20) == 1
+
+    def test_full_queue_applies_backpressure(self, database):
+        """Test that record() waits while the queue is full instead of growing it"""
+
+        async def scenario(sink):
+            release = asyncio.Event()
+            write = sink._write
+
+            async def slow_write(rows):
+                await release.wait()
+                await write(rows)
+
+            sink._write = slow_write
+            await sink.start()
+            # The worker holds one batch; then two rows fill the queue
+            for _ in range(3):
+                await sink.record(action="login", status="success")
+                await asyncio.sleep(0.01)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(sink.record(action="login", status="success"), 0.1)
+            release.set()
+            await sink.stop()
+            return sink.written
+
+        assert run(database, scenario, batch_size=1, flush_interval_ms=10, max_queue=2) == 3
+
+    def test_constraint_error_retries_rows(self, database):
+        """Test that a batch hitting a constraint keeps its good rows and drops the user link where needed"""
+        sync_engine, _ = database
+
+        async def scenario(sink):
+            insert = sink._insert
+
+            async def constrained(rows):
+                # user 7 no longer exists; "poison" violates some other constraint
+                if any(row["user_id"] == 7 or row["details"] == "poison" for row in rows):
+                    raise IntegrityError("INSERT", {}, Exception("FOREIGN KEY constraint failed"))
+                await insert(rows)
+
+            sink._insert = constrained
+            await sink.start()
+            for user_id, details in ((1, "a"), (7, "b"), (None, "poison"), (2, "c")):
+                await sink.record(user_id=user_id, action="login", status="success", details=details)
+            await sink.stop()
+            return sink.written, sink.failed, sink.unlinked, sink.degraded
+
+        assert run(database, scenario, batch_size=10, flush_interval_ms=60000) == (3, 1, 1, False)
+        with sync_engine.connect() as conn:
+            table = partition_tables(conn)[0]
+            rows = conn.execute(select(table.c.user_id, table.c.details).order_by(table.c.details)).all()
+        assert [tuple(row) for row in rows] == [(1, "a"), (None, "b"), (2, "c")]
+
+
+class TestAuditSpool:
+    """Test spilling to the local spool and replaying it"""
+
+    def test_unavailable_database_spools_then_replays(self, tmp_path):
+        """Test that rows spooled while the database cannot be opened are loaded once it can"""
+        path = tmp_path / "late" / "audit.db"
+        sync_engine = create_engine(f"sqlite:///{path}")
+
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+            sink = AuditSink(session_factory=async_sessionmaker(bind=engine), spool_dir=str(tmp_path / "spool"))
+            for i in range(3):
+                await sink.record(action="login", status="success", details=str(i))
+            spooled = (sink.degraded, sink.spool.stats()["spooled_rows"])
+
+            path.parent.mkdir()
+            replayed = await sink.replay()
+            await engine.dispose()
+            return spooled, replayed, sink.degraded, sink.spool.stats()["segments"]
+
+        assert asyncio.run(main()) == ((True, 3), 3, False, 0)
+        assert count_rows(sync_engine) == 3
+        sync_engine.dispose()
+
+    def test_poison_segment_quarantined(self, database, tmp_path):
+        """Test that rows the database refuses go to a .bad file while the rest of the segment is loaded"""
+        sync_engine, _ = database
+
+        async def scenario(sink):
+            insert, down = sink._insert, True
+
+            async def picky(rows):
+                if down:
+                    raise OperationalError("INSERT", {}, Exception("Lost connection to server"))
+                if any(row["details"] == "poison" for row in rows):
+                    raise DataError("INSERT", {}, Exception("Data too long for column 'details'"))
+                await insert(rows)
+
+            sink._insert = picky
+            sink.degraded = True
+            for details in ("a", "poison", "b"):
+                await sink.record(action="login", status="success", details=details)
+            # A connection error keeps the segment for the next attempt
+            deferred = await sink.replay(), sink.degraded, sink.spool.stats()["segments"]
+            down = False
+            replayed = await sink.replay(), sink.degraded, sink.spool.stats()
+            return deferred, replayed, list(sink.spool.directory.glob("*.bad"))
+
+        deferred, (replayed, degraded, stats), quarantine = run(database, scenario, spool_dir=str(tmp_path / "spool"))
+        assert deferred == (0, True, 1)
+        assert (replayed, degraded, stats["segments"], stats["quarantined_rows"]) == (2, False, 0, 1)
+        [path] = quarantine
+        assert [json.loads(line)["details"] for line in path.read_bytes().splitlines()] == ["poison"]
+        assert count_rows(sync_engine) == 2
+
+    def test_slow_database_spools(self, database, tmp_path):
+        """Test that an insert slower than db_timeout_ms is spooled instead of awaited"""
+
+        async def scenario(sink):
+            async def stalled(rows):
+                await asyncio.sleep(5)
+
+            sink._insert = stalled
+            await sink.record(action="logout", status="success")
+            return sink.degraded, sink.spool.stats()["spooled_rows"]
+
+        assert run(database, scenario, db_timeout_ms=50, spool_dir=str(tmp_path / "spool")) == (True, 1)
+
+
+class TestSegmentSpool:
+    """Test segment files"""
+
+    def test_rotates_and_continues_numbering(self, tmp_path):
+        """Test that full segments are sealed and a new spool continues after the last number"""
+        spool = SegmentSpool(str(tmp_path), segment_bytes=64)
+        for i in range(4):
+            spool.append([{"action": "login", "details": "x" * 40, "n": i}])
+        segments = spool.sealed()
+        assert len(segments) == 4
+        assert [row["n"] for path in segments for row in spool.read(path)] == [0, 1, 2, 3]
+
+        reopened = SegmentSpool(str(tmp_path))
+        reopened.append([{"n": 4}])
+        assert reopened.sealed()[-1].name == "00000005.seg"
+
+    def test_torn_record_skipped(self, tmp_path):
+        """Test that a partially written last line does not block the segment"""
+        spool = SegmentSpool(str(tmp_path))
+        spool.append([{"n": 1}, {"n": 2}])
+        [path] = spool.sealed()
+        with open(path, "ab") as f:
+            f.write(b'{"n": 3')
+        assert spool.read(path) == [{"n": 1}, {"n": 2}]
+
+    def test_name_held_elsewhere_gets_fresh_directory(self, tmp_path):
+        """Test that a spool whose name is locked by another host's process does not wait or share it"""
+        fcntl = pytest.importorskip("fcntl")
+        taken = tmp_path / "web-1-42"
+        taken.mkdir()
+        (taken / "00000001.seg").write_bytes(b'{"n": 1}\n')
+        holder = os.open(taken / ".lock", os.O_RDWR | os.O_CREAT)
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        try:
+            spool = SegmentSpool(str(tmp_path), owner="web-1-42")
+            assert spool.directory.parent == tmp_path and spool.directory.name.startswith("web-1-42-")
+            assert SegmentSpool(str(tmp_path), owner="web-1-42").directory == spool.directory
+            spool.append([{"n": 2}])
+            assert [row["n"] for path in spool.sealed() for row in spool.read(path)] == [2]
+            assert (taken / "00000001.seg").exists()
+        finally:
+            os.close(holder)
+
+    def test_replays_only_own_or_orphaned_segments(self, tmp_path):
+        """Test that a live worker's segments are left alone and a dead worker's are adopted once"""
+        fcntl = pytest.importorskip("fcntl")
+        mine = SegmentSpool(str(tmp_path), owner="101")
+        mine.append([{"n": 1}])
+        other = SegmentSpool(str(tmp_path), owner="102")
+        other.append([{"n": 2}])
+        # A live worker in another process holds the flock on its directory
+        alive = tmp_path / "103"
+        alive.mkdir()
+        (alive / "00000001.seg").write_bytes(b'{"n": 3}\n')
+        holder = os.open(alive / ".lock", os.O_RDWR | os.O_CREAT)
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        # A dead worker's directory: nobody holds its lock
+        dead = tmp_path / "104"
+        dead.mkdir()
+        (dead / "00000001.seg").write_bytes(b'{"n": 4}\n')
+        (dead / "00000002.seg").write_bytes(b'{"n": 5}\n')
+        try:
+            segments = mine.sealed()
+            assert [row["n"] for path in segments for row in mine.read(path)] == [1, 4, 5]
+            assert all(path.parent == mine.directory for path in segments)
+            assert not dead.exists()
+            assert [row["n"] for path in other.sealed() for row in other.read(path)] == [2]
+        finally:
+            os.close(holder)
+        assert [row["n"] for path in other.sealed() for row in other.read(path)] == [2, 3]
+
+
+class TestAuditQuery:
+    """Test filtered keyset pagination"""
+
+    @pytest.fixture
+    def rows(self, database):
+        sync_engine, _ = database
+        # Rows span three monthly partitions, and many share a created_at so pages must break ties on id
+        with sync_engine.begin() as conn:
+            insert_rows(conn, [
+                {"user_id": i % 3, "action": "login" if i % 2 else "logout", "status": "success",
+                 "ip_address": f"10.0.0.{i % 5}", "details": str(i), "created_at": 9 * DAY * (i // 4)}
+                for i in range(40)
+            ])
+        return database
+
+    def collect(self, database, limit, **filters):
+        _, url = database
+
+        async def main():
+            engine = create_async_engine(url)
+            pages, cursor = [], None
+            async with async_sessionmaker(bind=engine)() as db:
+                while True:
+                    rows, cursor = await query_audit_logs(db, limit=limit, cursor=cursor, **filters)
+                    pages.append([(row.created_at, row.id, int(row.details)) for row in rows])
+                    if cursor is None:
+                        break
+            await engine.dispose()
+            return pages
+
+        return asyncio.run(main())
+
+    def test_pages_cover_every_row_once(self, rows):
+        """Test that walking the cursors yields every row once, newest first"""
+        pages = self.collect(rows, limit=7)
+        keys = [key for page in pages for key in page]
+        assert len(pages) == 6
+        assert sorted(number for _, _, number in keys) == list(range(40))
+        assert keys == sorted(keys, reverse=True)
+
+    def test_filters(self, rows):
+        """Test that the filters combine and still paginate"""
+        pages = self.collect(rows, limit=2, action="login", ip_address="10.0.0.1", since=18 * DAY)
+        assert [[number for _, _, number in page] for page in pages] == [[31, 21], [11]]
+
+    def test_cursor_round_trip(self):
+        """Test that cursors decode to what was encoded and reject garbage"""
+        assert decode_cursor(encode_cursor(1700000000, 42)) == (1700000000, 42)
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor")
+
+
+class TestAuditExport:
+    """Test the streaming NDJSON/CSV export"""
+
+    @pytest.fixture
+    def rows(self, database):
+        sync_engine, _ = database
+        with sync_engine.begin() as conn:
+            insert_rows(conn, [
+                {"user_id": i % 2, "action": "login", "status": "success",
+                 "details": 'quote " and, comma' if i == 3 else None, "created_at": 5 * DAY * (24 - i)}
+                for i in range(25)
+            ])
+        return database
+
+    def export(self, database, **options) -> bytes:
+        sync_engine, _ = database
+        with sync_engine.connect() as conn:
+            return b"".join(iter_audit_export(conn, yield_per=4, **options))
+
+    def test_ndjson_oldest_first(self, rows):
+        """Test one JSON object per row, ordered by created_at across partitions"""
+        records = [json.loads(line) for line in self.export(rows).splitlines()]
+        assert len(records) == 25
+        assert list(records[0]) == list(EXPORT_COLUMNS)
+        assert [record["created_at"] for record in records] == [5 * DAY * i for i in range(25)]
+
+    def test_csv_with_gzip(self, rows):
+        """Test that gzip output decompresses to a CSV with a header and quoted fields"""
+        data = gzip.decompress(self.export(rows, fmt="csv", compress=True, user_id=1))
+        table = list(csv.reader(io.StringIO(data.decode())))
+        assert table[0] == list(EXPORT_COLUMNS)
+        assert len(table) == 13
+        assert 'quote " and, comma' in [line[EXPORT_COLUMNS.index("details")] for line in table]
+
+    def test_async_stream_matches_sync(self, rows):
+        """Test that the endpoint generator yields the same bytes as the CLI path"""
+        _, url = rows
+
+        async def main():
+            engine = create_async_engine(url)
+            async with async_sessionmaker(bind=engine)() as db:
+                chunks = [chunk async for chunk in stream_audit_export(db, "csv", yield_per=4, since=40 * DAY)]
+            await engine.dispose()
+            return chunks
+
+        chunks = asyncio.run(main())
+        assert len(chunks) > 2
+        assert b"".join(chunks) == self.export(rows, fmt="csv", since=40 * DAY)
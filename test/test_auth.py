@@ -3,11 +3,13 @@ Unit tests for authentication system
 """
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from src import create_app
+from src.audit import audit_sink
 from src.models import Base, User
-from src.config import get_db
+from src.config import get_db, get_async_db
 from src.encryption import hash_password
 import time
 
@@ -15,6 +17,11 @@ import time
 TEST_DB_URL = "sqlite:///./test_auth.db"
 engine = create_engine(TEST_DB_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine("sqlite+aiosqlite:///./test_auth.db")
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+# Audit rows go through their own engine so handler statement/commit counts stay exact
+audit_engine = create_async_engine("sqlite+aiosqlite:///./test_auth.db")
+TestingAuditSessionLocal = async_sessionmaker(bind=audit_engine, expire_on_commit=False)
 
 
 def override_get_db():
@@ -26,6 +33,12 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    """Override async database dependency for testing"""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="module")
 def client():
     """Create test client"""
@@ -35,10 +48,13 @@ def client():
     # Create app
     app = create_app()
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    audit_sink.configure(TestingAuditSessionLocal, synchronous=True)
     
     # Create test client
     with TestClient(app) as test_client:
         yield test_client
+    audit_sink.configure()
     
     # Drop tables after tests
     Base.metadata.drop_all(bind=engine)
@@ -282,6 +298,260 @@ class TestAccountLockout:
         assert response.status_code == 423 or b"locked" in response.content.lower()
 
 
+class TestLoginTransaction:
+    """Test that a login is a single unit of work"""
+    
+    def count_commits(self, client, password):
+        commits = []
+        listener = lambda conn: commits.append(conn)
+        event.listen(async_engine.sync_engine, "commit", listener)
+        try:
+            client.cookies.clear()
+            client.post(
+                "/api/v1/login",
+                data={"username": "testuser", "password": password},
+                follow_redirects=False
+            )
+        finally:
+            event.remove(async_engine.sync_engine, "commit", listener)
+        return len(commits)
+    
+    def test_successful_login_commits_once(self, client, test_user):
+        """Test that the user updates are committed once (the audit row is written by the sink)"""
+        assert self.count_commits(client, "TestPassword123!") == 1
+    
+    def test_failed_login_commits_once(self, client, test_user):
+        """Test that a failed attempt is recorded with one commit"""
+        assert self.count_commits(client, "wrongpassword") == 1
+
+
+class TestRegistrationRoundTrips:
+    """Test the fixed-cost registration path"""
+    
+    @pytest.fixture(autouse=True)
+    def no_email(self, monkeypatch):
+        import src.utils as utils
+        monkeypatch.setattr(utils, "send_email", lambda *args, **kwargs: True)
+    
+    def register(self, client, username):
+        client.cookies.clear()
+        return client.post(
+            "/api/v1/register",
+            data={
+                "fullname": "Round Trip",
+                "username": username,
+                "email": f"{username}@example.org",
+                "password": "Zq9!vLx#2mWp",
+                "confirm_password": "Zq9!vLx#2mWp"
+            },
+            follow_redirects=False
+        )
+    
+    def test_registration_statement_count(self, client):
+        """Test one uniqueness query plus the user and verification inserts, in one transaction"""
+        statements, commits = [], []
+        on_execute = lambda conn, cursor, statement, *args: statements.append(statement)
+        on_commit = lambda conn: commits.append(conn)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", on_execute)
+        event.listen(async_engine.sync_engine, "commit", on_commit)
+        try:
+            response = self.register(client, "roundtrip1")
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", on_execute)
+            event.remove(async_engine.sync_engine, "commit", on_commit)
+        assert response.status_code == 302
+        assert len(statements) == 3
+        assert len(commits) == 1
+    
+    def test_existing_username_reported(self, client, test_user):
+        """Test that the combined uniqueness query still names the taken field"""
+        response = self.register(client, "testuser")
+        assert response.status_code == 400
+        assert b"Username already exists" in response.content
+    
+    def test_token_collision_retried(self, client, test_user, monkeypatch):
+        """Test that a colliding transaction token is replaced by an insert retry"""
+        import src.utils as utils
+        tokens = iter(["test_token_123", "UA_fresh_token_1", "UA_fresh_verify_1"])
+        monkeypatch.setattr(utils, "generate_secure_token", lambda length=32: next(tokens))
+        assert self.register(client, "roundtrip2").status_code == 302
+        
+        db = TestingSessionLocal()
+        user = db.query(User).filter(User.username == "roundtrip2").one()
+        assert user.transaction_token == "UA_fresh_token_1"
+        db.close()
+
+    def test_saturated_hashing_pool_returns_503(self, client, monkeypatch):
+        """Test that a saturated hashing pool surfaces as 503, not a generic registration error"""
+        import src.api as api
+        from src.exceptions import ServiceUnavailableError
+        
+        async def saturated(password):
+            raise ServiceUnavailableError("Server is busy. Please try again shortly.")
+        
+        monkeypatch.setattr(api, "hash_password_async", saturated)
+        response = self.register(client, "roundtrip3")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+class TestDuplicateKeyColumn:
+    """Test that a unique violation is attributed by key name, not by the duplicate value"""
+    
+    COLUMNS = ("transaction_token", "username", "email")
+    
+    def violation(self, *args):
+        from sqlalchemy.exc import IntegrityError
+        return IntegrityError("INSERT INTO users ...", {}, Exception(*args))
+    
+    def test_mysql_value_naming_other_columns(self):
+        """Test that values containing other column names do not decide the column"""
+        from src.utils import duplicate_key_column
+        cases = [
+            ("Duplicate entry 'transaction_token_fan' for key 'users.username'", "username"),
+            ("Duplicate entry 'username@transaction_token.org' for key 'users.email'", "email"),
+            ("Duplicate entry 'UA_x' for key 'transaction_token'", "transaction_token"),
+            # A value that imitates the key clause itself
+            ("Duplicate entry 'x' for key 'email'' for key 'users.username'", "username"),
+        ]
+        for message, column in cases:
+            assert duplicate_key_column(self.violation(1062, message), self.COLUMNS) == column
+    
+    def test_sqlite_constraint_names(self):
+        """Test SQLite constraint messages and exact name matching"""
+        from src.utils import duplicate_key_column
+        error = self.violation("UNIQUE constraint failed: users.email")
+        assert duplicate_key_column(error, self.COLUMNS) == "email"
+        error = self.violation("UNIQUE constraint failed: users.username_lower")
+        assert duplicate_key_column(error, self.COLUMNS) is None
+        error = self.violation(1452, "Cannot add or update a child row: a foreign key constraint fails (username)")
+        assert duplicate_key_column(error, self.COLUMNS) is None
+    
+    def test_username_containing_column_name_registers(self, client, monkeypatch):
+        """Test that a username containing another column name registers normally"""
+        import src.utils as utils
+        monkeypatch.setattr(utils, "send_email", lambda *args, **kwargs: True)
+        client.cookies.clear()
+        response = client.post(
+            "/api/v1/register",
+            data={
+                "fullname": "Column Name",
+                "username": "transaction_token",
+                "email": "username.email@example.org",
+                "password": "Zq9!vLx#2mWp",
+                "confirm_password": "Zq9!vLx#2mWp"
+            },
+            follow_redirects=False
+        )
+        assert response.status_code == 302
+
+
+class TestLoginAudit:
+    """Test that failed logins reach the audit trail and its dashboard"""
+    
+    def test_failed_logins_per_ip_on_dashboard(self, client, test_user):
+        """Test that wrong passwords, unknown users and locked accounts are counted per client IP"""
+        from src.auth import create_jwt_access_token
+        
+        db = TestingSessionLocal()
+        db.add(User(
+            fullname="Audit Admin",
+            username="auditadmin",
+            email="auditadmin@example.com",
+            password=hash_password("AdminPassword123!"),
+            verified=True,
+            role="admin",
+            transaction_token="audit_admin_token",
+            failed_login_attempts=0
+        ))
+        db.add(User(
+            fullname="Locked User",
+            username="lockeduser",
+            email="locked@example.com",
+            password=hash_password("LockedPassword123!"),
+            verified=True,
+            transaction_token="locked_token",
+            failed_login_attempts=5,
+            locked_until=int(time.time()) + 600
+        ))
+        db.commit()
+        db.close()
+        
+        # Requests come through a trusted proxy so each carries its own client IP
+        proxied = TestClient(client.app, client=("127.0.0.1", 50000))
+        attempts = [("10.20.0.1", "testuser", "wrongpassword")] * 2 + [
+            ("10.20.0.2", "nobody", "wrongpassword"),
+            ("10.20.0.3", "lockeduser", "LockedPassword123!"),
+        ]
+        for ip, username, password in attempts:
+            response = proxied.post(
+                "/api/v1/login",
+                data={"username": username, "password": password},
+                headers={"X-Forwarded-For": ip},
+                follow_redirects=False
+            )
+            assert response.status_code in (401, 423)
+        
+        token = create_jwt_access_token({
+            "transtoken": "audit_admin_token", "email": "auditadmin@example.com", "username": "auditadmin"
+        })
+        proxied.cookies.set("access_token", token)
+        counts = {}
+        for status in ("failed", "locked"):
+            response = proxied.get(
+                "/api/v1/admin/audit-dashboard",
+                params={"action": "login", "status": status, "top": 100},
+                headers={"X-Forwarded-For": "10.20.0.9"}
+            )
+            assert response.status_code == 200
+            counts[status] = {row["ip_address"]: row["events"] for row in response.json()["top_ips"]}
+        assert counts["failed"]["10.20.0.1"] == 2
+        assert counts["failed"]["10.20.0.2"] == 1
+        assert counts["locked"]["10.20.0.3"] == 1
+        assert "10.20.0.3" not in counts["failed"]
+
+
+class TestAccountDeletion:
+    """Test deleting an account"""
+    
+    def test_stale_principal_gets_404(self, client):
+        """Test that a cached principal whose user row is gone is dropped instead of failing with a 500"""
+        from src.auth import create_jwt_access_token
+        from src.cache import principal_cache
+        
+        db = TestingSessionLocal()
+        user = User(
+            fullname="Gone User",
+            username="goneuser",
+            email="gone@example.com",
+            password=hash_password("GonePassword123!"),
+            verified=True,
+            transaction_token="gone_token",
+            failed_login_attempts=0
+        )
+        db.add(user)
+        db.commit()
+        
+        token = create_jwt_access_token({
+            "transtoken": "gone_token", "email": "gone@example.com", "username": "goneuser"
+        })
+        client.cookies.set("access_token", token)
+        try:
+            assert client.get("/api/v1/profile").status_code == 200
+            assert principal_cache.get("gone_token") is not None
+            # Deleted concurrently, behind the cached principal
+            db.delete(user)
+            db.commit()
+            db.close()
+            
+            response = client.post("/api/v1/delete-account", follow_redirects=False)
+            assert response.status_code == 404
+            assert 'access_token=""' in response.headers["set-cookie"]
+            assert principal_cache.get("gone_token") is None
+        finally:
+            client.cookies.clear()
+
+
 class TestRateLimiting:
     """Test rate limiting"""
     
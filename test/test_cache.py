@@ -0,0 +1,77 @@
+"""
+Unit tests for in-process caches
+"""
+import time
+import pytest
+from jose import JWTError
+from src.cache import TTLCache
+from src.auth import create_jwt_access_token, decode_token_cached, token_cache
+
+
+class TestTTLCache:
+    """Test the LRU/TTL cache"""
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first"""
+        cache = TTLCache(max_size=2, default_ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert cache.evictions == 1
+
+    def test_entries_expire(self):
+        """Test that entries are dropped at their expiry time"""
+        cache = TTLCache(max_size=10)
+        cache.set("a", 1, expires_at=time.time() + 0.05)
+        assert cache.get("a") == 1
+        time.sleep(0.06)
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+
+class TestTokenCache:
+    """Test the verified-JWT cache"""
+
+    def test_repeat_decode_hits_cache(self):
+        """Test that the second decode of a token skips verification"""
+        token_cache.clear()
+        token = create_jwt_access_token({"transtoken": "cache_test"})
+        hits = token_cache.hits
+
+        assert decode_token_cached(token)["transtoken"] == "cache_test"
+        assert decode_token_cached(token)["transtoken"] == "cache_test"
+        assert token_cache.hits == hits + 1
+
+    def test_invalid_token_not_cached(self):
+        """Test that tampered tokens still fail and are not stored"""
+        token_cache.clear()
+        token = create_jwt_access_token({"transtoken": "cache_test"})
+        with pytest.raises(JWTError):
+            decode_token_cached(token[:-2] + "xx")
+        assert len(token_cache) == 0
+
+
+class TestPrincipalCache:
+    """Test the transaction_token -> principal cache"""
+
+    def test_principal_snapshot(self):
+        """Test that a principal copies the user fields and has no __dict__"""
+        from src.cache import Principal
+        from src.models import User
+
+        user = User(id=7, username="p", email="p@example.com", role="user",
+                    verified=True, transaction_token="tt")
+        principal = Principal.from_user(user)
+        assert principal.id == 7 and principal.transaction_token == "tt"
+        assert not hasattr(principal, "__dict__")
+
+    def test_invalidation(self):
+        """Test that invalidate_principal drops the entry"""
+        from src.cache import Principal, principal_cache, invalidate_principal
+
+        principal_cache.set("tt", Principal(id=1))
+        invalidate_principal("tt")
+        assert principal_cache.get("tt") is None
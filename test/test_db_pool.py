@@ -0,0 +1,52 @@
+"""
+Unit tests for the instrumented connection pool
+"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from src.config import PoolTelemetry, instrumented_pool
+from src.metrics import Histogram
+
+
+class TestHistogram:
+    """Test the fixed-bucket histogram"""
+
+    def test_cumulative_buckets(self):
+        """Test that buckets count every observation at or below their bound"""
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        assert snapshot["buckets"] == {"le_1": 2, "le_10": 3, "le_inf": 4}
+        assert snapshot["count"] == 4
+
+
+class TestPoolTelemetry:
+    """Test pool gauges, wait times and timeouts"""
+
+    def test_checkout_gauges_and_timeout(self, tmp_path):
+        """Test that checkouts are timed and an exhausted pool counts a timeout"""
+        telemetry = PoolTelemetry()
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=instrumented_pool(QueuePool, telemetry),
+            pool_size=1, max_overflow=1, pool_timeout=0.05
+        )
+        first = engine.connect()
+        second = engine.connect()
+        first.execute(text("SELECT 1"))
+
+        stats = telemetry.stats()
+        assert stats["checked_out"] == 2
+        assert stats["overflow"] == 1
+        assert stats["wait_ms"]["count"] == 2
+
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        assert telemetry.stats()["timeouts"] == 1
+
+        first.close()
+        second.close()
+        assert telemetry.stats()["checked_out"] == 0
+        engine.dispose()
@@ -0,0 +1,140 @@
+"""
+Unit tests for password hashing
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+import src.encryption as encryption
+from src.encryption import (
+    HashingExecutor, build_password_context, calibrate_argon2, hashing_executor, needs_rehash,
+    verify_and_update_password
+)
+from src.exceptions import ServiceUnavailableError
+
+LOW_COST = {"time_cost": 1, "memory_cost": 8 * 1024, "parallelism": 1}
+
+
+class TestHashingExecutor:
+    """Test the bounded hashing pool"""
+
+    def test_rejects_work_when_saturated(self):
+        """Test that a full pool fails fast instead of queueing"""
+        executor = HashingExecutor(max_workers=1, max_pending=1)
+        try:
+            future = executor.submit(time.sleep, 0.5)
+            with pytest.raises(ServiceUnavailableError):
+                executor.submit(time.sleep, 0)
+            future.result()
+            assert executor.pending == 0
+        finally:
+            executor.shutdown()
+
+    def test_async_callers_share_the_cap(self):
+        """Test that run_async is rejected by the same pending-job cap and releases its slot"""
+        executor = HashingExecutor(max_workers=1, max_pending=1)
+
+        async def scenario():
+            first = asyncio.ensure_future(executor.run_async(time.sleep, 0.5))
+            await asyncio.sleep(0)
+            with pytest.raises(ServiceUnavailableError):
+                await executor.run_async(time.sleep, 0)
+            await first
+
+        try:
+            asyncio.run(scenario())
+            assert executor.pending == 0
+        finally:
+            executor.shutdown()
+
+    def test_broken_pool_restarted_once(self, monkeypatch):
+        """Test that threads hitting a broken pool together start exactly one replacement"""
+        created = []
+        # The broken pool fails submits only once all eight threads are inside submit at the same time
+        gate = threading.Barrier(8, timeout=0.5)
+
+        class FakePool:
+            def __init__(self, **kwargs):
+                self.broken = not created
+                self.inner = ThreadPoolExecutor(1)
+                created.append(self)
+
+            def submit(self, fn, *args):
+                if self.broken:
+                    try:
+                        gate.wait()
+                    except threading.BrokenBarrierError:
+                        pass
+                    raise BrokenProcessPool("worker died")
+                return self.inner.submit(fn, *args)
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                self.inner.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+        monkeypatch.setattr(encryption, "ProcessPoolExecutor", FakePool)
+        executor = HashingExecutor(max_workers=1, max_pending=16)
+        results, errors = [], []
+
+        def caller():
+            try:
+                results.append(executor.run(abs, -3))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=caller) for _ in range(8)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+        finally:
+            executor.shutdown()
+        assert errors == [] and results == [3] * 8
+        assert len(created) == 2
+        assert executor.pending == 0
+
+    def test_inline_mode(self):
+        """Test that zero workers hashes in-process"""
+        executor = HashingExecutor(max_workers=0, max_pending=1)
+        assert executor.run(sum, [1, 2]) == 3
+        assert executor.pending == 0
+
+
+class TestArgon2Tuning:
+    """Test calibration and rehash-on-login"""
+
+    def test_calibration_respects_floor(self):
+        """Test that an impossible budget falls back to the cheapest cost"""
+        params = calibrate_argon2(target_ms=0, max_memory_cost=16 * 1024, parallelism=1)
+        assert params == {"time_cost": 1, "memory_cost": 8 * 1024, "parallelism": 1}
+
+    def test_outdated_hash_is_rehashed(self):
+        """Test that a hash made with old parameters is upgraded on verify"""
+        old_hash = build_password_context(LOW_COST).hash("Secret123!")
+        hashing_executor.configure({**LOW_COST, "time_cost": 2})
+        try:
+            valid, new_hash = verify_and_update_password("Secret123!", old_hash)
+            assert valid
+            assert new_hash and "t=2" in new_hash
+
+            valid, again = verify_and_update_password("Secret123!", new_hash)
+            assert valid and again is None
+
+            assert verify_and_update_password("wrong", old_hash) == (False, None)
+        finally:
+            hashing_executor.configure(None)
+
+    def test_stronger_hash_is_kept(self):
+        """Test that a hash stronger than the target (e.g. an earlier calibration) is not downgraded"""
+        strong_hash = build_password_context({**LOW_COST, "time_cost": 3}).hash("Secret123!")
+        hashing_executor.configure({**LOW_COST, "time_cost": 2})
+        try:
+            assert verify_and_update_password("Secret123!", strong_hash) == (True, None)
+            # Same work split differently counts as equal, not weaker
+            balanced = build_password_context({**LOW_COST, "time_cost": 1, "memory_cost": 16 * 1024}).hash("x")
+            assert not needs_rehash(balanced)
+        finally:
+            hashing_executor.configure(None)
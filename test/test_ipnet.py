@@ -0,0 +1,154 @@
+"""
+Unit tests for the CIDR trie and client IP resolution
+"""
+import ipaddress
+import random
+import tracemalloc
+from src.ipnet import CIDRTrie, IPListFile, IPRangeSet, load_range_set, resolve_client_ip
+
+
+class TestCIDRTrie:
+    """Test prefix membership lookups"""
+
+    def test_ipv4_prefixes(self):
+        """Test byte-aligned, unaligned and host prefixes"""
+        trie = CIDRTrie(["10.0.0.0/8", "192.168.1.128/25", "127.0.0.1"])
+        assert "10.255.0.1" in trie
+        assert "192.168.1.200" in trie
+        assert "192.168.1.5" not in trie
+        assert "127.0.0.1" in trie and "127.0.0.2" not in trie
+        assert len(trie) == 3
+
+    def test_ipv6_and_mapped_addresses(self):
+        """Test IPv6 ranges and IPv4-mapped IPv6 lookups"""
+        trie = CIDRTrie(["2001:db8::/32", "10.0.0.0/8"])
+        assert "2001:db8::1" in trie
+        assert "2001:db9::1" not in trie
+        assert "::ffff:10.0.0.1" in trie
+
+    def test_invalid_and_default_route(self):
+        """Test that garbage never matches and /0 matches its whole family"""
+        trie = CIDRTrie(["0.0.0.0/0"])
+        assert "8.8.8.8" in trie
+        assert "::1" not in trie
+        assert "not-an-ip" not in trie
+
+    def test_nested_prefixes_in_any_order(self):
+        """Test that a shorter prefix covers longer ones added before or after it"""
+        for networks in (["10.1.2.0/24", "10.0.0.0/8"], ["10.0.0.0/8", "10.1.2.0/24"]):
+            trie = CIDRTrie(networks)
+            assert "10.1.2.3" in trie and "10.200.0.1" in trie
+            assert "11.0.0.1" not in trie
+
+    def test_ipv6_list_memory(self):
+        """Test that thousands of IPv6 ranges stay within a few MB"""
+        rng = random.Random(6)
+        networks = [
+            ipaddress.IPv6Network((rng.getrandbits(128), rng.choice((32, 48, 56, 64))), strict=False)
+            for _ in range(5000)
+        ]
+        tracemalloc.start()
+        try:
+            trie = CIDRTrie(networks)
+            used = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        # A 256-way table per node needed about 50 MB for this list
+        assert used < 16 * 1024 * 1024
+        assert all(trie.contains(network[1]) for network in networks)
+
+
+class TestResolveClientIP:
+    """Test X-Forwarded-For chain walking"""
+
+    def test_untrusted_peer_uses_socket_address(self):
+        """Test that a direct client cannot spoof X-Forwarded-For"""
+        trusted = CIDRTrie(["10.0.0.0/8"])
+        assert resolve_client_ip("8.8.8.8", "1.2.3.4", trusted) == "8.8.8.8"
+
+    def test_all_hops_trusted_uses_leftmost(self):
+        """Test a chain made only of trusted proxies"""
+        trusted = CIDRTrie(["10.0.0.0/8"])
+        assert resolve_client_ip("10.0.0.1", "10.0.0.3, 10.0.0.2", trusted) == "10.0.0.3"
+
+    def test_garbage_hop_stops_the_walk(self):
+        """Test that an unparsable hop ends the walk at the last verified one"""
+        trusted = CIDRTrie(["10.0.0.0/8"])
+        assert resolve_client_ip("10.0.0.1", "1.2.3.4, bogus, 10.0.0.2", trusted) == "10.0.0.2"
+
+
+class TestIPRangeSet:
+    """Test the sorted-interval IP set"""
+
+    def test_overlapping_ranges_merged(self):
+        """Test that nested and adjacent networks collapse into one range"""
+        ranges = IPRangeSet(["10.0.0.0/8", "10.1.0.0/16", "11.0.0.0/8", "2001:db8::/32"])
+        assert len(ranges) == 2
+        assert ranges.entries == 4
+        assert "11.255.255.255" in ranges
+        assert "12.0.0.0" not in ranges
+        assert "2001:db8:ffff::1" in ranges
+
+    def test_boundaries(self):
+        """Test the first and last address of the space and of a range"""
+        ranges = IPRangeSet(["0.0.0.0/32", "255.255.255.255/32", "192.168.0.0/24"])
+        assert "0.0.0.0" in ranges and "255.255.255.255" in ranges
+        assert "192.168.0.255" in ranges and "192.168.1.0" not in ranges
+        assert "191.255.255.255" not in ranges
+        assert "::ffff:192.168.0.1" in ranges
+        assert "garbage" not in ranges
+
+
+class TestIPListFile:
+    """Test file loading and hot reload"""
+
+    def test_reload_on_change(self, tmp_path):
+        """Test that an edited file is picked up and bad lines are skipped"""
+        path = tmp_path / "blocklist.txt"
+        path.write_text("# comment\n1.2.3.0/24\nnot-a-cidr\n")
+        ip_list = IPListFile(str(path), reload_interval=0)
+        assert "1.2.3.4" in ip_list and "5.6.7.8" not in ip_list
+        assert not ip_list.reload()
+
+        path.write_text("1.2.3.0/24\n5.6.7.0/24  # added\n")
+        assert ip_list.reload()
+        assert "5.6.7.8" in ip_list
+        assert ip_list.stats()["reloads"] == 2
+        ip_list.close()
+
+    def test_reloads_share_one_loader_process(self, tmp_path):
+        """Test that isolated reloads reuse one spawned worker and close() shuts it down"""
+        path = tmp_path / "blocklist.txt"
+        path.write_text("1.2.3.4\n")
+        ip_list = IPListFile(str(path), reload_interval=0)
+        try:
+            path.write_text("1.2.3.4\n5.6.7.8\n")
+            assert ip_list.reload()
+            pool = ip_list._pool
+            path.write_text("1.2.3.4\n5.6.7.8\n9.9.9.9\n")
+            assert ip_list.reload()
+            assert ip_list._pool is pool and "9.9.9.9" in ip_list
+        finally:
+            ip_list.close()
+        assert ip_list._pool is None
+
+    def test_file_parse_matches_network_objects(self, tmp_path):
+        """Test that the inet_pton file parser builds the same ranges as ipaddress networks"""
+        entries = ["10.0.0.0/8", "10.1.2.3/16", "192.0.2.1", "2001:db8::/32", "2001:db8::1/128", "0.0.0.0/0"]
+        path = tmp_path / "list.txt"
+        path.write_text("\n".join(entries + ["1.2.3.4/33", "::/129"]) + "\n")
+        loaded = load_range_set(str(path))
+        expected = IPRangeSet(entries)
+        assert loaded.entries == expected.entries == 6
+        assert (loaded._v4_starts, loaded._v4_ends, loaded._v6_starts, loaded._v6_ends) == \
+            (expected._v4_starts, expected._v4_ends, expected._v6_starts, expected._v6_ends)
+
+    def test_missing_file_keeps_previous_set(self, tmp_path):
+        """Test that a failed reload does not empty the list"""
+        path = tmp_path / "blocklist.txt"
+        path.write_text("1.2.3.4\n")
+        ip_list = IPListFile(str(path), reload_interval=0)
+        path.unlink()
+        assert not ip_list.reload()
+        assert "1.2.3.4" in ip_list
+        assert ip_list.errors == 1
@@ -0,0 +1,137 @@
+"""
+Unit tests for queued logging
+"""
+import importlib
+import logging
+import queue
+import threading
+
+import pytest
+from src.logger import BoundedQueueHandler, logging_stats, start_logging, stop_logging
+
+
+class RecordingHandler(logging.Handler):
+    """Collects messages and the thread that emitted them; can be held to simulate a slow disk"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+        self.threads = set()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def emit(self, record):
+        self.gate.wait(5)
+        self.messages.append(record.getMessage())
+        self.threads.add(threading.get_ident())
+
+
+@pytest.fixture
+def route(monkeypatch):
+    """A private logger routed through the queue pipeline"""
+    logger = logging.getLogger("test.queued")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    # src.logger the attribute is the package's Logger, not this module
+    app_logger = importlib.import_module("src.logger")
+    monkeypatch.setattr(app_logger, "_routes", [(logger, [handler], "drop")])
+    monkeypatch.setattr(app_logger, "_listeners", [])
+    yield logger, handler
+    stop_logging()
+    logger.removeHandler(handler)
+
+
+class TestBoundedQueueHandler:
+    """Test the queue-full policies"""
+
+    def test_drop_policy_counts_dropped(self):
+        """Test that a full queue drops records without waiting"""
+        handler = BoundedQueueHandler(queue.Queue(2))
+        record = logging.makeLogRecord({"msg": "x"})
+        for _ in range(5):
+            handler.handle(record)
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_block_policy_waits_for_room(self):
+        """Test that a full queue makes the caller wait until a record is taken"""
+        handler = BoundedQueueHandler(queue.Queue(1), block=True)
+        record = logging.makeLogRecord({"msg": "x"})
+        handler.handle(record)
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (handler.handle(record), done.set()))
+        thread.start()
+        assert not done.wait(0.2)
+        handler.queue.get()
+        thread.join(5)
+        assert done.is_set() and handler.dropped == 0
+
+
+class TestListeners:
+    """Test starting, flushing and stopping the listener threads"""
+
+    def test_writes_happen_off_the_caller_thread(self, route):
+        """Test that handlers run on the listener thread, not the logging one"""
+        logger, handler = route
+        start_logging()
+        logger.info("hello")
+        stop_logging()
+        assert handler.messages == ["hello"]
+        assert threading.get_ident() not in handler.threads
+
+    def test_stop_flushes_queued_records(self, route):
+        """Test that stop_logging() drains everything queued behind a slow handler"""
+        logger, handler = route
+        handler.gate.clear()
+        start_logging()
+        for i in range(50):
+            logger.info(f"record {i}")
+        assert logging_stats()["queued"] > 0
+        handler.gate.set()
+        stop_logging()
+        assert handler.messages == [f"record {i}" for i in range(50)]
+        assert logging_stats()["running"] is False
+
+    def test_blocking_route_never_drops(self, route, monkeypatch):
+        """Test that a route with the block policy waits for room while the others drop"""
+        logger, handler = route
+        app_logger = importlib.import_module("src.logger")
+        secure = logging.getLogger("test.queued.security")
+        secure.propagate = False
+        secure.setLevel(logging.INFO)
+        secure_handler = RecordingHandler()
+        secure.addHandler(secure_handler)
+        monkeypatch.setattr(app_logger, "_routes", app_logger._routes + [(secure, [secure_handler], "block")])
+        monkeypatch.setattr(app_logger, "LOG_QUEUE_SIZE", 2)
+        handler.gate.clear()
+        secure_handler.gate.clear()
+        start_logging()
+        try:
+            for i in range(10):
+                logger.info(f"app {i}")
+            writer = threading.Thread(target=lambda: [secure.info(f"security {i}") for i in range(10)])
+            writer.start()
+            writer.join(0.2)
+            # The security writer waits on its full queue instead of dropping
+            assert writer.is_alive()
+            secure_handler.gate.set()
+            writer.join(5)
+            handler.gate.set()
+            stop_logging()
+        finally:
+            handler.gate.set()
+            secure_handler.gate.set()
+            secure.removeHandler(secure_handler)
+        assert secure_handler.messages == [f"security {i}" for i in range(10)]
+        assert len(handler.messages) < 10 and logging_stats()["dropped"] > 0
+
+    def test_synchronous_after_stop(self, route):
+        """Test that records logged after stop_logging() are written inline"""
+        logger, handler = route
+        start_logging()
+        stop_logging()
+        logger.info("late")
+        assert handler.messages == ["late"]
+        assert threading.get_ident() in handler.threads
@@ -0,0 +1,187 @@
+"""
+Unit tests for the ASGI security middleware
+"""
+import pytest
+from fastapi import FastAPI, Form, Request
+from fastapi.testclient import TestClient
+from src.dependencies import get_client_ip
+from src.middleware import (
+    SecurityHeadersMiddleware, ClientIPMiddleware, IPFilterMiddleware, RateLimitMiddleware, CSRFMiddleware,
+    make_csrf_token, verify_csrf_token
+)
+
+
+def build_app(*middleware) -> FastAPI:
+    """Minimal app wrapped in the given middleware (first = outermost)"""
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    @app.post("/echo")
+    def echo(name: str = Form(...)):
+        return {"name": name}
+
+    for cls, kwargs in reversed(middleware):
+        app.add_middleware(cls, **kwargs)
+    return app
+
+
+class TestSecurityHeaders:
+    """Test header injection"""
+
+    def test_headers_added(self):
+        """Test that every security header is set once"""
+        client = TestClient(build_app((SecurityHeadersMiddleware, {})))
+        response = client.get("/ping")
+        assert response.headers["x-frame-options"] == "DENY"
+        assert "frame-ancestors 'none'" in response.headers["content-security-policy"]
+        assert response.headers.get_list("x-content-type-options") == ["nosniff"]
+
+    def test_headers_on_rate_limited_response(self):
+        """Test that 429s produced further in still get the headers"""
+        client = TestClient(build_app(
+            (SecurityHeadersMiddleware, {}),
+            (RateLimitMiddleware, {"requests_per_minute": 1, "sweep_interval": 0})
+        ))
+        client.get("/ping")
+        response = client.get("/ping")
+        assert response.status_code == 429
+        assert response.headers["x-frame-options"] == "DENY"
+
+    def test_app_rejections_carry_headers(self, tmp_path, monkeypatch):
+        """Test that create_app() puts the headers on 403s and 429s from its own middleware"""
+        import src
+        blocklist = tmp_path / "block.txt"
+        blocklist.write_text("10.6.6.6\n")
+        monkeypatch.setattr(src, "IP_BLOCKLIST_PATH", str(blocklist))
+        monkeypatch.setattr(src, "IP_LIST_RELOAD_SECONDS", 0)
+        monkeypatch.setattr(src, "RATE_LIMIT_PER_MINUTE", 1)
+        monkeypatch.setattr(src, "RATE_LIMIT_BACKEND", "memory")
+        app = src.create_app()
+        with TestClient(app, client=("10.6.6.6", 1234)) as blocked:
+            responses = [blocked.get("/api/v1/login")]
+        with TestClient(app, client=("10.7.7.7", 1234)) as client:
+            responses += [client.get("/api/v1/login") for _ in range(2)]
+        assert [response.status_code for response in responses] == [403, 200, 429]
+        for response in responses:
+            assert response.headers["x-frame-options"] == "DENY"
+            assert "frame-ancestors 'none'" in response.headers["content-security-policy"]
+            assert response.headers.get_list("x-content-type-options") == ["nosniff"]
+
+
+class TestCSRF:
+    """Test CSRF validation"""
+
+    @pytest.fixture
+    def client(self):
+        return TestClient(build_app((CSRFMiddleware, {"secret": "test-secret"})), base_url="https://testserver")
+
+    def test_safe_request_sets_cookie(self, client):
+        """Test that a GET issues the CSRF cookie"""
+        response = client.get("/ping")
+        assert response.status_code == 200
+        assert "csrf_token" in response.cookies
+
+    def test_post_without_token_rejected(self, client):
+        """Test that unsafe requests need a token"""
+        response = client.post("/echo", data={"name": "x"})
+        assert response.status_code == 403
+
+    def test_form_token_accepted_and_body_replayed(self, client):
+        """Test that the endpoint still reads the form after validation"""
+        client.get("/ping")
+        token = client.cookies["csrf_token"]
+        response = client.post("/echo", data={"name": "alice", "csrf_token": token})
+        assert response.status_code == 200
+        assert response.json() == {"name": "alice"}
+
+    def test_header_token_accepted(self, client):
+        """Test that API clients can send the token as a header"""
+        client.get("/ping")
+        token = client.cookies["csrf_token"]
+        response = client.post("/echo", data={"name": "bob"}, headers={"X-CSRF-Token": token})
+        assert response.status_code == 200
+
+    def test_unsigned_token_rejected(self, client):
+        """Test that a planted cookie/field pair without a valid signature fails"""
+        client.cookies.set("csrf_token", "forged.0.sig")
+        response = client.post("/echo", data={"name": "x", "csrf_token": "forged.0.sig"})
+        assert response.status_code == 403
+        assert response.json()["detail"] == "CSRF token invalid"
+
+    def test_token_bound_to_session(self):
+        """Test that a token issued for one session does not verify for another"""
+        secret = b"test-secret"
+        token = make_csrf_token(secret, "session-a", now=1000)
+        assert verify_csrf_token(secret, "session-a", token, 3600, now=1001)
+        assert not verify_csrf_token(secret, "session-b", token, 3600, now=1001)
+        assert not verify_csrf_token(secret, "session-a", token, 3600, now=1000 + 3601)
+
+
+class TestClientIP:
+    """Test trusted-proxy client IP resolution"""
+
+    def build_client(self, trusted):
+        app = FastAPI()
+
+        @app.get("/ip")
+        def ip(request: Request):
+            return {"ip": get_client_ip(request)}
+
+        app.add_middleware(ClientIPMiddleware, trusted_proxies=trusted)
+        return TestClient(app, client=("10.0.0.1", 1234))
+
+    def test_forwarded_for_ignored_from_untrusted_peer(self):
+        """Test that a direct client cannot spoof its IP"""
+        client = self.build_client([])
+        response = client.get("/ip", headers={"X-Forwarded-For": "1.2.3.4"})
+        assert response.json() == {"ip": "10.0.0.1"}
+
+    def test_chain_walked_past_trusted_proxies(self):
+        """Test that the first untrusted hop from the right is the client"""
+        client = self.build_client(["10.0.0.0/8"])
+        response = client.get("/ip", headers={"X-Forwarded-For": "6.6.6.6, 1.2.3.4, 10.0.0.7"})
+        assert response.json() == {"ip": "1.2.3.4"}
+
+
+class TestIPFilter:
+    """Test allow/blocklist enforcement"""
+
+    @pytest.fixture
+    def lists(self, tmp_path):
+        blocklist = tmp_path / "block.txt"
+        allowlist = tmp_path / "allow.txt"
+        blocklist.write_text("10.0.0.0/8\n")
+        allowlist.write_text("10.0.0.1\n")
+        return {"blocklist_path": str(blocklist), "allowlist_path": str(allowlist), "reload_interval": 0}
+
+    def test_blocked_ip_rejected(self, lists):
+        """Test that blocklisted IPs never reach the app"""
+        app = build_app((IPFilterMiddleware, lists))
+        response = TestClient(app, client=("10.9.9.9", 1234)).get("/ping")
+        assert response.status_code == 403
+
+    def test_allowlisted_ip_skips_rate_limit(self, lists):
+        """Test that allowlisted IPs bypass both the blocklist and rate limiting"""
+        app = build_app(
+            (IPFilterMiddleware, lists),
+            (RateLimitMiddleware, {"requests_per_minute": 1, "sweep_interval": 0})
+        )
+        client = TestClient(app, client=("10.0.0.1", 1234))
+        assert [client.get("/ping").status_code for _ in range(3)] == [200, 200, 200]
+
+    def test_lifespan_closes_lists(self, tmp_path, monkeypatch):
+        """Test that the app lifespan stops the list watchers on shutdown"""
+        import src
+        blocklist = tmp_path / "block.txt"
+        blocklist.write_text("10.0.0.0/8\n")
+        monkeypatch.setattr(src, "IP_BLOCKLIST_PATH", str(blocklist))
+        monkeypatch.setattr(src, "IP_LIST_RELOAD_SECONDS", 60)
+        app = src.create_app()
+        with TestClient(app):
+            watcher = app.state.ip_filter.blocklist._watcher
+            assert watcher.is_alive()
+        assert not watcher.is_alive()
+        assert app.state.ip_filter.blocklist._watcher is None
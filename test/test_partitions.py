@@ -0,0 +1,102 @@
+"""
+Unit tests for monthly audit_logs partitions (SQLite month tables)
+"""
+import calendar
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from src.models import Base
+from src.partitions import (
+    ID_STRIDE, add_months, drop_partitions_before, insert_rows, maintain_partitions, month_of,
+    month_start, partition_clause, partition_tables, sqlite_months
+)
+
+
+def at(year: int, month: int, day: int = 1) -> int:
+    return calendar.timegm((year, month, day, 12, 0, 0))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'partitions.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def row(created_at: int, action: str = "login") -> dict:
+    return {"action": action, "status": "success", "created_at": created_at}
+
+
+class TestMonths:
+    """Test UTC month arithmetic"""
+
+    def test_month_math(self):
+        """Test month_of/add_months/month_start across year boundaries"""
+        assert month_of(at(2026, 12, 31)) == (2026, 12)
+        assert add_months((2026, 11), 3) == (2027, 2)
+        assert add_months((2026, 1), -1) == (2025, 12)
+        assert month_start((2027, 1)) == calendar.timegm((2027, 1, 1, 0, 0, 0))
+
+    def test_mysql_partition_clause(self):
+        """Test that pYYYYMM ends where the next month starts"""
+        assert partition_clause((2026, 10)) == (
+            f"PARTITION p202610 VALUES LESS THAN ({calendar.timegm((2026, 11, 1, 0, 0, 0))})"
+        )
+
+
+class TestMonthTables:
+    """Test routing writes and reads to month tables"""
+
+    def test_rows_routed_by_month(self, engine):
+        """Test that inserts create month tables on demand, each with its own id range"""
+        with engine.begin() as conn:
+            insert_rows(conn, [row(at(2026, 9, 30)), row(at(2026, 10, 1)), row(at(2026, 10, 2))])
+            insert_rows(conn, [row(at(2026, 10, 3))])
+        with engine.connect() as conn:
+            assert sqlite_months(conn) == [(2026, 9), (2026, 10)]
+            september, october = partition_tables(conn, newest_first=False)
+            assert conn.execute(select(func.count()).select_from(october)).scalar_one() == 3
+            ids = conn.execute(select(september.c.id)).scalars().all() + \
+                conn.execute(select(october.c.id).order_by(october.c.id)).scalars().all()
+        assert ids == [202609 * ID_STRIDE + 1] + [202610 * ID_STRIDE + n for n in (1, 2, 3)]
+
+    def test_time_range_selects_overlapping_months(self, engine):
+        """Test that a time range reads only the month tables it overlaps"""
+        with engine.begin() as conn:
+            insert_rows(conn, [row(at(2026, month)) for month in range(1, 7)])
+        with engine.connect() as conn:
+            tables = partition_tables(conn, since=at(2026, 3, 15), until=month_start((2026, 5)))
+        names = [table.name for table in tables]
+        assert names == ["audit_logs_202604", "audit_logs_202603"]
+
+    def test_month_tables_have_indexes(self, engine):
+        """Test that every month table carries the audit_logs indexes"""
+        with engine.begin() as conn:
+            insert_rows(conn, [row(at(2026, 10))])
+            indexes = conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'audit_logs_202610'"
+            ).scalars().all()
+        assert "ix_audit_logs_202610_action_created_at" in indexes
+        assert len([name for name in indexes if name.startswith("ix_")]) == 5
+
+
+class TestRetention:
+    """Test partition maintenance"""
+
+    def test_maintain_creates_ahead_and_drops_old(self, engine):
+        """Test that maintenance pre-creates months and drops whole months past retention"""
+        with engine.begin() as conn:
+            insert_rows(conn, [row(at(2025, month)) for month in range(1, 13)])
+            result = maintain_partitions(conn, retention_months=6, months_ahead=2, now=at(2026, 3, 10))
+        assert result["created"] == ["202603", "202604", "202605"]
+        assert result["dropped"] == [f"audit_logs_2025{month:02d}" for month in range(1, 9)]
+        with engine.connect() as conn:
+            assert sqlite_months(conn)[0] == (2025, 9)
+
+    def test_drop_keeps_cutoff_month(self, engine):
+        """Test that the cutoff month itself survives"""
+        with engine.begin() as conn:
+            insert_rows(conn, [row(at(2026, 1)), row(at(2026, 2))])
+            assert drop_partitions_before(conn, (2026, 2)) == ["audit_logs_202601"]
+            assert sqlite_months(conn) == [(2026, 2)]
@@ -0,0 +1,157 @@
+"""
+Query plan regression tests
+
+Drives every DB-backed flow in src/api.py against SQLite, records each SQL
+statement the handlers issue and runs EXPLAIN QUERY PLAN on it. A plan step
+that scans a whole table means an index the hot path relies on is missing.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src import create_app
+from src.audit import audit_sink
+from src.config import get_async_db
+from src.encryption import hashing_executor
+from src.models import Base, EmailVerifications, PasswordReset, User
+import src.utils as utils
+
+PASSWORD = "Zq9!vLx#2mWp"
+
+
+@pytest.fixture(scope="module")
+def captured(tmp_path_factory):
+    """Run the API flows once and return (engine, statements) for every query issued"""
+    path = tmp_path_factory.mktemp("plans") / "plans.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    statements = {}
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.setdefault(statement, parameters[0] if executemany else parameters)
+
+    async def override_get_async_db():
+        async with session_factory() as db:
+            yield db
+
+    app = create_app()
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    mp = pytest.MonkeyPatch()
+    mp.setattr(hashing_executor, "max_workers", 0)
+    mp.setattr(utils, "send_email", lambda *args, **kwargs: True)
+    audit_sink.configure(session_factory, synchronous=True)
+    try:
+        with TestClient(app) as client:
+            form = {"fullname": "Plan User", "username": "planuser", "email": "plan@example.org",
+                    "password": PASSWORD, "confirm_password": PASSWORD}
+            assert client.post("/api/v1/register", data=form, follow_redirects=False).status_code == 302
+            with sync_engine.begin() as conn:
+                conn.execute(update(User).values(role="admin"))
+            client.get("/api/v1/profile")
+
+            # Audit log query API: each filter alone, combined, and a follow-up page
+            for params in ({}, {"user_id": 1}, {"action": "registration"}, {"status": "success"},
+                           {"ip": "testclient"}, {"since": 0, "until": 2 ** 31},
+                           {"user_id": 1, "action": "registration", "since": 0}):
+                assert client.get("/api/v1/admin/audit-logs", params=params).status_code == 200
+            page = client.get("/api/v1/admin/audit-logs", params={"limit": 1}).json()
+            client.get("/api/v1/admin/audit-logs", params={"limit": 1, "cursor": page["next_cursor"] or "MDow"})
+            for params in ({"user_id": 1}, {"action": "registration", "format": "csv", "gzip": True}):
+                response = client.get("/api/v1/admin/audit-logs/export", params=params)
+                assert response.status_code == 200 and response.content
+            # Rollup dashboard: default range and filtered
+            for params in ({}, {"action": "registration", "status": "success", "since": 0, "top": 5}):
+                response = client.get("/api/v1/admin/audit-dashboard", params=params)
+                assert response.status_code == 200 and response.json()["series"]
+            client.get("/api/v1/logout", follow_redirects=False)
+
+            with sync_engine.connect() as conn:
+                verify_token = conn.execute(select(EmailVerifications.token)).scalar_one()
+            client.get(f"/api/v1/verify-email/{verify_token}")
+
+            client.post("/api/v1/login", data={"username": "planuser", "password": "wrong"})
+            client.post("/api/v1/login", data={"username": "nobody", "password": "wrong"})
+            client.post("/api/v1/password-reset", data={"email": "plan@example.org"})
+            with sync_engine.connect() as conn:
+                reset_token = conn.execute(select(PasswordReset.token)).scalar_one()
+            client.get(f"/api/v1/password-reset/{reset_token}")
+            client.post(f"/api/v1/password-reset/{reset_token}",
+                        data={"password": PASSWORD + "a", "confirm_password": PASSWORD + "a"})
+
+            response = client.post("/api/v1/login", data={"username": "planuser", "password": PASSWORD + "a"},
+                                   follow_redirects=False)
+            assert response.status_code == 303
+            client.get("/api/v1/profile")
+            # Cursor pages, unfiltered and on an equality filter, once there are rows to page through
+            for params in ({"limit": 1}, {"limit": 1, "action": "login"}):
+                page = client.get("/api/v1/admin/audit-logs", params=params).json()
+                assert page["next_cursor"]
+                response = client.get("/api/v1/admin/audit-logs", params={**params, "cursor": page["next_cursor"]})
+                assert response.status_code == 200
+            assert client.post("/api/v1/delete-account", follow_redirects=False).status_code == 303
+    finally:
+        mp.undo()
+        audit_sink.configure()
+
+    yield sync_engine, statements
+    sync_engine.dispose()
+
+
+def plan_for(engine, statement: str, parameters) -> list:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters or ())).all()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(step: str, statement: str) -> bool:
+    if "TEMP B-TREE FOR ORDER BY" in step and "FROM audit_logs" in statement:
+        # Sorting the matches defeats keyset pagination (rollup reads sort a few aggregated rows)
+        return True
+    if not step.startswith("SCAN "):
+        return False
+    # An unfiltered index walk in ORDER BY order that stops at LIMIT reads a single page
+    ordered_page = "INDEX" in step and "LIMIT" in statement and "WHERE" not in statement
+    return not ordered_page
+
+
+class TestQueryPlans:
+    """Every query issued by the API must be served by an index"""
+
+    def test_flows_exercised(self, captured):
+        """Test that the capture saw user lookups, audit queries on the month tables and rollup reads"""
+        _, statements = captured
+        assert any("FROM users" in statement for statement in statements)
+        assert any("FROM audit_logs_" in statement and "user_id = " in statement for statement in statements)
+        assert any("FROM audit_logs_" in statement and "ORDER BY" in statement for statement in statements)
+        assert any("FROM audit_ip_rollups" in statement for statement in statements)
+
+    def test_cursor_pages_use_a_range(self, captured):
+        """Test that a cursor page is an index range on created_at, bounded above, not a filtered scan"""
+        engine, statements = captured
+        pages = {statement: parameters for statement, parameters in statements.items()
+                 if "FROM audit_logs_" in statement and ".id < " in statement}
+        assert len(pages) >= 2
+        for statement, parameters in pages.items():
+            # The cursor bound and the computed until are both in the SQL (MySQL prunes partitions on them)
+            assert ".created_at <= " in statement and ".created_at < " in statement
+            steps = plan_for(engine, statement, parameters)
+            assert any(step.startswith("SEARCH ") and "created_at<" in step for step in steps), (statement, steps)
+
+    def test_no_full_table_scans(self, captured):
+        """Test that no captured SELECT/UPDATE/DELETE plans a full table scan or a sort"""
+        engine, statements = captured
+        scans = {}
+        for statement, parameters in statements.items():
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            if "sqlite_master" in statement:
+                # Catalog lookup for the audit month tables
+                continue
+            steps = [step for step in plan_for(engine, statement, parameters) if is_full_scan(step, statement)]
+            if steps:
+                scans[statement] = steps
+        assert not scans, f"Full scans: {scans}"
@@ -0,0 +1,259 @@
+"""
+Unit tests for rate limiting
+"""
+import multiprocessing
+import struct
+import time
+import pytest
+from src.ratelimit import (
+    RateLimitBackend, RateLimiter, RedisRateLimiter, SharedMemoryRateLimiter, SlidingWindow, create_rate_limiter, fcntl
+)
+
+
+class FakeClock:
+    """Manually advanced clock"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSlidingWindow:
+    """Test the ring-buffer window"""
+
+    def test_old_buckets_expire(self):
+        """Test that requests leave the window once it has passed"""
+        window = SlidingWindow(60, 12)
+        window.count(0)
+        window.add(0)
+        window.count(30)
+        window.add(30)
+        assert window.count(59) == 2
+        assert window.count(65) == 1
+        assert window.count(200) == 0
+
+
+class TestRateLimiter:
+    """Test the in-memory limiter"""
+
+    def test_minute_limit_blocks_ip(self):
+        """Test that exceeding the minute limit blocks the IP for 5 minutes"""
+        clock = FakeClock()
+        limiter = RateLimiter(requests_per_minute=3, requests_per_hour=100, clock=clock)
+        assert [limiter.hit("1.1.1.1")[0] for _ in range(3)] == [False] * 3
+
+        limited, message = limiter.hit("1.1.1.1")
+        assert limited and "5 minutes" in message
+
+        clock.now += 120
+        limited, message = limiter.hit("1.1.1.1")
+        assert limited and message.startswith("IP blocked")
+
+        clock.now += 200
+        assert limiter.hit("1.1.1.1") == (False, "")
+
+    def test_hour_limit(self):
+        """Test the hourly limit without blocking"""
+        clock = FakeClock()
+        limiter = RateLimiter(requests_per_minute=100, requests_per_hour=2, clock=clock)
+        limiter.hit("2.2.2.2")
+        limiter.hit("2.2.2.2")
+        assert limiter.hit("2.2.2.2") == (True, "Hourly rate limit exceeded. Try again later")
+        clock.now += 3700
+        assert limiter.hit("2.2.2.2") == (False, "")
+
+    def test_ips_are_independent(self):
+        """Test that one IP's traffic does not limit another"""
+        limiter = RateLimiter(requests_per_minute=1, requests_per_hour=10, clock=FakeClock())
+        limiter.hit("3.3.3.3")
+        assert limiter.hit("3.3.3.3")[0]
+        assert not limiter.hit("4.4.4.4")[0]
+
+
+class TestIPTable:
+    """Test the bounded IP table"""
+
+    def test_least_recent_ip_evicted(self):
+        """Test that the table never exceeds max_entries"""
+        limiter = RateLimiter(100, 100, max_entries=2, sweep_interval=0, clock=FakeClock())
+        limiter.hit("1.1.1.1")
+        limiter.hit("2.2.2.2")
+        limiter.hit("1.1.1.1")
+        limiter.hit("3.3.3.3")
+        assert len(limiter) == 2
+        assert limiter.stats()["evictions"] == 1
+        assert "2.2.2.2" not in limiter._states
+
+    def test_blocked_ip_survives_eviction(self):
+        """Test that a flood of new IPs evicts around a blocked IP instead of lifting its block"""
+        clock = FakeClock()
+        limiter = RateLimiter(1, 100, max_entries=3, sweep_interval=0, clock=clock)
+        limiter.hit("6.6.6.6")
+        assert limiter.hit("6.6.6.6")[0]
+        for i in range(10):
+            limiter.hit(f"10.0.0.{i}")
+        assert len(limiter) == 3
+        limited, message = limiter.hit("6.6.6.6")
+        assert limited and message.startswith("IP blocked")
+
+    def test_sweep_reaches_ips_passed_over_by_eviction(self):
+        """Test that a blocked IP skipped by eviction is still swept once idle"""
+        clock = FakeClock()
+        limiter = RateLimiter(1, 100, max_entries=3, sweep_interval=0, clock=clock)
+        limiter.hit("6.6.6.6")
+        assert limiter.hit("6.6.6.6")[0]
+        clock.now += 200
+        for i in range(3):
+            limiter.hit(f"10.0.0.{i}")
+        clock.now += 3450
+        assert limiter.sweep() == 1
+        assert len(limiter) == 2
+        assert not limiter.hit("6.6.6.6")[0]
+
+    def test_parked_ip_keeps_its_block(self):
+        """Test that sweeping leaves a parked IP blocked until its block expires"""
+        clock = FakeClock()
+        limiter = RateLimiter(1, 100, max_entries=2, sweep_interval=0, clock=clock)
+        limiter.hit("6.6.6.6")
+        assert limiter.hit("6.6.6.6")[0]
+        limiter.hit("10.0.0.1")
+        limiter.hit("10.0.0.2")
+        clock.now += 100
+        assert limiter.sweep() == 0
+        assert limiter.hit("6.6.6.6")[1].startswith("IP blocked")
+
+    def test_close_stops_sweeper(self):
+        """Test that close() stops and joins the sweeper thread"""
+        limiter = RateLimiter(100, 100, sweep_interval=60)
+        sweeper = limiter._sweeper
+        assert sweeper.is_alive()
+        limiter.close()
+        assert not sweeper.is_alive()
+
+    def test_sweep_drops_idle_ips(self):
+        """Test that IPs idle for the whole hour window are swept"""
+        clock = FakeClock()
+        limiter = RateLimiter(100, 100, sweep_interval=0, clock=clock)
+        limiter.hit("1.1.1.1")
+        clock.now += 1800
+        limiter.hit("2.2.2.2")
+        clock.now += 1900
+        assert limiter.sweep() == 1
+        assert len(limiter) == 1
+        assert limiter.stats()["swept"] == 1
+
+
+def _hit_shared(path: str, count: int, results):
+    """Worker process: hit the shared table `count` times"""
+    limiter = SharedMemoryRateLimiter(path, requests_per_minute=1000, requests_per_hour=50, max_entries=256)
+    results.put(sum(1 for _ in range(count) if not limiter.hit("9.9.9.9")[0]))
+    limiter.close()
+
+
+@pytest.mark.skipif(fcntl is None, reason="requires POSIX file locks")
+class TestSharedMemoryRateLimiter:
+    """Test the cross-process shared-memory limiter"""
+
+    def test_same_semantics_as_in_memory(self, tmp_path):
+        """Test the minute limit and block with the mmap backend"""
+        clock = FakeClock()
+        limiter = SharedMemoryRateLimiter(str(tmp_path / "rl"), 3, 100, max_entries=64, clock=clock)
+        assert [limiter.hit("1.1.1.1")[0] for _ in range(4)] == [False, False, False, True]
+        assert limiter.hit("1.1.1.1")[1].startswith("IP blocked")
+        assert not limiter.hit("2.2.2.2")[0]
+        clock.now += 301
+        assert not limiter.hit("1.1.1.1")[0]
+        limiter.close()
+
+    def test_blocked_ip_survives_eviction(self, tmp_path):
+        """Test that spraying keys into a full stripe evicts around a blocked IP"""
+        clock = FakeClock(time.time())
+        # One stripe of 4 slots: every key probes the whole table
+        limiter = SharedMemoryRateLimiter(str(tmp_path / "rl"), 1, 100, max_entries=4, stripes=1, clock=clock)
+        limiter.hit("6.6.6.6")
+        assert limiter.hit("6.6.6.6")[0]
+        for i in range(50):
+            clock.now += 1
+            limiter.hit(f"10.0.0.{i}")
+        assert limiter.stats()["evictions"] > 0
+        limited, message = limiter.hit("6.6.6.6")
+        assert limited and message.startswith("IP blocked")
+        limiter.close()
+
+    def test_blocks_use_wall_time(self, tmp_path):
+        """Test that stored block times are wall-clock, so they stay meaningful across reboots"""
+        path = tmp_path / "rl"
+        limiter = SharedMemoryRateLimiter(str(path), 1, 100, max_entries=64)
+        limiter.hit("1.1.1.1")
+        assert limiter.hit("1.1.1.1")[0]
+        limiter.close()
+        data = path.read_bytes()
+        slots = range(SharedMemoryRateLimiter.HEADER_SIZE, len(data), limiter.slot_size)
+        [blocked_until] = [blocked for key, blocked, _ in (struct.unpack_from("<Qdd", data, at) for at in slots) if key]
+        assert abs(blocked_until - (time.time() + 300)) < 5
+
+    def test_limit_shared_across_processes(self, tmp_path):
+        """Test that several processes together stay within one limit"""
+        path = str(tmp_path / "rl")
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [context.Process(target=_hit_shared, args=(path, 40, results)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=30)
+        assert sum(results.get(timeout=5) for _ in workers) == 50
+
+
+class TestRedisRateLimiter:
+    """Test the Redis-protocol limiter against fakeredis"""
+
+    @pytest.fixture
+    def redis_client(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        return fakeredis.FakeRedis()
+
+    def test_same_semantics_as_in_memory(self, redis_client):
+        """Test the minute limit, block and hour limit through the Lua script"""
+        clock = FakeClock(time.time())
+        limiter = RedisRateLimiter(redis_client, requests_per_minute=3, requests_per_hour=5, clock=clock)
+        assert [limiter.hit("1.1.1.1")[0] for _ in range(4)] == [False, False, False, True]
+        assert limiter.hit("1.1.1.1")[1].startswith("IP blocked")
+
+        clock.now += 301
+        assert limiter.hit("1.1.1.1") == (False, "")
+        assert limiter.hit("1.1.1.1") == (False, "")
+        assert limiter.hit("1.1.1.1") == (True, "Hourly rate limit exceeded. Try again later")
+
+    def test_one_round_trip_per_request(self, redis_client):
+        """Test that allowed requests cost one call and blocked ones none"""
+        limiter = RedisRateLimiter(redis_client, requests_per_minute=2, requests_per_hour=100,
+                                   clock=FakeClock(time.time()))
+        for _ in range(3):
+            limiter.hit("2.2.2.2")
+        assert limiter.round_trips == 3
+        for _ in range(10):
+            assert limiter.hit("2.2.2.2")[0]
+        assert limiter.round_trips == 3
+
+    def test_limit_shared_between_instances(self, redis_client):
+        """Test that two app instances share one limit"""
+        clock = FakeClock(time.time())
+        first = RedisRateLimiter(redis_client, 100, 4, clock=clock)
+        second = RedisRateLimiter(redis_client, 100, 4, clock=clock)
+        allowed = [not (first if i % 2 else second).hit("3.3.3.3")[0] for i in range(8)]
+        assert allowed.count(True) == 4
+
+    def test_backend_selection(self):
+        """Test the settings-driven factory"""
+        assert isinstance(create_rate_limiter("memory", 1, 1, sweep_interval=0), RateLimiter)
+        with pytest.raises(ValueError):
+            create_rate_limiter("nope", 1, 1)
+
+    def test_backend_must_implement_hit(self):
+        """Test that the backend interface cannot be used without hit()"""
+        with pytest.raises(TypeError):
+            RateLimitBackend()
@@ -0,0 +1,136 @@
+"""
+Unit tests for read-replica routing (primary and replica are two SQLite files)
+"""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from src import create_app
+from src.audit import audit_sink
+from src.config import get_async_db
+from src.models import Base, EmailVerifications, PasswordReset, User
+from src.replicas import ReplicaSet, RoutingSession, pin_primary
+
+
+def make_user(username: str) -> User:
+    return User(fullname=username, username=username, password="x",
+                email=f"{username}@example.com", transaction_token=f"tt-{username}")
+
+
+@pytest.fixture
+def engines(tmp_path):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        Base.metadata.create_all(engine)
+    # Rows only on the replica make it visible which engine served a read
+    with sessionmaker(bind=replica)() as session:
+        session.add(make_user("on_replica"))
+        session.commit()
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def find(session, username: str):
+    return session.execute(select(User).where(User.username == username)).scalar_one_or_none()
+
+
+class TestRoutingSession:
+    """Test read/write routing and read-your-writes pinning"""
+
+    def test_reads_go_to_replica_writes_to_primary(self, engines):
+        """Test that a plain SELECT is served by the replica and a commit lands on the primary"""
+        primary, replica = engines
+        session = RoutingSession(bind=primary, replicas=ReplicaSet([replica]))
+        assert find(session, "on_replica") is not None
+
+        session.add(make_user("written"))
+        session.commit()
+        with sessionmaker(bind=primary)() as check:
+            assert find(check, "written") is not None
+        session.close()
+
+    def test_reads_pinned_after_write(self, engines):
+        """Test that reads after a commit in the same session see the primary"""
+        primary, replica = engines
+        session = RoutingSession(bind=primary, replicas=ReplicaSet([replica]))
+        session.add(make_user("written"))
+        session.commit()
+        assert find(session, "written") is not None
+        assert find(session, "on_replica") is None
+        session.close()
+
+    def test_explicit_pin(self, engines):
+        """Test pin_primary for read-modify-write handlers"""
+        primary, replica = engines
+        session = RoutingSession(bind=primary, replicas=ReplicaSet([replica]))
+        pin_primary(session)
+        assert find(session, "on_replica") is None
+        session.close()
+
+
+class TestReplicaSet:
+    """Test round-robin and health checks"""
+
+    def test_round_robin(self, engines):
+        """Test that reads alternate between replicas"""
+        primary, replica = engines
+        replicas = ReplicaSet([primary, replica])
+        assert [replicas.choose() for _ in range(4)] == [primary, replica, primary, replica]
+
+    def test_unhealthy_replica_falls_back_to_primary(self, engines, tmp_path):
+        """Test that a replica failing its health check is skipped until it recovers"""
+        primary, _ = engines
+        broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+        replicas = ReplicaSet([broken])
+        replicas.check()
+        assert replicas.choose() is None
+        assert replicas.stats()["healthy"] == 0
+
+        session = RoutingSession(bind=primary, replicas=replicas)
+        assert find(session, "on_replica") is None
+        session.close()
+
+
+class TestReplicaLagHandlers:
+    """Test that handlers following a freshly emailed link read the primary"""
+
+    def test_token_links_survive_replica_lag(self, engines, tmp_path):
+        """Test that verify-email and the reset form find tokens the replica has not received yet"""
+        primary, _ = engines
+        with sessionmaker(bind=primary)() as session:
+            user = make_user("lagging")
+            session.add(user)
+            session.flush()
+            expires = int(time.time()) + 3600
+            session.add(EmailVerifications(user_id=user.id, token="verify-lag", token_exp=expires, is_used=False))
+            session.add(PasswordReset(user_id=user.id, token="reset-lag", token_exp=expires, is_used=False))
+            session.commit()
+
+        async_primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+        async_replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+        factory = async_sessionmaker(
+            bind=async_primary, sync_session_class=RoutingSession, replicas=ReplicaSet([async_replica]),
+            expire_on_commit=False
+        )
+
+        async def override_get_async_db():
+            async with factory() as session:
+                yield session
+
+        app = create_app()
+        app.dependency_overrides[get_async_db] = override_get_async_db
+        audit_sink.configure(async_sessionmaker(bind=async_primary), synchronous=True)
+        try:
+            with TestClient(app) as client:
+                assert client.get("/api/v1/password-reset/reset-lag").status_code == 200
+                assert client.get("/api/v1/verify-email/verify-lag").status_code == 200
+                assert client.get("/api/v1/verify-email/verify-lag").status_code == 400
+        finally:
+            audit_sink.configure()
+        with sessionmaker(bind=primary)() as session:
+            assert find(session, "lagging").verified
@@ -0,0 +1,160 @@
+"""
+Unit tests for the hourly audit rollups
+"""
+import asyncio
+import calendar
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src.audit import AuditSink
+from src.models import AuditIPRollup, AuditRollup, Base
+from src.partitions import insert_rows
+from src.rollups import HOUR, RollupAccumulator, SpaceSaving, rebuild_rollups, rollup_dashboard, write_rollups
+
+NOON = calendar.timegm((2026, 10, 1, 12, 0, 0))
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "rollups.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    yield sync_engine, f"sqlite+aiosqlite:///{path}"
+    sync_engine.dispose()
+
+
+def row(created_at: int, action: str = "login", status: str = "success", ip: str = "10.0.0.1") -> dict:
+    return {"action": action, "status": status, "ip_address": ip, "created_at": created_at}
+
+
+def sample_rows() -> list:
+    rows = []
+    for minute in range(120):
+        created_at = NOON + minute * 60
+        rows.append(row(created_at, ip="10.0.0.1"))
+        rows.append(row(created_at, status="failed", ip=f"10.1.0.{minute % 3}"))
+        if minute % 10 == 0:
+            rows.append(row(created_at, action="registration", ip="10.0.0.2"))
+    return rows
+
+
+def read_rollups(sync_engine):
+    with sync_engine.connect() as conn:
+        events = {(r.bucket, r.action, r.status): r.events for r in conn.execute(select(AuditRollup))}
+        ips = {(r.bucket, r.action, r.status, r.ip_address): r.events for r in conn.execute(select(AuditIPRollup))}
+    return events, ips
+
+
+class TestSpaceSaving:
+    """Test the heavy-hitters sketch"""
+
+    def test_heavy_hitter_survives_unique_flood(self):
+        """Test that an item above n / capacity is kept with an exact-or-over count"""
+        sketch = SpaceSaving(capacity=10)
+        for i in range(1000):
+            sketch.add(f"scanner-{i}")
+            if i % 4 == 0:
+                sketch.add("attacker")
+        assert len(sketch.counts) == 10
+        (top, count), = sketch.top(1)
+        assert top == "attacker"
+        assert count >= 250
+
+    def test_exact_below_capacity(self):
+        """Test that counts are exact while the sketch has room"""
+        sketch = SpaceSaving(capacity=5)
+        for ip, times in (("a", 3), ("b", 1), ("c", 2)):
+            for _ in range(times):
+                sketch.add(ip)
+        assert sketch.top(2) == [("a", 3), ("c", 2)]
+
+
+class TestRollupTables:
+    """Test flushing, rebuilding and reading rollups"""
+
+    def test_flushes_add_up(self, database):
+        """Test that successive flushes add onto existing rollup rows"""
+        sync_engine, _ = database
+        rows = sample_rows()
+        for part in (rows[:100], rows[100:]):
+            accumulator = RollupAccumulator(top_ips=5)
+            accumulator.add(part)
+            with sync_engine.begin() as conn:
+                write_rollups(conn, accumulator)
+        events, ips = read_rollups(sync_engine)
+        assert events == {
+            (NOON, "login", "success"): 60, (NOON, "login", "failed"): 60,
+            (NOON, "registration", "success"): 6,
+            (NOON + HOUR, "login", "success"): 60, (NOON + HOUR, "login", "failed"): 60,
+            (NOON + HOUR, "registration", "success"): 6,
+        }
+        assert ips[(NOON, "login", "failed", "10.1.0.0")] == 20
+
+    def test_rebuild_matches_incremental(self, database):
+        """Test that an exact rebuild from audit_logs equals the incremental rollups"""
+        sync_engine, _ = database
+        rows = sample_rows()
+        accumulator = RollupAccumulator(top_ips=5)
+        accumulator.add(rows)
+        with sync_engine.begin() as conn:
+            insert_rows(conn, rows)
+            write_rollups(conn, accumulator)
+        incremental = read_rollups(sync_engine)
+        with sync_engine.begin() as conn:
+            assert rebuild_rollups(conn, NOON, NOON + 2 * HOUR, top_ips=5) == len(rows)
+        assert read_rollups(sync_engine) == incremental
+
+    def test_sink_feeds_rollups(self, database):
+        """Test that rows written by the sink show up in the dashboard"""
+        _, url = database
+
+        async def scenario():
+            engine = create_async_engine(url)
+            factory = async_sessionmaker(bind=engine)
+            sink = AuditSink(session_factory=factory, flush_interval_ms=10, rollup_interval=60)
+            try:
+                await sink.start()
+                for ip in ("10.0.0.1", "10.0.0.1", "10.0.0.2"):
+                    await sink.record(action="login", status="failed", ip_address=ip)
+                await sink.record(action="logout", status="success", ip_address="10.0.0.2")
+                # Nothing is flushed before the interval; stop() flushes the rest
+                async with factory() as db:
+                    before = await rollup_dashboard(db)
+                await sink.stop()
+                async with factory() as db:
+                    return before, await rollup_dashboard(db, action="login", top=1)
+            finally:
+                await engine.dispose()
+
+        before, after = asyncio.run(scenario())
+        assert before["series"] == []
+        assert after["totals"] == [{"action": "login", "status": "failed", "events": 3}]
+        assert after["top_ips"] == [{"ip_address": "10.0.0.1", "events": 2}]
+
+    def test_dashboard_range_and_filters(self, database):
+        """Test the hourly series, totals and top IPs for a range"""
+        sync_engine, url = database
+        accumulator = RollupAccumulator()
+        accumulator.add(sample_rows())
+        with sync_engine.begin() as conn:
+            write_rollups(conn, accumulator)
+
+        async def scenario():
+            engine = create_async_engine(url)
+            try:
+                async with async_sessionmaker(bind=engine)() as db:
+                    return (
+                        await rollup_dashboard(db, since=NOON + 60, until=NOON + HOUR, status="failed", top=2),
+                        await rollup_dashboard(db, until=NOON + 2 * HOUR),
+                    )
+            finally:
+                await engine.dispose()
+
+        first_hour, day = asyncio.run(scenario())
+        assert first_hour["since"] == NOON
+        assert first_hour["series"] == [{"hour": NOON, "action": "login", "status": "failed", "events": 60}]
+        assert first_hour["top_ips"] == [{"ip_address": "10.1.0.0", "events": 20},
+                                         {"ip_address": "10.1.0.1", "events": 20}]
+        assert len(day["series"]) == 6
+        assert day["top_ips"][0] == {"ip_address": "10.0.0.1", "events": 120}